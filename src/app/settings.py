@@ -13,12 +13,16 @@ import cloudinary
 import cloudinary.uploader
 import cloudinary.api
 import os
+import sys
 from decouple import config
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# Running the test suite (manage.py test): no outside calls, no shared state
+TESTING = sys.argv[1:2] == ['test']
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/6.0/howto/deployment/checklist/
@@ -93,6 +97,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
+    'main.middleware.CartMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -212,11 +217,80 @@ LOGGING = {
 }
 
 
-CACHES = {
-    'default': {
+# Product search backend: 'index' (inverted index table), 'fts5' (SQLite FTS5)
+# or 'auto' (FTS5 when available, otherwise the inverted index)
+PRODUCT_SEARCH_BACKEND = config('PRODUCT_SEARCH_BACKEND', default='auto')
+
+
+# Orders for products without a seller are placed with this user (the
+# platform account). Unset, such products cannot be checked out.
+PLATFORM_SELLER_ID = config('PLATFORM_SELLER_ID', default=None, cast=lambda v: int(v) if v else None)
+
+
+# Flutterwave API client (main/flutterwave). Connect timeout is kept short so
+# a dead upstream fails fast; FLUTTERWAVE_FAKE answers calls in-process.
+FLUTTERWAVE_SECRET_KEY = config('FLUTTERWAVE_SECRET_KEY', default='')
+FLUTTERWAVE_PUBLIC_KEY = config('FLUTTERWAVE_PUBLIC_KEY', default='')
+FLUTTERWAVE_WEBHOOK_SECRET = config('FLUTTERWAVE_WEBHOOK_SECRET', default='')
+FLUTTERWAVE_BASE_URL = config('FLUTTERWAVE_BASE_URL', default='https://api.flutterwave.com')
+FLUTTERWAVE_CONNECT_TIMEOUT = config('FLUTTERWAVE_CONNECT_TIMEOUT', default=3.05, cast=float)
+FLUTTERWAVE_READ_TIMEOUT = config('FLUTTERWAVE_READ_TIMEOUT', default=10, cast=float)
+FLUTTERWAVE_MAX_RETRIES = config('FLUTTERWAVE_MAX_RETRIES', default=3, cast=int)
+FLUTTERWAVE_RETRY_BACKOFF = config('FLUTTERWAVE_RETRY_BACKOFF', default=0.25, cast=float)
+FLUTTERWAVE_POOL_SIZE = config('FLUTTERWAVE_POOL_SIZE', default=10, cast=int)
+FLUTTERWAVE_FAKE = config('FLUTTERWAVE_FAKE', default=False, cast=bool)
+
+
+# Exchange rates (main/utils/rates.py). Rates older than CURRENCY_RATE_MAX_AGE
+# seconds are still served while one background thread refreshes them
+# (never under test, where it would call the rates API).
+CURRENCY_RATE_MAX_AGE = config('CURRENCY_RATE_MAX_AGE', default=3600, cast=int)
+CURRENCY_BACKGROUND_REFRESH = not TESTING and config('CURRENCY_BACKGROUND_REFRESH', default=True, cast=bool)
+
+
+# Cache (main/cache_backends.py). 'default' is a small per-process L1 in front
+# of the 'shared' cache that every worker and management command sees:
+#   CACHE_BACKEND=sqlite  one SQLite file next to the database, no extra service (default)
+#   CACHE_BACKEND=redis   Redis at REDIS_URL (needs the redis package)
+#   CACHE_BACKEND=locmem  per-process only, as before
+# Tests always use locmem, so cache.clear() there never touches a live cache.
+CACHE_BACKEND = 'locmem' if TESTING else config('CACHE_BACKEND', default='sqlite')
+CACHE_L1_TIMEOUT = config('CACHE_L1_TIMEOUT', default=5, cast=int)
+
+if CACHE_BACKEND == 'redis':
+    SHARED_CACHE = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': config('REDIS_URL', default='redis://127.0.0.1:6379/1'),
+    }
+elif CACHE_BACKEND == 'sqlite':
+    SHARED_CACHE = {
+        'BACKEND': 'main.cache_backends.SQLiteCache',
+        'LOCATION': config('CACHE_LOCATION', default=str(BASE_DIR / 'cache.sqlite3')),
+        'OPTIONS': {'MAX_ENTRIES': 50000},
+    }
+else:
+    SHARED_CACHE = {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
     }
+
+CACHES = {
+    'default': {
+        'BACKEND': 'main.cache_backends.TieredCache',
+        'OPTIONS': {'L2': 'shared', 'L1_TIMEOUT': CACHE_L1_TIMEOUT},
+    },
+    'shared': SHARED_CACHE,
 }
 
+# Sessions are read through the cache and written to the database. They use
+# the 'shared' cache directly: a per-process L1 copy would let other workers
+# serve a logged-out or since-updated session until it expires.
+SESSION_ENGINE = config('SESSION_ENGINE', default='django.contrib.sessions.backends.cached_db')
+SESSION_CACHE_ALIAS = 'shared'
+
+# Cart storage (main/cart.py): 'db' keeps carts in the Cart/CartLine tables,
+# so they follow users across devices; 'cookie' keeps the cart in a signed
+# cookie set once per response by CartMiddleware; 'session' in the session
+CART_STORAGE = config('CART_STORAGE', default='db')
+
 
 
@@ -1,11 +1,19 @@
 
 # Or set up as cron job to run hourly/daily
+# Several copies may run at once; each claims different escrows.
 
+import time
+from django.core.mail import get_connection
 from django.core.management.base import BaseCommand
 from django.utils import timezone
-from django.db import transaction
-from escrow.models import EscrowTransaction, EscrowStatusHistory
-from main.views import transfer_to_seller
+from escrow.models import EscrowTransaction
+from escrow.release import due_escrows, release_due
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Above this many due escrows, print one line per chunk instead of per escrow
+SUMMARY_THRESHOLD = 50
 
 
 class Command(BaseCommand):
@@ -17,130 +25,127 @@ class Command(BaseCommand):
             action='store_true',
             help='Show what would be released without actually releasing funds',
         )
+        parser.add_argument(
+            '--send-email',
+            action='store_true',
+            help='Email sellers when their escrow funds are released',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=500,
+            help='Escrows released per transaction (default: 500)',
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            help='Release at most this many escrows in this run',
+        )
+        parser.add_argument(
+            '--summary',
+            action='store_true',
+            help=f'Only print per-chunk totals (automatic above {SUMMARY_THRESHOLD} escrows)',
+        )
 
     def handle(self, *args, **options):
         now = timezone.now()
         dry_run = options['dry_run']
-        
-        # Find escrows ready for auto-release
-        escrows_to_release = EscrowTransaction.objects.filter(
-            status='delivered',
-            auto_release_at__lte=now
-        ).select_related('buyer', 'seller', 'order')
-        
-        total_count = escrows_to_release.count()
-        
+
+        total_count = due_escrows(now).count()
+
         if total_count == 0:
             self.stdout.write(
                 self.style.SUCCESS('✓ No escrow funds ready for auto-release')
             )
             return
-        
+
         self.stdout.write(
             self.style.WARNING(f'\nFound {total_count} escrow(s) ready for auto-release')
         )
-        
+
+        summary = options['summary'] or total_count > SUMMARY_THRESHOLD
+
         if dry_run:
             self.stdout.write(
                 self.style.WARNING('\n--- DRY RUN MODE (No changes will be made) ---\n')
             )
-        
-        released_count = 0
-        failed_count = 0
-        
-        for escrow in escrows_to_release:
-            days_since_delivery = (now - escrow.delivered_at).days if escrow.delivered_at else 0
-            
+            escrows = due_escrows(now).select_related('seller', 'order').order_by('auto_release_at', 'pk')
+            if options['limit']:
+                escrows = escrows[:options['limit']]
+            if not summary:
+                for escrow in escrows:
+                    self.stdout.write(
+                        f'  • [DRY RUN] {escrow.transaction_id}: Order #{escrow.order_id}, '
+                        f'₦{escrow.amount:,.2f} to {escrow.seller.username} '
+                        f'(due {escrow.auto_release_at.strftime("%Y-%m-%d %H:%M")})'
+                    )
             self.stdout.write(
-                f'\n{"[DRY RUN] " if dry_run else ""}Processing Escrow {escrow.transaction_id}:'
+                self.style.SUCCESS(f'  ✓ Would release {min(total_count, options["limit"] or total_count)} escrow(s)')
             )
-            self.stdout.write(f'  • Order: #{escrow.order.id}')
-            self.stdout.write(f'  • Buyer: {escrow.buyer.username}')
-            self.stdout.write(f'  • Seller: {escrow.seller.username}')
-            self.stdout.write(f'  • Amount: ₦{escrow.amount:,.2f}')
-            self.stdout.write(f'  • Delivered: {escrow.delivered_at.strftime("%Y-%m-%d %H:%M")}')
-            self.stdout.write(f'  • Days since delivery: {days_since_delivery}')
-            self.stdout.write(f'  • Auto-release date: {escrow.auto_release_at.strftime("%Y-%m-%d %H:%M")}')
-            
-            if dry_run:
-                self.stdout.write(
-                    self.style.SUCCESS('  ✓ Would release funds to seller')
-                )
-                released_count += 1
-                continue
-            
-            try:
-                with transaction.atomic():
-                    # Transfer funds to seller
-                    transfer_result = transfer_to_seller(escrow.seller, escrow.amount)
-                    
-                    if transfer_result.get('success'):
-                        # Update escrow status
-                        escrow.status = 'completed'
-                        escrow.completed_at = now
-                        escrow.save()
-                        
-                        # Log status change
-                        EscrowStatusHistory.objects.create(
-                            escrow=escrow,
-                            old_status='delivered',
-                            new_status='completed',
-                            changed_by=None,  # System action
-                            reason=f'Automatic release after {escrow.auto_release_days} days'
-                        )
-                        
+            return
+
+        started = time.perf_counter()
+        released_count = 0
+        released_amount = 0
+        emails_sent = 0
+
+        try:
+            for chunk in release_due(now, chunk_size=options['chunk_size'], limit=options['limit']):
+                released_count += len(chunk)
+                chunk_amount = sum(row['amount'] for row in chunk)
+                released_amount += chunk_amount
+
+                if summary:
+                    self.stdout.write(
+                        f'  • Released {len(chunk)} escrow(s), ₦{chunk_amount:,.2f} '
+                        f'({released_count}/{total_count})'
+                    )
+                else:
+                    for row in chunk:
                         self.stdout.write(
                             self.style.SUCCESS(
-                                f'  ✓ Successfully released ₦{escrow.amount:,.2f} to {escrow.seller.username}'
+                                f"  ✓ {row['transaction_id']}: Order #{row['order_id']}, "
+                                f"₦{row['amount']:,.2f} released, payout queued"
                             )
                         )
-                        self.stdout.write(f'  • Method: {transfer_result.get("method")}')
-                        
-                        released_count += 1
-                        
-                        # TODO: Send email notifications
-                        # send_mail(
-                        #     'Escrow Funds Released',
-                        #     f'Your escrow funds of ₦{escrow.amount:,.2f} have been released.',
-                        #     'noreply@techfy.ng',
-                        #     [escrow.seller.email],
-                        # )
-                        
-                    else:
-                        raise Exception(transfer_result.get('message', 'Transfer failed'))
-                
-            except Exception as e:
-                failed_count += 1
-                self.stdout.write(
-                    self.style.ERROR(f'  ✗ Failed to release funds: {str(e)}')
-                )
-                
-                # Log the error (you might want to send admin notification)
-                import logging
-                logger = logging.getLogger(__name__)
-                logger.error(
-                    f'Auto-release failed for escrow {escrow.transaction_id}: {str(e)}'
-                )
-        
+
+                if options['send_email']:
+                    emails_sent += self.send_emails([row['pk'] for row in chunk])
+        except Exception as e:
+            # Chunks already committed stay released; the failed chunk rolled back
+            self.stdout.write(
+                self.style.ERROR(f'  ✗ Failed to release funds: {str(e)}')
+            )
+            logger.error(f'Auto-release failed after {released_count} escrow(s): {str(e)}')
+
         # Summary
         self.stdout.write('\n' + '='*60)
         self.stdout.write(self.style.SUCCESS(f'\nAuto-Release Summary:'))
         self.stdout.write(f'  Total found: {total_count}')
         self.stdout.write(
-            self.style.SUCCESS(f'  Successfully released: {released_count}')
+            self.style.SUCCESS(f'  Successfully released: {released_count} (₦{released_amount:,.2f})')
         )
-        
-        if failed_count > 0:
-            self.stdout.write(
-                self.style.ERROR(f'  Failed: {failed_count}')
-            )
-        
-        if dry_run:
-            self.stdout.write(
-                self.style.WARNING(f'\n  Note: This was a dry run. No actual changes were made.')
-            )
+
+        if options['send_email']:
+            self.stdout.write(f'  Emails sent: {emails_sent}')
+
+        remaining = total_count - released_count
+        if remaining > 0:
             self.stdout.write(
-                self.style.WARNING(f'  Run without --dry-run to actually release funds.')
+                self.style.WARNING(f'  Not released this run: {remaining} (limit, another worker, or error)')
             )
-        
-        self.stdout.write('='*60 + '\n')
\ No newline at end of file
+
+        self.stdout.write(f'  Time: {time.perf_counter() - started:.2f}s')
+        self.stdout.write('  Payouts are sent by: python manage.py process_payouts')
+        self.stdout.write('='*60 + '\n')
+
+    def send_emails(self, escrow_ids):
+        """Send funds-released emails for one chunk over a single mail connection"""
+        from main.email_utils import send_escrow_funds_released_email
+
+        sent = 0
+        with get_connection() as connection:
+            for escrow in EscrowTransaction.objects.filter(pk__in=escrow_ids).select_related('seller'):
+                if escrow.seller.email and send_escrow_funds_released_email(escrow, connection=connection):
+                    sent += 1
+        return sent
@@ -0,0 +1,20 @@
+# Generated by Django 5.0 on 2026-10-16 20:54
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('escrow', '0001_initial'),
+        ('main', '0009_wallet_ledger'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='escrowtransaction',
+            index=models.Index(fields=['status', 'auto_release_at'], name='escrow_escr_status_13a1fa_idx'),
+        ),
+    ]
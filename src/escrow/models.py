@@ -50,6 +50,10 @@ class EscrowTransaction(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # auto_release_escrow: status='delivered' AND auto_release_at <= now
+            models.Index(fields=['status', 'auto_release_at']),
+        ]
     
     def __str__(self):
         return f"{self.transaction_id} - {self.get_status_display()}"
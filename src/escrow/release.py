@@ -0,0 +1,93 @@
+# escrow/release.py
+"""
+Escrow auto-release engine
+Due escrows are claimed in chunks with SELECT ... FOR UPDATE SKIP LOCKED,
+so several auto_release_escrow workers can run side by side. Each chunk
+is released with one UPDATE, one EscrowStatusHistory INSERT and one
+Payout INSERT.
+"""
+
+from django.db import transaction
+from django.utils import timezone
+from main.models import Payout
+from main.payouts import enqueue_payouts
+from .models import EscrowTransaction, EscrowStatusHistory
+
+RELEASE_FIELDS = ['pk', 'transaction_id', 'order_id', 'seller_id', 'amount', 'auto_release_days']
+
+
+def due_escrows(now=None):
+    """Escrows whose auto-release date has passed (served by the (status, auto_release_at) index)"""
+    return EscrowTransaction.objects.filter(
+        status='delivered',
+        auto_release_at__lte=now or timezone.now()
+    )
+
+
+def release_chunk(now=None, chunk_size=500):
+    """
+    Claim and release one chunk of due escrows
+
+    Returns:
+        list: Dicts with RELEASE_FIELDS for each escrow released (empty when none are due)
+    """
+    now = now or timezone.now()
+
+    with transaction.atomic():
+        rows = list(
+            due_escrows(now)
+            .select_for_update(skip_locked=True)
+            .order_by('auto_release_at', 'pk')
+            .values(*RELEASE_FIELDS)[:chunk_size]
+        )
+        if not rows:
+            return []
+
+        EscrowTransaction.objects.filter(pk__in=[row['pk'] for row in rows]).update(
+            status='completed', completed_at=now, updated_at=now
+        )
+
+        EscrowStatusHistory.objects.bulk_create([
+            EscrowStatusHistory(
+                escrow_id=row['pk'],
+                old_status='delivered',
+                new_status='completed',
+                changed_by=None,  # System action
+                reason=f"Automatic release after {row['auto_release_days']} days",
+            )
+            for row in rows
+        ])
+
+        enqueue_payouts([
+            Payout(
+                seller_id=row['seller_id'],
+                amount=row['amount'],
+                reference=f"PAYOUT-ESCROW-{row['pk']}",
+                description=f"Escrow release for Order #{row['order_id']}",
+            )
+            for row in rows
+        ])
+
+    return rows
+
+
+def release_due(now=None, chunk_size=500, limit=None):
+    """
+    Release due escrows chunk by chunk, one transaction per chunk
+
+    Args:
+        limit: Stop after about this many escrows (default: all due)
+
+    Yields:
+        list: The escrows released in each chunk
+    """
+    now = now or timezone.now()
+    released = 0
+
+    while limit is None or released < limit:
+        size = chunk_size if limit is None else min(chunk_size, limit - released)
+        rows = release_chunk(now, size)
+        if not rows:
+            return
+        released += len(rows)
+        yield rows
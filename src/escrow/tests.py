@@ -1,3 +1,95 @@
-from django.test import TestCase
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from django.contrib.auth.models import User
+from django.db import connection, OperationalError
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+from main.models import Order, Payout
+from .models import EscrowTransaction, EscrowStatusHistory
+from .release import release_chunk, release_due
 
-# Create your tests here.
+
+def make_escrows(count, status='delivered', days_ago=8):
+    """Create count escrows between one buyer and seller, due days_ago - 7 days ago"""
+    buyer, _ = User.objects.get_or_create(username='buyer')
+    seller, _ = User.objects.get_or_create(username='seller')
+    delivered_at = timezone.now() - timedelta(days=days_ago)
+    escrows = []
+    for _ in range(count):
+        order = Order.objects.create(
+            buyer=buyer, seller=seller, total_amount=Decimal('100.00'), shipping_address='Lagos'
+        )
+        escrows.append(EscrowTransaction.objects.create(
+            transaction_id=f'ESC-{order.pk}',
+            order=order,
+            buyer=buyer,
+            seller=seller,
+            amount=Decimal('100.00'),
+            escrow_fee=Decimal('2.50'),
+            total_amount=Decimal('102.50'),
+            status=status,
+            delivered_at=delivered_at,
+            auto_release_at=delivered_at + timedelta(days=7),
+        ))
+    return escrows
+
+
+class ReleaseDueTests(TestCase):
+    def test_only_due_escrows_released(self):
+        due = make_escrows(3)
+        make_escrows(1, days_ago=2)
+        make_escrows(1, status='disputed')
+
+        released = [row['pk'] for rows in release_due(chunk_size=2) for row in rows]
+
+        self.assertEqual(sorted(released), sorted(escrow.pk for escrow in due))
+        self.assertEqual(
+            set(Payout.objects.values_list('reference', flat=True)),
+            {f'PAYOUT-ESCROW-{escrow.pk}' for escrow in due}
+        )
+        self.assertEqual(EscrowStatusHistory.objects.filter(new_status='completed').count(), 3)
+
+
+class ReleaseChunkConcurrencyTests(TransactionTestCase):
+    """Workers claiming chunks side by side release every escrow once"""
+
+    WORKERS = 4
+
+    def test_parallel_workers_release_each_escrow_once(self):
+        escrows = make_escrows(40)
+        start = threading.Barrier(self.WORKERS)
+        released = []
+        errors = []
+
+        def worker():
+            try:
+                start.wait()
+                for _ in range(500):
+                    try:
+                        rows = release_chunk(chunk_size=5)
+                    except OperationalError:
+                        # SQLite allows one writer at a time: back off and retry
+                        time.sleep(0.005)
+                        continue
+                    if not rows:
+                        return
+                    released.extend(row['pk'] for row in rows)
+                errors.append('worker never finished')
+            except Exception as e:
+                errors.append(repr(e))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(self.WORKERS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(sorted(released), sorted(escrow.pk for escrow in escrows))
+        self.assertEqual(EscrowStatusHistory.objects.count(), 40)
+        self.assertEqual(Payout.objects.count(), 40)
+        self.assertFalse(EscrowTransaction.objects.exclude(status='completed').exists())
@@ -8,7 +8,8 @@ from django.conf import settings
 from decimal import Decimal
 import uuid
 from main.models import Order, Wallet
-from main.views import verify_flutterwave_payment, transfer_to_seller, initialize_flutterwave_payment
+from main.views import verify_flutterwave_payment, initialize_flutterwave_payment
+from main.payouts import enqueue_payout
 from .models import EscrowTransaction, EscrowDispute, EscrowStatusHistory
 
 
@@ -229,27 +230,28 @@ def release_funds(request, escrow_id):
         return redirect('escrow:detail', escrow_id=escrow.id)
     
     with transaction.atomic():
-        # Transfer funds to seller's wallet/account
-        transfer_result = transfer_to_seller(escrow.seller, escrow.amount)
+        # Queue the transfer to the seller's wallet/account
+        enqueue_payout(
+            escrow.seller, escrow.amount,
+            reference=f'PAYOUT-ESCROW-{escrow.id}',
+            description=f'Escrow release for Order #{escrow.order_id}'
+        )
         
-        if transfer_result.get('success'):
-            escrow.status = 'completed'
-            escrow.completed_at = timezone.now()
-            escrow.save()
-            
-            # Log status change
-            release_reason = 'Automatic release' if is_auto_release else 'Manual release by buyer'
-            EscrowStatusHistory.objects.create(
-                escrow=escrow,
-                old_status='delivered',
-                new_status='completed',
-                changed_by=request.user if not is_auto_release else None,
-                reason=release_reason
-            )
-            
-            messages.success(request, "Funds have been released to the seller!")
-        else:
-            messages.error(request, f"Failed to release funds: {transfer_result.get('message')}")
+        escrow.status = 'completed'
+        escrow.completed_at = timezone.now()
+        escrow.save()
+        
+        # Log status change
+        release_reason = 'Automatic release' if is_auto_release else 'Manual release by buyer'
+        EscrowStatusHistory.objects.create(
+            escrow=escrow,
+            old_status='delivered',
+            new_status='completed',
+            changed_by=request.user if not is_auto_release else None,
+            reason=release_reason
+        )
+    
+    messages.success(request, "Funds have been released to the seller!")
     
     return redirect('escrow:detail', escrow_id=escrow.id)
 
@@ -3,7 +3,7 @@ from django.contrib import admin
 from django.utils.html import format_html
 from django.urls import reverse
 from django.utils.safestring import mark_safe
-from .models import Product, Order, OrderItem, Wallet, Payment, Refund
+from .models import Product, Order, OrderItem, Wallet, Payment, Refund, Payout, WebhookEvent, Cart, CartLine
 
 
 @admin.register(Product)
@@ -379,4 +379,59 @@ class RefundAdmin(admin.ModelAdmin):
 # Customize admin site header
 admin.site.site_header = "Techfy-NG Admin"
 admin.site.site_title = "Techfy-NG Admin Portal"
-admin.site.index_title = "Welcome to Techfy-NG Administration"
\ No newline at end of file
+admin.site.index_title = "Welcome to Techfy-NG Administration"
+
+@admin.register(Payout)
+class PayoutAdmin(admin.ModelAdmin):
+    list_display = ['reference', 'seller', 'amount', 'currency', 'status', 'method', 'attempts', 'created_at']
+    list_filter = ['status', 'method', 'created_at']
+    search_fields = ['reference', 'seller__username', 'transfer_id']
+    readonly_fields = [
+        'seller', 'amount', 'currency', 'reference', 'method', 'attempts',
+        'claimed_at', 'transfer_id', 'last_error', 'created_at', 'updated_at', 'completed_at'
+    ]
+
+    actions = ['retry_payouts']
+
+    def retry_payouts(self, request, queryset):
+        from django.utils import timezone
+        updated = queryset.filter(status='failed').update(
+            status='pending', attempts=0, next_attempt_at=timezone.now()
+        )
+        self.message_user(request, f'{updated} payout(s) queued for retry.')
+    retry_payouts.short_description = 'Retry selected failed payouts'
+
+
+@admin.register(WebhookEvent)
+class WebhookEventAdmin(admin.ModelAdmin):
+    list_display = ['id', 'event_type', 'transaction_id', 'status', 'attempts', 'received_at', 'processed_at']
+    list_filter = ['status', 'event_type', 'received_at']
+    search_fields = ['transaction_id']
+    readonly_fields = [
+        'event_type', 'transaction_id', 'payload', 'attempts', 'claimed_at',
+        'last_error', 'received_at', 'processed_at'
+    ]
+
+    actions = ['replay_selected']
+
+    def replay_selected(self, request, queryset):
+        from .webhooks import replay_events
+        replayed = replay_events(queryset)
+        self.message_user(request, f'{replayed} event(s) queued for replay.')
+    replay_selected.short_description = 'Replay selected events'
+
+
+class CartLineInline(admin.TabularInline):
+    model = CartLine
+    extra = 0
+    readonly_fields = ['product', 'quantity', 'updated_at']
+    can_delete = False
+
+
+@admin.register(Cart)
+class CartAdmin(admin.ModelAdmin):
+    list_display = ['id', 'user', 'item_count', 'created_at', 'updated_at']
+    list_filter = ['updated_at']
+    search_fields = ['user__username']
+    readonly_fields = ['user', 'token', 'item_count', 'created_at', 'updated_at']
+    inlines = [CartLineInline]
@@ -0,0 +1,426 @@
+# main/api.py
+"""
+JSON API for the React frontend (see OPTION_B_DOC.md)
+
+/api/cart/
+    GET   The whole cart. Sends an ETag; a matching If-None-Match is
+          answered 304 from cached versions, before any cart or product query.
+    POST  {"version": "...", "lines": [{"product_id": 3, "quantity": 2},
+                                       {"product_id": 7, "add": 1}]}
+          Applies every line change in one cart write and returns only the
+          changed lines plus the new totals. "quantity" sets a line (0
+          removes it), "add" changes it by that much. If "version" is given
+          and the cart has changed since, nothing is applied and the whole
+          cart comes back with status 409.
+
+POST needs the CSRF token in an X-CSRFToken header, as for the AJAX views.
+
+/api/products/ and /api/products/<id>/
+    Read-only catalogue built from .values() rows (no model instances).
+    ?fields=id,name,price_display picks the fields (see PRODUCT_FIELDS).
+    The list takes ?category=, ?featured=true, ?sort= (as product_list),
+    ?limit= and ?cursor= (next_cursor of the previous page). Prices are
+    converted to the user's currency in one batch per page. The ETag
+    follows the catalogue version, plus the stock version when the
+    response depends on stock levels, and bodies are compressed with
+    brotli (if the brotli package is installed) or gzip.
+"""
+
+import json
+import re
+from decimal import Decimal
+from django.conf import settings
+from django.http import JsonResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.text import compress_string
+from django.views.decorators.http import require_GET, require_http_methods
+from .cart import get_cart, save_cart, cart_version, CartFull
+from .catalogue import get_catalogue_version, get_stock_version
+from .models import Product
+from .utils.currency import get_price_converter
+from .utils.pagination import keyset_page
+from .views import PRODUCT_SORTS, PRODUCTS_PER_PAGE
+
+try:
+    import brotli
+except ImportError:
+    # Optional: without it responses are only gzipped
+    brotli = None
+
+# Most line changes accepted in one POST
+MAX_CART_MUTATIONS = 100
+
+# API field: columns it is built from
+PRODUCT_FIELDS = {
+    'id': ('id',),
+    'name': ('name',),
+    'description': ('description',),
+    'price': ('price',),
+    'price_display': ('price',),
+    'discount_percentage': ('discount_percentage',),
+    'sale_price': ('price', 'discount_percentage'),
+    'sale_price_display': ('price', 'discount_percentage'),
+    'stock': ('stock',),
+    'image': ('cloudinary_url', 'image'),
+    'category': ('category_id',),
+    'category_name': ('category__name',),
+    'is_featured': ('is_featured',),
+    'created_at': ('created_at',),
+}
+
+LIST_FIELDS = (
+    'id', 'name', 'price', 'price_display', 'sale_price_display',
+    'discount_percentage', 'image', 'stock', 'category',
+)
+
+MAX_PRODUCTS_PER_PAGE = 100
+
+# Smaller bodies are sent as they are
+MIN_COMPRESS_LENGTH = 200
+
+
+def _currency_tag(request):
+    """
+    Currency part of an ETag
+
+    Converted prices change with the exchange rate, so the rate this
+    request converts at is part of the tag unless prices are shown as stored.
+    """
+    converter = get_price_converter(request)
+    if converter.is_identity:
+        return converter.currency
+    return f'{converter.currency}@{converter.rate.normalize()}'
+
+
+def _cart_etag(request):
+    # Prices, names and stock come from the catalogue and are shown in the
+    # user's currency at the current rate, so all of them are part of the tag
+    return (
+        f'"{cart_version(request)}-{get_catalogue_version()}.{get_stock_version()}'
+        f'-{_currency_tag(request)}"'
+    )
+
+
+def _cart_products(cart):
+    """Fields the API shows for every product in the cart, in one query"""
+    ids = [int(product_id) for product_id in cart if str(product_id).isdigit()]
+    return {
+        str(row['id']): row
+        for row in Product.objects.filter(pk__in=ids).values('id', 'name', 'price', 'stock', 'cloudinary_url')
+    }
+
+
+def _line(product, quantity):
+    subtotal = product['price'] * quantity
+    return {
+        'product_id': product['id'],
+        'name': product['name'],
+        'image': product['cloudinary_url'],
+        'stock': product['stock'],
+        'quantity': quantity,
+        'price': str(product['price']),
+        'subtotal': str(subtotal),
+    }
+
+
+def _cart_payload(request, cart, products, product_ids):
+    """
+    Lines for product_ids plus the cart's totals
+
+    Amounts are strings in NGN; *_display fields are formatted in the
+    user's currency, converted in one batch.
+    """
+    lines = [_line(products[product_id], cart[product_id]) for product_id in product_ids]
+
+    count = 0
+    total = Decimal('0.00')
+    for product_id, quantity in cart.items():
+        if product_id in products:
+            count += quantity
+            total += products[product_id]['price'] * quantity
+
+    converter = get_price_converter(request)
+    amounts = [Decimal(line['price']) for line in lines] + [Decimal(line['subtotal']) for line in lines] + [total]
+    formatted = converter.format_many(amounts)
+    for i, line in enumerate(lines):
+        line['price_display'] = formatted[i]
+        line['subtotal_display'] = formatted[len(lines) + i]
+
+    return {
+        'version': cart_version(request),
+        'currency': converter.currency,
+        'lines': lines,
+        'count': count,
+        'total': str(total),
+        'total_display': formatted[-1],
+    }
+
+
+def _with_etag(request, response):
+    response['ETag'] = _cart_etag(request)
+    return response
+
+
+def _full_cart(request, status=200):
+    cart = get_cart(request)
+    products = _cart_products(cart)
+    payload = _cart_payload(request, cart, products, [product_id for product_id in cart if product_id in products])
+    return _with_etag(request, JsonResponse(payload, status=status))
+
+
+@require_http_methods(['GET', 'POST'])
+def cart_api(request):
+    """Read the cart (GET) or apply a batch of line changes (POST)"""
+    if request.method == 'POST':
+        return _update_cart(request)
+
+    not_modified = get_conditional_response(request, etag=_cart_etag(request))
+    if not_modified is not None:
+        return not_modified
+    return _full_cart(request)
+
+
+def _parse_mutations(request):
+    """
+    Read the POST body
+
+    Returns:
+        tuple: (expected version or None, [(product_id (str), field, value)])
+
+    Raises:
+        ValueError: Malformed body
+    """
+    try:
+        body = json.loads(request.body or b'{}')
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError('Body must be JSON')
+    if not isinstance(body, dict) or not isinstance(body.get('lines', []), list):
+        raise ValueError('Expected {"lines": [...]}')
+
+    lines = body.get('lines', [])
+    if len(lines) > MAX_CART_MUTATIONS:
+        raise ValueError(f'At most {MAX_CART_MUTATIONS} line changes per request')
+
+    mutations = []
+    for line in lines:
+        if not isinstance(line, dict) or type(line.get('product_id')) is not int:
+            raise ValueError('Every line needs an integer product_id')
+        fields = [field for field in ('quantity', 'add') if field in line]
+        if len(fields) != 1 or type(line[fields[0]]) is not int:
+            raise ValueError('Every line needs exactly one integer "quantity" or "add"')
+        mutations.append((str(line['product_id']), fields[0], line[fields[0]]))
+    return body.get('version'), mutations
+
+
+def _update_cart(request):
+    try:
+        expected_version, mutations = _parse_mutations(request)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    if expected_version is not None and expected_version != cart_version(request):
+        return _full_cart(request, status=409)
+
+    cart = get_cart(request)
+    before = dict(cart)
+    products = _cart_products({**cart, **{product_id: 0 for product_id, _, _ in mutations}})
+    errors = []
+
+    for product_id, field, value in mutations:
+        product = products.get(product_id)
+        quantity = value if field == 'quantity' else cart.get(product_id, 0) + value
+        if quantity <= 0:
+            cart.pop(product_id, None)
+        elif product is None:
+            errors.append({'product_id': int(product_id), 'error': 'Product not found'})
+        elif quantity > product['stock']:
+            errors.append({'product_id': int(product_id), 'error': f"Only {product['stock']} units available"})
+        else:
+            cart[product_id] = quantity
+
+    try:
+        save_cart(request, cart)
+    except CartFull as e:
+        # Keep the lines already in the cart; drop the new ones
+        for product_id in [product_id for product_id in cart if product_id not in before]:
+            del cart[product_id]
+            errors.append({'product_id': int(product_id), 'error': str(e)})
+        save_cart(request, cart)
+
+    changed = [product_id for product_id in cart if before.get(product_id) != cart[product_id]]
+    payload = _cart_payload(request, cart, products, changed)
+    payload['removed'] = [int(product_id) for product_id in before if product_id not in cart]
+    payload['errors'] = errors
+    return _with_etag(request, JsonResponse(payload))
+
+
+# ========================================
+# PRODUCT CATALOGUE
+# ========================================
+
+def _sale_price(row):
+    if row['discount_percentage'] > 0:
+        return (row['price'] * (1 - row['discount_percentage'] / 100)).quantize(Decimal('0.01'))
+    return row['price']
+
+
+def _image_url(row):
+    if row['cloudinary_url']:
+        return row['cloudinary_url']
+    return f"{settings.MEDIA_URL}{row['image']}" if row['image'] else ''
+
+
+# Fields not read straight from their column
+FIELD_VALUES = {
+    'price_display': lambda row: row['price'],
+    'sale_price': _sale_price,
+    'sale_price_display': _sale_price,
+    'image': _image_url,
+    'category': lambda row: row['category_id'],
+    'category_name': lambda row: row['category__name'],
+}
+
+
+def _requested_fields(request, default):
+    """
+    Fields named in ?fields=, or the default ones
+
+    Raises:
+        ValueError: Unknown field
+    """
+    names = [name for name in request.GET.get('fields', '').split(',') if name]
+    unknown = [name for name in names if name not in PRODUCT_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown field(s): {', '.join(unknown)}. Available: {', '.join(PRODUCT_FIELDS)}")
+    return names or list(default)
+
+
+def _columns(fields, *extra):
+    columns = {'id', *extra}
+    for field in fields:
+        columns.update(PRODUCT_FIELDS[field])
+    return sorted(columns)
+
+
+def _serialize_products(rows, fields, converter):
+    """Build the API dicts; every *_display amount is converted in one format_many"""
+    results = []
+    to_format = []
+    for row in rows:
+        item = {}
+        for field in fields:
+            value = FIELD_VALUES[field](row) if field in FIELD_VALUES else row[field]
+            if field.endswith('_display'):
+                to_format.append((item, field, value))
+            item[field] = value
+        results.append(item)
+
+    if to_format:
+        formatted = converter.format_many([value for _, _, value in to_format])
+        for (item, field, _), text in zip(to_format, formatted):
+            item[field] = text
+    return results
+
+
+def _catalogue_response(request, build, uses_stock=True):
+    """
+    Conditional, compressed JSON response for catalogue data
+
+    The ETag is checked before build() runs, so an unchanged catalogue
+    costs no product query. Pass uses_stock=False when the response
+    shows no stock levels, so checkouts don't change its ETag. Prices
+    shown in another currency also tag the exchange rate.
+    """
+    version = get_catalogue_version()
+    if uses_stock:
+        version = f'{version}.{get_stock_version()}'
+    etag = f'"catalogue-{version}-{_currency_tag(request)}"'
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = build()
+        if response.status_code == 200:
+            response['ETag'] = etag
+        response = _compress(request, response)
+    # Currency comes from a cookie or the session
+    patch_vary_headers(response, ('Cookie', 'Accept-Encoding'))
+    return response
+
+
+def _compress(request, response):
+    """brotli (when installed) or gzip, whichever the client accepts, like GZipMiddleware"""
+    if response.status_code != 200 or len(response.content) < MIN_COMPRESS_LENGTH:
+        return response
+    accepted = request.META.get('HTTP_ACCEPT_ENCODING', '')
+    if brotli is not None and re.search(r'\bbr\b', accepted):
+        content, encoding = brotli.compress(response.content, quality=5), 'br'
+    elif re.search(r'\bgzip\b', accepted):
+        content, encoding = compress_string(response.content), 'gzip'
+    else:
+        return response
+    if len(content) >= len(response.content):
+        return response
+
+    response.content = content
+    response['Content-Length'] = str(len(content))
+    response['Content-Encoding'] = encoding
+    # The bytes now depend on the encoding, so the tag can only be weak
+    response['ETag'] = f"W/{response['ETag']}"
+    return response
+
+
+@require_GET
+def product_list_api(request):
+    """One cursor page of in-stock products"""
+    try:
+        fields = _requested_fields(request, LIST_FIELDS)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    limit = request.GET.get('limit', '')
+    limit = min(max(int(limit), 1), MAX_PRODUCTS_PER_PAGE) if limit.isdigit() else PRODUCTS_PER_PAGE
+
+    sort_by = request.GET.get('sort', '-created_at')
+    if sort_by not in PRODUCT_SORTS:
+        sort_by = '-created_at'
+    sort_field, descending = PRODUCT_SORTS[sort_by]
+
+    def build():
+        products = Product.objects.filter(stock__gt=0)
+        category = request.GET.get('category', '')
+        if category.isdigit():
+            products = products.filter(category_id=int(category))
+        if request.GET.get('featured') in ('1', 'true'):
+            products = products.filter(is_featured=True)
+
+        page = keyset_page(
+            products.values(*_columns(fields, sort_field)),
+            sort_field, descending, request.GET.get('cursor'), limit,
+        )
+        converter = get_price_converter(request)
+        return JsonResponse({
+            'currency': converter.currency,
+            'results': _serialize_products(page['items'], fields, converter),
+            'next_cursor': page['next_cursor'],
+        })
+
+    return _catalogue_response(request, build)
+
+
+@require_GET
+def product_detail_api(request, product_id):
+    """One product, with every field unless ?fields= says otherwise"""
+    try:
+        fields = _requested_fields(request, PRODUCT_FIELDS)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    def build():
+        row = Product.objects.filter(pk=product_id).values(*_columns(fields)).first()
+        if row is None:
+            return JsonResponse({'error': 'Product not found'}, status=404)
+        converter = get_price_converter(request)
+        product = _serialize_products([row], fields, converter)[0]
+        product['currency'] = converter.currency
+        return JsonResponse(product)
+
+    return _catalogue_response(request, build, uses_stock='stock' in fields)
@@ -3,3 +3,8 @@ from django.apps import AppConfig
 
 class MainConfig(AppConfig):
     name = 'main'
+
+    def ready(self):
+        # Register signal handlers
+        from . import signals  # noqa: F401
+        from .search import signals as search_signals  # noqa: F401
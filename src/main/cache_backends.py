@@ -0,0 +1,343 @@
+# main/cache_backends.py
+"""
+Cache backends shared between worker processes
+SQLiteCache keeps entries in one SQLite file, so every gunicorn worker
+and management command on a host sees the same cache with no extra
+service; incr() is atomic across processes. TieredCache puts a small
+in-process L1 with a short TTL in front of a shared L2 (SQLiteCache or
+Redis), so hot keys are served from memory and go stale for at most
+L1_TIMEOUT seconds in other processes.
+
+Configured in settings.CACHES (see CACHE_BACKEND).
+"""
+
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from django.core.cache import caches
+from django.core.cache.backends.base import BaseCache, DEFAULT_TIMEOUT
+import logging
+
+logger = logging.getLogger(__name__)
+
+# SQLiteCache checks MAX_ENTRIES once per this many writes, not on every set
+CULL_EVERY = 100
+
+
+class _immediate:
+    """BEGIN IMMEDIATE ... COMMIT, so read-then-write steps can't interleave"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute('BEGIN IMMEDIATE')
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute('COMMIT' if exc_type is None else 'ROLLBACK')
+
+
+class SQLiteCache(BaseCache):
+    """
+    Cache in a standalone SQLite file (LOCATION), separate from the main database
+
+    One connection per thread; WAL mode lets readers run while a writer
+    holds the lock.
+    """
+
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self.location = str(location)
+        self._local = threading.local()
+        self._setup_lock = threading.Lock()
+        self._ready = False
+        self._writes = 0
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.location, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            if not self._ready:
+                with self._setup_lock:
+                    conn.execute(
+                        'CREATE TABLE IF NOT EXISTS cache '
+                        '(key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL)'
+                    )
+                    conn.execute('CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires)')
+                    self._ready = True
+            self._local.conn = conn
+        return conn
+
+    def _expiry(self, timeout):
+        # Absolute expiry time (None = never)
+        return self.get_backend_timeout(timeout)
+
+    def _dumps(self, value):
+        return pickle.dumps(value, self.pickle_protocol)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        conn = self._connection()
+        with _immediate(conn):
+            # An expired entry counts as missing
+            conn.execute('DELETE FROM cache WHERE key = ? AND expires <= ?', (key, time.time()))
+            cursor = conn.execute(
+                'INSERT OR IGNORE INTO cache (key, value, expires) VALUES (?, ?, ?)',
+                (key, self._dumps(value), self._expiry(timeout))
+            )
+        return cursor.rowcount == 1
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        row = self._connection().execute(
+            'SELECT value FROM cache WHERE key = ? AND (expires IS NULL OR expires > ?)',
+            (key, time.time())
+        ).fetchone()
+        return default if row is None else pickle.loads(row[0])
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        self._set_rows([(key, self._dumps(value), self._expiry(timeout))])
+
+    def _set_rows(self, rows):
+        conn = self._connection()
+        with _immediate(conn):
+            conn.executemany('INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)', rows)
+            self._writes += len(rows)
+            if self._writes >= CULL_EVERY:
+                self._writes = 0
+                self._cull(conn)
+
+    def _cull(self, conn):
+        """Drop expired entries, then the soonest-expiring ones if over MAX_ENTRIES"""
+        conn.execute('DELETE FROM cache WHERE expires <= ?', (time.time(),))
+        count = conn.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        if self._cull_frequency and count > self._max_entries:
+            conn.execute(
+                'DELETE FROM cache WHERE key IN '
+                '(SELECT key FROM cache ORDER BY expires IS NULL, expires LIMIT ?)',
+                (count // self._cull_frequency,)
+            )
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        cursor = self._connection().execute(
+            'UPDATE cache SET expires = ? WHERE key = ? AND (expires IS NULL OR expires > ?)',
+            (self._expiry(timeout), key, time.time())
+        )
+        return cursor.rowcount == 1
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return self._connection().execute('DELETE FROM cache WHERE key = ?', (key,)).rowcount == 1
+
+    def has_key(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return self._connection().execute(
+            'SELECT 1 FROM cache WHERE key = ? AND (expires IS NULL OR expires > ?)',
+            (key, time.time())
+        ).fetchone() is not None
+
+    def incr(self, key, delta=1, version=None):
+        """Atomic read-modify-write inside one IMMEDIATE transaction"""
+        key = self.make_and_validate_key(key, version=version)
+        conn = self._connection()
+        with _immediate(conn):
+            row = conn.execute(
+                'SELECT value FROM cache WHERE key = ? AND (expires IS NULL OR expires > ?)',
+                (key, time.time())
+            ).fetchone()
+            if row is None:
+                raise ValueError(f"Key '{key}' not found")
+            value = pickle.loads(row[0]) + delta
+            conn.execute('UPDATE cache SET value = ? WHERE key = ?', (self._dumps(value), key))
+        return value
+
+    def get_many(self, keys, version=None):
+        key_map = {self.make_and_validate_key(key, version=version): key for key in keys}
+        if not key_map:
+            return {}
+        placeholders = ', '.join('?' * len(key_map))
+        rows = self._connection().execute(
+            f'SELECT key, value FROM cache WHERE key IN ({placeholders}) AND (expires IS NULL OR expires > ?)',
+            (*key_map, time.time())
+        ).fetchall()
+        return {key_map[key]: pickle.loads(value) for key, value in rows}
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        expires = self._expiry(timeout)
+        self._set_rows([
+            (self.make_and_validate_key(key, version=version), self._dumps(value), expires)
+            for key, value in data.items()
+        ])
+        return []
+
+    def delete_many(self, keys, version=None):
+        keys = [self.make_and_validate_key(key, version=version) for key in keys]
+        if keys:
+            placeholders = ', '.join('?' * len(keys))
+            self._connection().execute(f'DELETE FROM cache WHERE key IN ({placeholders})', keys)
+
+    def clear(self):
+        self._connection().execute('DELETE FROM cache')
+
+    def close(self, **kwargs):
+        # Connections are kept per thread for the life of the worker
+        pass
+
+
+class TieredCache(BaseCache):
+    """
+    In-process L1 in front of a shared L2 cache
+
+    OPTIONS:
+        L2: Alias of the shared cache in CACHES (default: 'shared')
+        L1_TIMEOUT: Seconds an entry may be served from L1 (default: 5)
+        L1_MAX_ENTRIES: L1 size; oldest writes are dropped first (default: 1000)
+
+    Writes go to L2 and this process's L1. Other processes notice a
+    changed key within L1_TIMEOUT. add() and incr() always go to L2, so
+    locks and counters stay exact.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.l2_alias = options.get('L2', 'shared')
+        self.l1_timeout = options.get('L1_TIMEOUT', 5)
+        self.l1_max_entries = options.get('L1_MAX_ENTRIES', 1000)
+        self._l1 = OrderedDict()
+        self._lock = threading.Lock()
+        self._l2 = None
+
+    @property
+    def l2(self):
+        # Resolved once; the L2 backends used here are safe to share between threads
+        if self._l2 is None:
+            self._l2 = caches[self.l2_alias]
+        return self._l2
+
+    # -- L1 ------------------------------------------------------------
+
+    def _l1_key(self, key, version):
+        return self.l2.make_key(key, version=version)
+
+    def _l1_get(self, l1_key):
+        # Plain dict reads are atomic; eviction order is insertion order
+        entry = self._l1.get(l1_key)
+        if entry is None:
+            return None
+        if entry[1] <= time.monotonic():
+            self._l1_delete([l1_key])
+            return None
+        return entry
+
+    def _l1_set(self, l1_key, value, ttl=None):
+        # Pickled like LocMemCache, so callers can't mutate a shared object
+        ttl = self.l1_timeout if ttl is None else ttl
+        if ttl <= 0:
+            return
+        entry = (pickle.dumps(value, pickle.HIGHEST_PROTOCOL), time.monotonic() + ttl)
+        with self._lock:
+            self._l1[l1_key] = entry
+            self._l1.move_to_end(l1_key)
+            while len(self._l1) > self.l1_max_entries:
+                self._l1.popitem(last=False)
+
+    def _l1_delete(self, l1_keys):
+        with self._lock:
+            for l1_key in l1_keys:
+                self._l1.pop(l1_key, None)
+
+    def _ttl(self, timeout):
+        """How long a value written with this cache timeout may live in L1"""
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.l2.default_timeout
+        return self.l1_timeout if timeout is None else min(timeout, self.l1_timeout)
+
+    # -- Cache API -----------------------------------------------------
+
+    def get(self, key, default=None, version=None):
+        l1_key = self._l1_key(key, version)
+        entry = self._l1_get(l1_key)
+        if entry is not None:
+            return pickle.loads(entry[0])
+
+        value = self.l2.get(key, _MISSING, version=version)
+        if value is _MISSING:
+            return default
+        self._l1_set(l1_key, value)
+        return value
+
+    def get_many(self, keys, version=None):
+        found = {}
+        missing = []
+        for key in keys:
+            entry = self._l1_get(self._l1_key(key, version))
+            if entry is None:
+                missing.append(key)
+            else:
+                found[key] = pickle.loads(entry[0])
+
+        if missing:
+            fetched = self.l2.get_many(missing, version=version)
+            for key, value in fetched.items():
+                self._l1_set(self._l1_key(key, version), value)
+            found.update(fetched)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.l2.set(key, value, timeout, version=version)
+        self._l1_set(self._l1_key(key, version), value, self._ttl(timeout))
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.l2.set_many(data, timeout, version=version)
+        for key, value in data.items():
+            if key not in failed:
+                self._l1_set(self._l1_key(key, version), value, self._ttl(timeout))
+        return failed
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._l1_delete([self._l1_key(key, version)])
+        return self.l2.add(key, value, timeout, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        value = self.l2.incr(key, delta, version=version)
+        self._l1_set(self._l1_key(key, version), value)
+        return value
+
+    def decr(self, key, delta=1, version=None):
+        return self.incr(key, -delta, version=version)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.l2.touch(key, timeout, version=version)
+
+    def delete(self, key, version=None):
+        self._l1_delete([self._l1_key(key, version)])
+        return self.l2.delete(key, version=version)
+
+    def delete_many(self, keys, version=None):
+        self._l1_delete([self._l1_key(key, version) for key in keys])
+        self.l2.delete_many(keys, version=version)
+
+    def has_key(self, key, version=None):
+        if self._l1_get(self._l1_key(key, version)) is not None:
+            return True
+        return self.l2.has_key(key, version=version)
+
+    def clear(self):
+        with self._lock:
+            self._l1.clear()
+        self.l2.clear()
+
+    def close(self, **kwargs):
+        self.l2.close(**kwargs)
+
+
+_MISSING = object()
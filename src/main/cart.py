@@ -1,41 +1,571 @@
+import hashlib
+import secrets
+from datetime import timedelta
 from django.shortcuts import render, redirect, get_object_or_404
 from decimal import Decimal
-from .models import Product
+from .models import Product, Cart, CartLine
 from django.contrib import messages
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Cart storage (settings.CART_STORAGE):
+#   'cookie'   compact signed cookie, written once per response by
+#              CartMiddleware; page views never load the session for it
+#   'session'  the session, marked modified only when the cart changed
+#   'db'       Cart/CartLine rows; anonymous carts are found by a signed
+#              cart_id cookie and merged into the user's cart on login
+CART_COOKIE = 'cart'
+CART_ID_COOKIE = 'cart_id'
+CART_COOKIE_SALT = 'main.cart'
+CART_COOKIE_MAX_AGE = 30 * 24 * 60 * 60
+
+# Keeps the signed cookie well under the 4 KB browser limit
+MAX_COOKIE_LINES = 100
+
+# Database carts' versions are cached so conditional GETs skip the database
+CART_VERSION_TIMEOUT = 24 * 60 * 60
+
+
+def _digest(value):
+    return hashlib.sha1(value.encode()).hexdigest()[:16]
+
+
+def _cart_digest(cart):
+    """Version of a cart without a version counter: a hash of its lines"""
+    return _digest(','.join(f'{product_id}:{quantity}' for product_id, quantity in sorted(cart.items())))
+
+
+def _version_key(owner):
+    return f'cart:version:{owner}'
+
+
+class CartFull(ValueError):
+    """Raised when a cookie cart would have more than MAX_COOKIE_LINES products"""
+
+
+class SessionCartStorage:
+    """Cart kept in request.session, with its item count stored alongside"""
+
+    def __init__(self, request):
+        self.request = request
+        self.cart = None
+
+    def load(self):
+        if self.cart is None:
+            # A copy, so changes can be compared with what is stored
+            self.cart = dict(self.request.session.get('cart', {}))
+        return self.cart
+
+    def save(self, cart):
+        self.cart = cart
+        session = self.request.session
+        if cart == session.get('cart'):
+            return  # Unchanged: don't mark the session for a write
+        session['cart'] = dict(cart)
+        session['cart_count'] = sum(cart.values())
+
+    def count(self):
+        # Visitors with no session cookie have no cart; don't load a session
+        if settings.SESSION_COOKIE_NAME not in self.request.COOKIES:
+            return 0
+        count = self.request.session.get('cart_count')
+        if count is None:
+            # Cart saved before the count was stored alongside it
+            count = sum(self.request.session.get('cart', {}).values())
+        return count
+
+    def version(self):
+        if self.cart is not None:
+            return _cart_digest(self.cart)
+        if settings.SESSION_COOKIE_NAME not in self.request.COOKIES:
+            return _cart_digest({})
+        return _cart_digest(self.request.session.get('cart', {}))
+
+    def finalize(self, response):
+        pass
+
+    def login(self, user):
+        # django.contrib.auth.login keeps the session's data
+        pass
+
+
+class CookieCartStorage:
+    """
+    Cart kept in a signed cookie as "product_id:quantity,..."
+
+    save() only records the new cart; CartMiddleware sets the cookie once
+    when the response goes out, however many times the view saved.
+    """
+
+    def __init__(self, request):
+        self.request = request
+        self.cart = None
+        self.dirty = False
+
+    @staticmethod
+    def decode(value):
+        cart = {}
+        for line in value.split(',') if value else []:
+            product_id, _, quantity = line.partition(':')
+            if product_id.isdigit() and quantity.isdigit() and int(quantity) > 0:
+                cart[product_id] = int(quantity)
+        return cart
+
+    @staticmethod
+    def encode(cart):
+        return ','.join(f'{product_id}:{quantity}' for product_id, quantity in cart.items())
+
+    def load(self):
+        if self.cart is None:
+            self.cart = self.decode(
+                self.request.get_signed_cookie(CART_COOKIE, default='', salt=CART_COOKIE_SALT)
+            )
+            if CART_COOKIE not in self.request.COOKIES and settings.SESSION_COOKIE_NAME in self.request.COOKIES:
+                self._adopt_session_cart()
+        return self.cart
+
+    def _adopt_session_cart(self):
+        # Cart saved in the session before cookie storage was switched on
+        session = self.request.session
+        if 'cart' in session:
+            self.cart = dict(session.pop('cart'))
+            session.pop('cart_count', None)
+            self.dirty = True
+
+    def save(self, cart):
+        if len(cart) > MAX_COOKIE_LINES:
+            raise CartFull(f'A cart can hold at most {MAX_COOKIE_LINES} different products')
+        self.cart = cart
+        self.dirty = True
+
+    def count(self):
+        return sum(self.load().values())
+
+    def version(self):
+        return _cart_digest(self.load())
+
+    def finalize(self, response):
+        if not self.dirty:
+            return
+        if self.cart:
+            response.set_signed_cookie(
+                CART_COOKIE, self.encode(self.cart), salt=CART_COOKIE_SALT,
+                max_age=CART_COOKIE_MAX_AGE, httponly=True, samesite='Lax',
+                secure=settings.SESSION_COOKIE_SECURE,
+            )
+        else:
+            response.delete_cookie(CART_COOKIE, samesite='Lax')
+
+    def login(self, user):
+        # The cookie stays with the browser
+        pass
+
+
+class DatabaseCartStorage:
+    """
+    Cart kept in the Cart and CartLine tables
+
+    save() writes only the lines that changed: new lines are upserted,
+    changed ones incremented with F(), and Cart.item_count moved by the
+    same amount, so count() is a single-integer read.
+    """
+
+    def __init__(self, request):
+        self.request = request
+        self.cart = None
+        self.stored = None  # Lines as they are in the database
+        self.cart_id = None
+        self.cart_version = 0
+        self.new_token = None  # Anonymous cart created this request
+        self.forget_token = False
+        self.drop_cart_cookie = False  # Cookie cart adopted this request
+
+    def _user_id(self):
+        user = getattr(self.request, 'user', None)
+        return user.pk if user is not None and user.is_authenticated else None
+
+    def _token(self):
+        if self.new_token:
+            return self.new_token
+        return self.request.get_signed_cookie(CART_ID_COOKIE, default=None, salt=CART_COOKIE_SALT)
+
+    def _carts(self):
+        """Queryset for this visitor's cart, or None if they have none"""
+        user_id = self._user_id()
+        if user_id is not None:
+            return Cart.objects.filter(user_id=user_id)
+        token = None if self.forget_token else self._token()
+        if token:
+            return Cart.objects.filter(token=token, user__isnull=True)
+        return None
+
+    def load(self):
+        if self.cart is None:
+            self.stored = {}
+            carts = self._carts()
+            row = carts.values_list('pk', 'item_count', 'version').first() if carts is not None else None
+            if row is not None:
+                self.cart_id, item_count, self.cart_version = row
+                self.stored = {
+                    str(product_id): quantity
+                    for product_id, quantity in CartLine.objects.filter(
+                        cart_id=self.cart_id
+                    ).values_list('product_id', 'quantity')
+                }
+                if sum(self.stored.values()) != item_count:
+                    # Lines of deleted products went with them (CASCADE)
+                    Cart.objects.filter(pk=self.cart_id).update(item_count=sum(self.stored.values()))
+            self.cart = dict(self.stored)
+            if row is None and self._has_legacy_cart():
+                self._adopt_legacy_cart()
+        return self.cart
+
+    def _has_legacy_cart(self):
+        """True if a cart saved by cookie or session storage is still around"""
+        if CART_COOKIE in self.request.COOKIES:
+            return True
+        return settings.SESSION_COOKIE_NAME in self.request.COOKIES and 'cart' in self.request.session
+
+    def _adopt_legacy_cart(self):
+        # Cart saved in the cookie or session before database storage was
+        # switched on: move it into a Cart row and drop the old copy
+        cart = {}
+        if CART_COOKIE in self.request.COOKIES:
+            cart = CookieCartStorage.decode(
+                self.request.get_signed_cookie(CART_COOKIE, default='', salt=CART_COOKIE_SALT)
+            )
+            self.drop_cart_cookie = True
+        session = self.request.session if settings.SESSION_COOKIE_NAME in self.request.COOKIES else None
+        if session is not None and 'cart' in session:
+            for product_id, quantity in session.pop('cart').items():
+                cart.setdefault(str(product_id), quantity)
+            session.pop('cart_count', None)
+
+        # Lines must point at existing products to be stored
+        ids = [int(product_id) for product_id in cart if str(product_id).isdigit()]
+        existing = {str(pk) for pk in Product.objects.filter(pk__in=ids).values_list('pk', flat=True)}
+        cart = {
+            product_id: quantity for product_id, quantity in cart.items()
+            if product_id in existing and isinstance(quantity, int) and quantity > 0
+        }
+        if cart:
+            self.save(cart)
+
+    def _create_cart(self):
+        user_id = self._user_id()
+        if user_id is not None:
+            cart, _ = Cart.objects.get_or_create(user_id=user_id)
+        else:
+            cart = Cart.objects.create(token=secrets.token_hex(16))
+            self.new_token = cart.token
+        return cart.pk
+
+    def save(self, cart):
+        self.load()
+        stored = self.stored
+        self.cart = cart
+        changed = {product_id: quantity for product_id, quantity in cart.items() if stored.get(product_id) != quantity}
+        removed = [product_id for product_id in stored if product_id not in cart]
+        if not changed and not removed:
+            return
+
+        now = timezone.now()
+        with transaction.atomic():
+            if self.cart_id is None:
+                self.cart_id = self._create_cart()
+            if removed:
+                CartLine.objects.filter(cart_id=self.cart_id, product_id__in=removed).delete()
+
+            new_lines = [
+                CartLine(cart_id=self.cart_id, product_id=product_id, quantity=quantity, updated_at=now)
+                for product_id, quantity in changed.items() if product_id not in stored
+            ]
+            if new_lines:
+                # A line another request added meanwhile is overwritten, not duplicated
+                CartLine.objects.bulk_create(
+                    new_lines,
+                    update_conflicts=True,
+                    unique_fields=['cart', 'product'],
+                    update_fields=['quantity', 'updated_at'],
+                )
+            for product_id, quantity in changed.items():
+                if product_id in stored:
+                    CartLine.objects.filter(cart_id=self.cart_id, product_id=product_id).update(
+                        quantity=F('quantity') + (quantity - stored[product_id]), updated_at=now
+                    )
+
+            carts = Cart.objects.filter(pk=self.cart_id)
+            carts.update(
+                item_count=F('item_count') + (sum(cart.values()) - sum(stored.values())),
+                version=F('version') + 1,
+                updated_at=now,
+            )
+            self.cart_version = carts.values_list('version', flat=True).get()
+
+        owner = self._owner()
+        if owner:
+            cache.set(_version_key(owner), self.cart_version, CART_VERSION_TIMEOUT)
+        self.stored = dict(cart)
+
+    def count(self):
+        if self.stored is not None:
+            return sum(self.stored.values())
+        carts = self._carts()
+        count = carts.values_list('item_count', flat=True).first() if carts is not None else None
+        if count is None:
+            # No cart row yet: a cookie or session cart may still need adopting
+            return sum(self.load().values()) if self._has_legacy_cart() else 0
+        return count
+
+    def _owner(self):
+        """'user:<id>' or 'token:<token>', None for a visitor with no cart"""
+        # The user id is read from the session, so no user query is needed
+        session = getattr(self.request, 'session', None)
+        user_id = session.get(SESSION_KEY) if session is not None else None
+        if user_id is not None:
+            return f'user:{user_id}'
+        token = None if self.forget_token else self._token()
+        return f'token:{token}' if token else None
+
+    def version(self):
+        """Opaque cart version; served from cache, so usually no query"""
+        owner = self._owner()
+        if owner is None:
+            return _cart_digest({})
+        if self.stored is not None:
+            version = self.cart_version
+        else:
+            version = cache.get(_version_key(owner))
+            if version is None:
+                carts = self._carts()
+                version = (carts.values_list('version', flat=True).first() if carts is not None else None) or 0
+                cache.set(_version_key(owner), version, CART_VERSION_TIMEOUT)
+        # The owner is part of it, so two carts never share a version
+        return _digest(f'{owner}:{version}')
+
+    def finalize(self, response):
+        if self.drop_cart_cookie:
+            response.delete_cookie(CART_COOKIE, samesite='Lax')
+        if self.forget_token:
+            response.delete_cookie(CART_ID_COOKIE, samesite='Lax')
+        elif self.new_token:
+            response.set_signed_cookie(
+                CART_ID_COOKIE, self.new_token, salt=CART_COOKIE_SALT,
+                max_age=CART_COOKIE_MAX_AGE, httponly=True, samesite='Lax',
+                secure=settings.SESSION_COOKIE_SECURE,
+            )
+
+    def login(self, user):
+        """The visitor became user: merge their anonymous cart into user's"""
+        token = self._token()
+        self.cart = self.stored = self.cart_id = None
+        self.cart_version = 0
+        if token:
+            self.new_token = None
+            self.forget_token = True
+            merge_carts(token, user)
+
+
+def merge_carts(token, user):
+    """
+    Merge the anonymous cart with this token into user's cart
+
+    Quantities of products in both carts are added together; the merged
+    lines are written with one bulk upsert and the anonymous cart deleted.
+    If the user has no cart yet, the anonymous one is simply handed over.
+
+    Args:
+        token: Anonymous cart token (from the cart_id cookie)
+        user: User who just logged in
+    """
+    with transaction.atomic():
+        anonymous_id = Cart.objects.filter(token=token, user__isnull=True).values_list('pk', flat=True).first()
+        if anonymous_id is None:
+            return
+        user_cart_id = Cart.objects.filter(user=user).values_list('pk', flat=True).first()
+        now = timezone.now()
+
+        if user_cart_id is None:
+            Cart.objects.filter(pk=anonymous_id).update(
+                user=user, token=None, version=F('version') + 1, updated_at=now
+            )
+        else:
+            quantities = {}
+            merged = set()
+            for cart_id, product_id, quantity in CartLine.objects.filter(
+                cart_id__in=[anonymous_id, user_cart_id]
+            ).values_list('cart_id', 'product_id', 'quantity'):
+                quantities[product_id] = quantities.get(product_id, 0) + quantity
+                if cart_id == anonymous_id:
+                    merged.add(product_id)
+
+            if merged:
+                CartLine.objects.bulk_create(
+                    [
+                        CartLine(cart_id=user_cart_id, product_id=product_id, quantity=quantities[product_id], updated_at=now)
+                        for product_id in merged
+                    ],
+                    update_conflicts=True,
+                    unique_fields=['cart', 'product'],
+                    update_fields=['quantity', 'updated_at'],
+                )
+            Cart.objects.filter(pk=user_cart_id).update(
+                item_count=sum(quantities.values()), version=F('version') + 1, updated_at=now
+            )
+            Cart.objects.filter(pk=anonymous_id).delete()
+
+    cache.delete_many([_version_key(f'token:{token}'), _version_key(f'user:{user.pk}')])
+    logger.info(f"Merged anonymous cart #{anonymous_id} into {user.username}'s cart")
+
+
+def delete_expired_carts(now=None, chunk_size=1000):
+    """
+    Delete anonymous carts whose cart_id cookie has expired
+
+    The cookie is set once, when the cart is created, so an anonymous cart
+    older than CART_COOKIE_MAX_AGE can no longer be reached by anyone.
+
+    Returns:
+        int: Carts deleted
+    """
+    cutoff = (now or timezone.now()) - timedelta(seconds=CART_COOKIE_MAX_AGE)
+    expired = Cart.objects.filter(user__isnull=True, created_at__lt=cutoff)
+    deleted = 0
+    while True:
+        ids = list(expired.order_by('pk').values_list('pk', flat=True)[:chunk_size])
+        if not ids:
+            return deleted
+        # Lines go with their cart (CASCADE)
+        with transaction.atomic():
+            Cart.objects.filter(pk__in=ids).delete()
+        deleted += len(ids)
+
+
+CART_STORAGES = {
+    'session': SessionCartStorage,
+    'cookie': CookieCartStorage,
+    'db': DatabaseCartStorage,
+}
+
+
+def get_cart_storage(request):
+    """Cart storage for this request (one per request)"""
+    storage = getattr(request, '_cart_storage', None)
+    if storage is None:
+        storage_class = CART_STORAGES[getattr(settings, 'CART_STORAGE', 'session')]
+        storage = request._cart_storage = storage_class(request)
+    return storage
+
 
 def get_cart(request):
-    """Get cart from session"""
-    cart = request.session.get('cart', {})
-    return cart
+    """Get cart as {product_id (str): quantity}"""
+    return get_cart_storage(request).load()
 
 
 def save_cart(request, cart):
-    """Save cart to session"""
-    request.session['cart'] = cart
-    request.session.modified = True
+    """
+    Save the cart (a no-op if it did not change)
+
+    Raises:
+        CartFull: Cookie storage and too many different products
+    """
+    get_cart_storage(request).save(cart)
+
+
+def cached_cart_count(request):
+    """Number of items in the cart, without re-summing a session cart"""
+    return get_cart_storage(request).count()
+
+
+def cart_version(request):
+    """Opaque version string that changes whenever the cart does"""
+    return get_cart_storage(request).version()
+
+
+def get_cart_totals(request):
+    """
+    Item count and total of the cart, loading only product prices
+
+    Returns:
+        dict: {'count', 'total'}
+    """
+    cart = get_cart(request)
+    ids = [int(product_id) for product_id in cart if str(product_id).isdigit()]
+    prices = dict(Product.objects.filter(pk__in=ids).values_list('pk', 'price'))
+
+    count = 0
+    total = Decimal('0.00')
+    for product_id, quantity in cart.items():
+        price = prices.get(int(product_id)) if str(product_id).isdigit() else None
+        if price is not None:
+            count += quantity
+            total += price * quantity
+    return {'count': count, 'total': total}
+
+
+def resolve_cart(cart):
+    """
+    Load every product in the cart with a single in_bulk query
+
+    Args:
+        cart: Cart dict of {product_id (str): quantity}
+
+    Returns:
+        tuple: (products keyed by the cart's product_id, list of stale product_ids)
+    """
+    ids = {}
+    stale_ids = []
+    for product_id in cart:
+        try:
+            ids[int(product_id)] = product_id
+        except (TypeError, ValueError):
+            stale_ids.append(product_id)
+
+    found = Product.objects.select_related('category', 'seller').in_bulk(list(ids))
+
+    products = {}
+    for pk, product_id in ids.items():
+        if pk in found:
+            products[product_id] = found[pk]
+        else:
+            stale_ids.append(product_id)
+
+    return products, stale_ids
 
 
 def get_cart_items(request):
     """Get cart items with product details and calculate totals"""
     cart = get_cart(request)
+    products, stale_ids = resolve_cart(cart)
     cart_items = []
     total = Decimal('0.00')
     
     for product_id, quantity in cart.items():
-        try:
-            product = Product.objects.get(id=product_id)
-            subtotal = product.price * quantity
-            total += subtotal
-            
-            cart_items.append({
-                'product': product,
-                'quantity': quantity,
-                'subtotal': subtotal
-            })
-        except Product.DoesNotExist:
-            # Remove invalid product from cart
+        product = products.get(product_id)
+        if product is None:
+            continue
+
+        subtotal = product.price * quantity
+        total += subtotal
+        
+        cart_items.append({
+            'product': product,
+            'quantity': quantity,
+            'subtotal': subtotal
+        })
+
+    if stale_ids:
+        # Remove invalid products from cart in one session write
+        for product_id in stale_ids:
             del cart[product_id]
-            save_cart(request, cart)
+        save_cart(request, cart)
     
     return {
         'items': cart_items,
@@ -76,7 +606,12 @@ def add_to_cart(request, product_id):
     
     # Add to cart
     cart[product_id_str] = new_quantity
-    save_cart(request, cart)
+    try:
+        save_cart(request, cart)
+    except CartFull as e:
+        del cart[product_id_str]
+        messages.error(request, str(e))
+        return redirect(request.META.get('HTTP_REFERER', 'home'))
     
     messages.success(request, f"{product.name} added to cart")
     return redirect('cart')
@@ -125,8 +660,7 @@ def remove_from_cart(request, product_id):
 
 def clear_cart(request):
     """Clear entire cart"""
-    request.session['cart'] = {}
-    request.session.modified = True
+    save_cart(request, {})
     messages.success(request, "Cart cleared")
     return redirect('cart')
 
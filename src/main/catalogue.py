@@ -0,0 +1,115 @@
+# main/catalogue.py
+"""
+Cached catalogue data
+The home page is served from cache; Product and Category changes bump
+a catalogue version (see main/signals.py) which marks cached data stale.
+Stock moves made with UPDATEs (main/stock.py) bump a separate stock
+version instead, so checkouts don't empty the home page cache; stock
+levels shown from cached data are read live.
+"""
+
+from django.core.cache import cache
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from .models import Product, Category
+from .utils.cache import get_or_build
+from .utils.currency import PriceConverter
+
+CATALOGUE_VERSION_KEY = 'catalogue:version'
+STOCK_VERSION_KEY = 'catalogue:stock-version'
+
+HOME_CACHE_TIMEOUT = 300
+
+
+def _get_version(key):
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, 1, None)
+        version = cache.get(key, 1)
+    return version
+
+
+def _bump_version(key):
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # Key missing (evicted or never set)
+        cache.add(key, 1, None)
+        return cache.incr(key)
+
+
+def get_catalogue_version():
+    """Get the current catalogue version (starts at 1)"""
+    return _get_version(CATALOGUE_VERSION_KEY)
+
+
+def bump_catalogue_version():
+    """Mark every catalogue-derived cache entry as stale"""
+    return _bump_version(CATALOGUE_VERSION_KEY)
+
+
+def get_stock_version():
+    """Get the current stock version (starts at 1)"""
+    return _get_version(STOCK_VERSION_KEY)
+
+
+def bump_stock_version():
+    """Mark responses that show stock levels (API ETags) as stale"""
+    return _bump_version(STOCK_VERSION_KEY)
+
+
+def build_home_data(currency='NGN'):
+    """Run the home page queries and convert prices to the given currency"""
+    products = Product.objects.select_related('category')
+    
+    # Get featured products or latest 12 products
+    featured = list(products.filter(is_featured=True).order_by('-created_at')[:12])
+    
+    # If no featured products, get latest products
+    if not featured:
+        featured = list(products.filter(stock__gt=0).order_by('-created_at')[:12])
+    
+    # Convert prices to user's currency and handle discounts in one pass
+    featured = PriceConverter(currency).convert_products(featured)
+    
+    # First 4 products of every category for the sidebar, in one query
+    categories = list(Category.objects.all())
+    sidebar = Product.objects.annotate(
+        position=Window(RowNumber(), partition_by=F('category'), order_by=F('pk').asc())
+    ).filter(position__lte=4, category__isnull=False).only('id', 'name', 'category_id')
+    
+    by_category = {}
+    for product in sidebar:
+        by_category.setdefault(product.category_id, []).append(product)
+    for category in categories:
+        category.sidebar_products = by_category.get(category.pk, [])
+    
+    return {
+        'products': featured,
+        'categories': categories,
+        'total_products': Product.objects.count(),
+    }
+
+
+def get_home_data(currency='NGN'):
+    """
+    Get home page data for a currency from cache
+
+    Stock moves don't change the catalogue version, so the products'
+    stock is refreshed from the database (one primary key lookup).
+
+    Returns:
+        dict: {'products', 'categories', 'total_products'}
+    """
+    data = get_or_build(
+        f'home:{currency}',
+        lambda: build_home_data(currency),
+        timeout=HOME_CACHE_TIMEOUT,
+        version=get_catalogue_version(),
+    )
+    stock = dict(
+        Product.objects.filter(pk__in=[product.pk for product in data['products']]).values_list('pk', 'stock')
+    )
+    for product in data['products']:
+        product.stock = stock.get(product.pk, 0)
+    return data
@@ -1,22 +1,24 @@
+from django.utils.functional import SimpleLazyObject
+from .cart import cached_cart_count
 from .utils.currency import get_user_currency, SUPPORTED_CURRENCIES
 
+# Values are lazy: they are only computed if a template actually reads
+# them, and then at most once per render
+
 
 def cart_processor(request):
     """Add cart count to all templates"""
-    cart = request.session.get('cart', {})
-    cart_count = sum(cart.values())
-    
     return {
-        'cart_count': cart_count
+        'cart_count': SimpleLazyObject(lambda: cached_cart_count(request))
     }
 
 
 def currency_processor(request):
     """Add currency information to all templates"""
-    currency = get_user_currency(request)
+    currency = SimpleLazyObject(lambda: get_user_currency(request))
 
     return {
         'currency': currency,
         'user_currency': currency,  # alias used in templates
         'supported_currencies': SUPPORTED_CURRENCIES
-    }
\ No newline at end of file
+    }
@@ -237,10 +237,11 @@ def send_escrow_delivered_email(escrow):
         return False
 
 
-def send_escrow_funds_released_email(escrow):
+def send_escrow_funds_released_email(escrow, connection=None):
     """
     Notify seller that funds have been released
     From: escrow@techfy.africa
+    Pass an open mail connection to reuse it across many escrows.
     """
     try:
         subject = f'Escrow Funds Released - ₦{escrow.amount:,.2f}'
@@ -260,6 +261,7 @@ def send_escrow_funds_released_email(escrow):
             body=text_content,
             from_email=f'Techfy Escrow <{settings.ESCROW_EMAIL}>',
             to=[escrow.seller.email],
+            connection=connection,
         )
         email.attach_alternative(html_content, "text/html")
         email.send(fail_silently=False)
@@ -310,10 +312,11 @@ def send_escrow_dispute_email(dispute):
         return False
 
 
-def send_order_cancelled_email(order):
+def send_order_cancelled_email(order, connection=None):
     """
     Notify buyer that order was cancelled
     From: orders@techfy.africa
+    Pass an open mail connection to reuse it across many orders.
     """
     try:
         subject = f'Order Cancelled - #{order.id}'
@@ -333,6 +336,7 @@ def send_order_cancelled_email(order):
             body=text_content,
             from_email=f'Techfy Orders <{settings.ORDERS_EMAIL}>',
             to=[order.buyer.email],
+            connection=connection,
         )
         email.attach_alternative(html_content, "text/html")
         email.send(fail_silently=False)
@@ -0,0 +1,15 @@
+# main/flutterwave/__init__.py
+"""
+Flutterwave API access
+Use get_client() rather than calling requests directly so every call
+shares one connection pool, retry policy and circuit breaker.
+"""
+
+from .client import (
+    FlutterwaveClient,
+    FlutterwaveError,
+    CircuitOpenError,
+    CircuitBreaker,
+    get_client,
+    set_client,
+)
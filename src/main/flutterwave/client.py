@@ -0,0 +1,274 @@
+# main/flutterwave/client.py
+"""
+Flutterwave API client
+One pooled requests.Session per process (keep-alive, no TLS handshake
+per call), split connect/read timeouts, jittered retries for idempotent
+calls, a circuit breaker and per-endpoint latency metrics.
+"""
+
+import random
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class FlutterwaveError(requests.exceptions.RequestException):
+    """Flutterwave call failed (network error, HTTP error or bad response)"""
+
+    def __init__(self, message, status_code=None, data=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.data = data or {}
+
+
+class CircuitOpenError(FlutterwaveError):
+    """Flutterwave is failing; calls are short-circuited until the breaker resets"""
+
+
+class CircuitBreaker:
+    """
+    Stop calling an upstream that keeps failing
+
+    closed -> open after failure_threshold consecutive failures;
+    open -> half-open after reset_timeout seconds (one trial call);
+    half-open -> closed on success, open again on failure.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def allow(self):
+        """Return True if a call may go through now"""
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+class EndpointMetrics:
+    """Thread-safe call count, error count and latency per endpoint"""
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, elapsed, ok):
+        with self._lock:
+            stats = self._data.setdefault(endpoint, {
+                'calls': 0, 'errors': 0, 'total_ms': 0.0, 'max_ms': 0.0
+            })
+            elapsed_ms = elapsed * 1000
+            stats['calls'] += 1
+            stats['total_ms'] += elapsed_ms
+            stats['max_ms'] = max(stats['max_ms'], elapsed_ms)
+            if not ok:
+                stats['errors'] += 1
+
+    def snapshot(self):
+        """
+        Returns:
+            dict: {endpoint: {'calls', 'errors', 'avg_ms', 'max_ms'}}
+        """
+        with self._lock:
+            return {
+                endpoint: {
+                    'calls': stats['calls'],
+                    'errors': stats['errors'],
+                    'avg_ms': round(stats['total_ms'] / stats['calls'], 2) if stats['calls'] else 0,
+                    'max_ms': round(stats['max_ms'], 2),
+                }
+                for endpoint, stats in self._data.items()
+            }
+
+    def reset(self):
+        with self._lock:
+            self._data.clear()
+
+
+# Status codes worth retrying on idempotent calls
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class FlutterwaveClient:
+    """Pooled, retrying Flutterwave v3 API client"""
+
+    def __init__(self, secret_key=None, base_url=None, connect_timeout=None, read_timeout=None,
+                 max_retries=None, backoff=None, pool_size=None, breaker=None, adapter=None):
+        self.secret_key = secret_key if secret_key is not None else getattr(settings, 'FLUTTERWAVE_SECRET_KEY', '')
+        self.base_url = (base_url or getattr(settings, 'FLUTTERWAVE_BASE_URL', 'https://api.flutterwave.com')).rstrip('/')
+        self.timeout = (
+            connect_timeout or getattr(settings, 'FLUTTERWAVE_CONNECT_TIMEOUT', 3.05),
+            read_timeout or getattr(settings, 'FLUTTERWAVE_READ_TIMEOUT', 10),
+        )
+        self.max_retries = max_retries if max_retries is not None else getattr(settings, 'FLUTTERWAVE_MAX_RETRIES', 3)
+        self.backoff = backoff if backoff is not None else getattr(settings, 'FLUTTERWAVE_RETRY_BACKOFF', 0.25)
+        self.breaker = breaker or CircuitBreaker()
+        self.metrics = EndpointMetrics()
+
+        pool_size = pool_size or getattr(settings, 'FLUTTERWAVE_POOL_SIZE', 10)
+        self.session = requests.Session()
+        self.session.headers.update({
+            'Authorization': f'Bearer {self.secret_key}',
+            'Content-Type': 'application/json',
+        })
+        # Retries are handled here, so urllib3 must not retry on its own
+        self.session.mount('https://', adapter or HTTPAdapter(pool_connections=2, pool_maxsize=pool_size, max_retries=0))
+        self.session.mount('http://', adapter or HTTPAdapter(pool_connections=2, pool_maxsize=pool_size, max_retries=0))
+
+    def _sleep_before_retry(self, attempt):
+        # Full jitter: spreads retries from many workers over the window
+        time.sleep(random.uniform(0, self.backoff * (2 ** attempt)))
+
+    def request(self, method, path, endpoint, idempotent=False, **kwargs):
+        """
+        Make an API call and return the decoded JSON body
+
+        Args:
+            method: HTTP method
+            path: Path under the base URL (e.g. '/v3/payments')
+            endpoint: Metrics name for the call (e.g. 'payments.initialize')
+            idempotent: Retry on timeouts, connection errors and 5xx/429.
+                Non-idempotent calls are only retried when the connection
+                could not be established, i.e. the request never left.
+
+        Raises:
+            CircuitOpenError: Flutterwave has been failing, no request was sent
+            FlutterwaveError: Network error, HTTP error or invalid JSON
+        """
+        url = f'{self.base_url}{path}'
+        kwargs.setdefault('timeout', self.timeout)
+        attempts = 1 + max(self.max_retries, 0)
+
+        failure = None
+        for attempt in range(attempts):
+            if not self.breaker.allow():
+                if failure is not None:
+                    # An earlier try was sent, so its outcome is what's unknown
+                    raise failure
+                raise CircuitOpenError(f'Flutterwave circuit open, skipped {endpoint}')
+
+            is_last = attempt == attempts - 1
+            started = time.perf_counter()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except requests.exceptions.ConnectTimeout as e:
+                error, retryable = e, True
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                error, retryable = e, idempotent
+            else:
+                elapsed = time.perf_counter() - started
+                if response.status_code in RETRY_STATUSES:
+                    self.metrics.record(endpoint, elapsed, ok=False)
+                    self.breaker.record_failure()
+                    failure = FlutterwaveError(
+                        f'{response.status_code} Server Error for {endpoint}',
+                        status_code=response.status_code
+                    )
+                    if idempotent and not is_last:
+                        logger.warning(f"Flutterwave {endpoint} HTTP {response.status_code}, retrying")
+                        self._sleep_before_retry(attempt)
+                        continue
+                    raise failure
+
+                # 2xx and 4xx mean Flutterwave is up
+                self.breaker.record_success()
+                self.metrics.record(endpoint, elapsed, ok=response.ok)
+                try:
+                    data = response.json()
+                except ValueError:
+                    raise FlutterwaveError(f'Invalid JSON from {endpoint}', status_code=response.status_code)
+                if not response.ok:
+                    raise FlutterwaveError(
+                        data.get('message') or f'{response.status_code} Client Error for {endpoint}',
+                        status_code=response.status_code,
+                        data=data
+                    )
+                return data
+
+            # Network error
+            self.metrics.record(endpoint, time.perf_counter() - started, ok=False)
+            self.breaker.record_failure()
+            failure = FlutterwaveError(str(error))
+            if retryable and not is_last:
+                logger.warning(f"Flutterwave {endpoint} failed ({error.__class__.__name__}), retrying")
+                self._sleep_before_retry(attempt)
+                continue
+            raise failure from error
+
+    # ------------------------------------------------------------------
+    # API calls
+    # ------------------------------------------------------------------
+
+    def initialize_payment(self, payload):
+        """POST /v3/payments (tx_ref makes a repeat harmless, so it is retried)"""
+        return self.request('POST', '/v3/payments', 'payments.initialize', idempotent=True, json=payload)
+
+    def verify_transaction(self, transaction_id):
+        """GET /v3/transactions/<id>/verify"""
+        return self.request(
+            'GET', f'/v3/transactions/{transaction_id}/verify', 'transactions.verify', idempotent=True
+        )
+
+    def create_transfer(self, payload):
+        """POST /v3/transfers (moves money, never retried once sent)"""
+        return self.request('POST', '/v3/transfers', 'transfers.create', idempotent=False, json=payload)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Get the process-wide Flutterwave client"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                adapter = None
+                if getattr(settings, 'FLUTTERWAVE_FAKE', False):
+                    from .fake import FakeFlutterwaveAdapter
+                    adapter = FakeFlutterwaveAdapter()
+                _client = FlutterwaveClient(adapter=adapter)
+    return _client
+
+
+def set_client(client):
+    """Replace the process-wide client (e.g. with one using the fake adapter)"""
+    global _client
+    with _client_lock:
+        _client = client
@@ -0,0 +1,125 @@
+# main/flutterwave/fake.py
+"""
+Local fake Flutterwave server
+A requests transport adapter that answers API calls in-process, so the
+client (pooling, retries, circuit breaker, metrics) can be exercised
+without network access. Enable with FLUTTERWAVE_FAKE=True or mount it
+explicitly: FlutterwaveClient(adapter=FakeFlutterwaveAdapter()).
+"""
+
+import json
+import re
+import threading
+import time
+import uuid
+from collections import deque
+from requests import Response
+from requests.adapters import BaseAdapter
+from requests.exceptions import ConnectTimeout, ReadTimeout, ConnectionError
+
+
+class FakeFlutterwaveAdapter(BaseAdapter):
+    """
+    In-process stand-in for api.flutterwave.com
+
+    Args:
+        latency: Seconds to sleep per request (simulates network time)
+        transactions: {transaction_id: transaction dict} returned by verify
+    """
+
+    ROUTES = [
+        ('POST', re.compile(r'^/v3/payments$'), 'initialize_payment'),
+        ('GET', re.compile(r'^/v3/transactions/(?P<transaction_id>[^/]+)/verify$'), 'verify_transaction'),
+        ('POST', re.compile(r'^/v3/transfers$'), 'create_transfer'),
+    ]
+
+    def __init__(self, latency=0, transactions=None):
+        super().__init__()
+        self.latency = latency
+        self.transactions = transactions or {}
+        self.requests = []
+        self._failures = deque()
+        self._lock = threading.Lock()
+
+    def fail_next(self, *failures):
+        """
+        Queue failures for the next requests, in order
+
+        Each failure is an HTTP status code (e.g. 503) or one of
+        'connect_timeout', 'read_timeout', 'connection_error'.
+        """
+        with self._lock:
+            self._failures.extend(failures)
+
+    def send(self, request, **kwargs):
+        with self._lock:
+            self.requests.append(request)
+            failure = self._failures.popleft() if self._failures else None
+
+        if self.latency:
+            time.sleep(self.latency)
+
+        if failure == 'connect_timeout':
+            raise ConnectTimeout('Fake connect timeout', request=request)
+        if failure == 'read_timeout':
+            raise ReadTimeout('Fake read timeout', request=request)
+        if failure == 'connection_error':
+            raise ConnectionError('Fake connection reset', request=request)
+        if failure is not None:
+            return self._response(request, failure, {'status': 'error', 'message': 'Fake upstream failure'})
+
+        path = request.path_url.split('?')[0]
+        for method, pattern, handler in self.ROUTES:
+            match = pattern.match(path)
+            if match and request.method == method:
+                body = json.loads(request.body) if request.body else {}
+                status, data = getattr(self, handler)(body, **match.groupdict())
+                return self._response(request, status, data)
+
+        return self._response(request, 404, {'status': 'error', 'message': 'Not found'})
+
+    def close(self):
+        pass
+
+    def _response(self, request, status, data):
+        response = Response()
+        response.status_code = status
+        response._content = json.dumps(data).encode()
+        response.headers['Content-Type'] = 'application/json'
+        response.url = request.url
+        response.request = request
+        response.encoding = 'utf-8'
+        return response
+
+    # ------------------------------------------------------------------
+    # Endpoints
+    # ------------------------------------------------------------------
+
+    def initialize_payment(self, body):
+        return 200, {
+            'status': 'success',
+            'message': 'Hosted Link',
+            'data': {'link': f"https://checkout.flutterwave.test/pay/{body.get('tx_ref', uuid.uuid4().hex)}"},
+        }
+
+    def verify_transaction(self, body, transaction_id):
+        transaction = self.transactions.get(transaction_id)
+        if transaction is None:
+            return 400, {'status': 'error', 'message': 'No transaction was found for this id', 'data': None}
+        return 200, {
+            'status': 'success',
+            'message': 'Transaction fetched successfully',
+            'data': {'id': transaction_id, **transaction},
+        }
+
+    def create_transfer(self, body):
+        return 200, {
+            'status': 'success',
+            'message': 'Transfer Queued Successfully',
+            'data': {
+                'id': abs(hash(body.get('reference'))) % 10**6,
+                'reference': body.get('reference'),
+                'amount': body.get('amount'),
+                'status': 'NEW',
+            },
+        }
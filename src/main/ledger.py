@@ -0,0 +1,199 @@
+# main/ledger.py
+"""
+Wallet ledger service
+Balances only move through post_entries(): every movement is written as
+an append-only WalletTransaction, and balances are changed with
+UPDATE ... SET balance = balance + x in the same transaction, never by
+saving a Wallet loaded earlier.
+"""
+
+import uuid
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import Case, When, F, Q
+from django.utils import timezone
+from .models import Wallet, WalletTransaction
+from .utils.rate_history import rate_as_of
+
+CENT = Decimal('0.01')
+
+
+class InsufficientFunds(Exception):
+    """Raised when a debit would take a wallet below zero"""
+
+    def __init__(self, shortfalls):
+        self.shortfalls = shortfalls
+        super().__init__(
+            ', '.join(
+                f"wallet {s['wallet_id']}: needs {s['requested']}, available {s['available']}"
+                for s in shortfalls
+            )
+        )
+
+
+def _wallet_ids(user_ids):
+    """
+    Get wallet ids for users, creating missing wallets in one INSERT
+
+    Returns:
+        dict: {user_id: wallet_id}
+    """
+    wallets = dict(Wallet.objects.filter(user_id__in=user_ids).values_list('user_id', 'pk'))
+    missing = set(user_ids) - set(wallets)
+    if missing:
+        Wallet.objects.bulk_create([Wallet(user_id=user_id) for user_id in missing], ignore_conflicts=True)
+        wallets.update(Wallet.objects.filter(user_id__in=missing).values_list('user_id', 'pk'))
+    return wallets
+
+
+def lock_wallets(wallet_ids):
+    """
+    Lock wallet rows in primary key order so concurrent postings cannot deadlock
+
+    Returns:
+        dict: {wallet_id: current balance}
+    """
+    return dict(
+        Wallet.objects.select_for_update()
+        .filter(pk__in=wallet_ids)
+        .order_by('pk')
+        .values_list('pk', 'balance')
+    )
+
+
+def _user_id(user):
+    return getattr(user, 'pk', user)
+
+
+def entry(user, amount, transaction_type, description='', reference=None):
+    """
+    Build a ledger entry for post_entries
+
+    Args:
+        user: User or user id
+        amount: Signed amount (credits positive, debits negative)
+        transaction_type: e.g. 'credit', 'debit', 'payout', 'refund', 'adjustment'
+        reference: Idempotency key, unique per wallet (default: random)
+    """
+    return {
+        'user_id': _user_id(user),
+        'amount': Decimal(str(amount)).quantize(CENT),
+        'transaction_type': transaction_type,
+        'description': description,
+        'reference': reference or f'WTX-{uuid.uuid4().hex[:16].upper()}',
+    }
+
+
+def post_entries(entries):
+    """
+    Apply many ledger entries in one transaction, all or nothing
+
+    Entries whose (wallet, reference) was already posted are skipped, so
+    retrying a batch is safe. Each wallet gets one guarded UPDATE with the
+    net of its entries.
+
+    Args:
+        entries: Dicts built with entry()
+
+    Returns:
+        list: WalletTransaction objects posted (skipped entries excluded)
+
+    Raises:
+        InsufficientFunds: a wallet would go below zero; nothing is posted
+    """
+    entries = list(entries)
+    if not entries:
+        return []
+
+    with transaction.atomic():
+        wallets = _wallet_ids({e['user_id'] for e in entries})
+
+        # Drop entries already in the ledger, and repeats within the batch
+        posted = set(
+            WalletTransaction.objects.filter(
+                wallet_id__in=set(wallets.values()),
+                reference__in={e['reference'] for e in entries}
+            ).values_list('wallet_id', 'reference')
+        )
+        # Wallets hold NGN; stamp USD amounts at the posting-time rate
+        now = timezone.now()
+        usd_rate = rate_as_of('NGN', 'USD', now)
+        rows = []
+        for e in entries:
+            key = (wallets[e['user_id']], e['reference'])
+            if key in posted:
+                continue
+            posted.add(key)
+            rows.append(WalletTransaction(
+                wallet_id=key[0],
+                amount=e['amount'],
+                transaction_type=e['transaction_type'],
+                description=e['description'],
+                reference=e['reference'],
+                amount_usd=(e['amount'] * usd_rate).quantize(CENT),
+                created_at=now,
+            ))
+        if not rows:
+            return []
+
+        deltas = {}
+        for row in rows:
+            deltas[row.wallet_id] = deltas.get(row.wallet_id, Decimal('0')) + row.amount
+
+        balances = lock_wallets(sorted(deltas))
+        shortfalls = [
+            {'wallet_id': wallet_id, 'requested': -delta, 'available': balances.get(wallet_id, 0)}
+            for wallet_id, delta in deltas.items()
+            if delta < 0 and balances.get(wallet_id, 0) + delta < 0
+        ]
+        if shortfalls:
+            raise InsufficientFunds(shortfalls)
+
+        # The balance guard still holds where SELECT ... FOR UPDATE is a no-op
+        guard = Q()
+        for wallet_id, delta in deltas.items():
+            guard |= Q(pk=wallet_id, balance__gte=-delta) if delta < 0 else Q(pk=wallet_id)
+
+        updated = Wallet.objects.filter(guard).update(
+            balance=Case(*[
+                When(pk=wallet_id, then=F('balance') + delta)
+                for wallet_id, delta in deltas.items()
+            ], default=F('balance')),
+            updated_at=now
+        )
+        if updated != len(deltas):
+            current = dict(Wallet.objects.filter(pk__in=deltas).values_list('pk', 'balance'))
+            raise InsufficientFunds([
+                {'wallet_id': wallet_id, 'requested': -delta, 'available': current.get(wallet_id, 0)}
+                for wallet_id, delta in deltas.items()
+                if current.get(wallet_id, 0) + delta < 0
+            ])
+
+        WalletTransaction.objects.bulk_create(rows)
+
+    return rows
+
+
+def credit(user, amount, reference=None, description='', transaction_type='credit'):
+    """
+    Credit a wallet
+
+    Returns:
+        WalletTransaction, or None if this reference was already posted
+    """
+    rows = post_entries([entry(user, abs(Decimal(str(amount))), transaction_type, description, reference)])
+    return rows[0] if rows else None
+
+
+def debit(user, amount, reference=None, description='', transaction_type='debit'):
+    """
+    Debit a wallet if the balance covers it
+
+    Returns:
+        WalletTransaction, or None if this reference was already posted
+
+    Raises:
+        InsufficientFunds: balance too low; nothing is posted
+    """
+    rows = post_entries([entry(user, -abs(Decimal(str(amount))), transaction_type, description, reference)])
+    return rows[0] if rows else None
@@ -0,0 +1,114 @@
+# main/management/commands/backfill_fx.py
+"""
+Management command to fill USD amounts on historical records
+Run with: python manage.py backfill_fx
+Safe to rerun: only rows still missing a USD amount are touched.
+"""
+
+import time
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from main.models import Order, Payment, WalletTransaction
+from main.utils.rate_history import get_rate_history, usd_fx
+import logging
+
+logger = logging.getLogger(__name__)
+
+# name: (model, amount field, USD amount field, fx rate field or None)
+TARGETS = {
+    'orders': (Order, 'total_amount', 'total_amount_usd', 'fx_rate'),
+    'payments': (Payment, 'amount', 'amount_usd', 'fx_rate'),
+    'wallet': (WalletTransaction, 'amount', 'amount_usd', None),
+}
+
+
+class Command(BaseCommand):
+    help = 'Stamp USD amounts and FX rates on orders, payments and wallet entries that lack them'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--only',
+            choices=list(TARGETS),
+            help='Backfill one kind of record (default: all)',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='Rows updated per transaction (default: 1000)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only count the rows that would be filled',
+        )
+
+    def handle(self, *args, **options):
+        names = [options['only']] if options['only'] else list(TARGETS)
+        history = get_rate_history()
+        started = time.perf_counter()
+        totals = {}
+
+        self.stdout.write(
+            self.style.WARNING(f'\nBackfilling USD amounts ({len(history)} historical rates loaded)')
+        )
+        self.stdout.write('='*60 + '\n')
+
+        for name in names:
+            model, amount_field, usd_field, rate_field = TARGETS[name]
+            missing = model.objects.filter(**{f'{usd_field}__isnull': True})
+            count = missing.count()
+
+            if options['dry_run'] or count == 0:
+                self.stdout.write(f'  • {name}: {count} row(s) to fill')
+                totals[name] = 0
+                continue
+
+            totals[name] = self.backfill(name, missing, amount_field, usd_field, rate_field, options['chunk_size'])
+
+        # Summary
+        self.stdout.write('\n' + '='*60)
+        self.stdout.write(self.style.SUCCESS('\nBackfill Summary:'))
+        for name, filled in totals.items():
+            self.stdout.write(f'  {name.capitalize()} filled: {filled}')
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING('  Dry run: no rows were changed'))
+        self.stdout.write(f'  Time: {time.perf_counter() - started:.2f}s')
+        self.stdout.write('='*60 + '\n')
+
+    def backfill(self, name, missing, amount_field, usd_field, rate_field, chunk_size):
+        """Fill one model keyset-chunk by keyset-chunk, one bulk UPDATE per chunk"""
+        model = missing.model
+        has_currency = rate_field is not None
+        fields = ['pk', amount_field, 'created_at'] + (['currency'] if has_currency else [])
+        update_fields = [usd_field] + ([rate_field] if has_currency else [])
+        filled = 0
+        last_pk = 0
+
+        while True:
+            with transaction.atomic():
+                rows = list(
+                    missing.filter(pk__gt=last_pk).order_by('pk').values(*fields)[:chunk_size]
+                )
+                if not rows:
+                    break
+                last_pk = rows[-1]['pk']
+
+                objs = []
+                for row in rows:
+                    currency = row['currency'] if has_currency else 'NGN'
+                    rate, amount_usd = usd_fx(row[amount_field], currency, row['created_at'])
+                    obj = model(pk=row['pk'])
+                    setattr(obj, usd_field, amount_usd)
+                    if has_currency:
+                        setattr(obj, rate_field, rate)
+                    objs.append(obj)
+
+                # bulk_update is a plain UPDATE, so append-only models allow it
+                model.objects.bulk_update(objs, update_fields)
+
+            filled += len(rows)
+            self.stdout.write(f'  • {name}: {filled} row(s) filled (up to #{last_pk})')
+
+        logger.info(f"Backfilled USD amounts on {filled} {name} row(s)")
+        return filled
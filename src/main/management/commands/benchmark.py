@@ -0,0 +1,418 @@
+# main/management/commands/benchmark.py
+"""
+Performance benchmarks
+Run with: python manage.py benchmark search --products 100000
+          python manage.py benchmark webhooks --events 5000
+          python manage.py benchmark prices --prices 1000
+          python manage.py benchmark cache --keys 1000
+          python manage.py benchmark cart --actions 50
+All data is created inside a transaction that is rolled back afterwards.
+"""
+
+import random
+import statistics
+import json
+import time
+from decimal import Decimal
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from main.models import Product, Category, Order, Payout, WebhookEvent
+
+
+NAME_WORDS = [
+    'Ankara', 'Aso-Oke', 'Àdìrẹ', 'Agbada', 'Kaftan', 'Gele', 'Buba', 'Sokoto',
+    'Dashiki', 'Ofada', 'Jollof', 'Suya', 'Egusi', 'Ogbono', 'Shea', 'Kente',
+    'Leather', 'Cotton', 'Silk', 'Wireless', 'Bluetooth', 'Smart', 'Classic',
+    'Premium', 'Vintage', 'Handmade', 'Organic', 'Sneakers', 'Sandals', 'Bag',
+    'Watch', 'Headphones', 'Phone', 'Laptop', 'Charger', 'Speaker', 'Dress',
+    'Shirt', 'Trousers', 'Cap', 'Beads', 'Necklace', 'Rice', 'Spice', 'Butter',
+]
+
+DESCRIPTION_WORDS = NAME_WORDS + [
+    'quality', 'durable', 'stylish', 'lagos', 'abuja', 'accra', 'nairobi',
+    'imported', 'local', 'fabric', 'pattern', 'colour', 'black', 'red', 'gold',
+    'comfortable', 'original', 'warranty', 'delivery', 'authentic', 'market',
+]
+
+SEARCH_QUERIES = ['ankara', 'aso oke', 'adire dress', 'wireless headphones', 'leather bag', 'jollof spice', 'gold beads']
+
+
+class Command(BaseCommand):
+    help = 'Run performance benchmarks against synthetic data (rolled back afterwards)'
+
+    def add_arguments(self, parser):
+        subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+        search = subparsers.add_parser('search', help='Search index vs LIKE queries')
+        search.add_argument('--products', type=int, default=100000, help='Catalogue size (default: 100000)')
+        search.add_argument('--repeat', type=int, default=5, help='Runs per query (default: 5)')
+
+        webhooks = subparsers.add_parser('webhooks', help='Webhook ingestion and processing throughput')
+        webhooks.add_argument('--events', type=int, default=5000, help='Deliveries to send (default: 5000)')
+        webhooks.add_argument('--duplicates', type=float, default=0.2,
+                              help='Fraction of deliveries that are redeliveries (default: 0.2)')
+        webhooks.add_argument('--batch-size', type=int, default=100, help='Worker batch size (default: 100)')
+        webhooks.add_argument('--target-rate', type=int, default=500, help='Events/s to sustain (default: 500)')
+
+        prices = subparsers.add_parser('prices', help='Template render with many converted prices')
+        prices.add_argument('--prices', type=int, default=1000, help='Prices in the template (default: 1000)')
+        prices.add_argument('--currency', default='USD', help='Visitor currency (default: USD)')
+        prices.add_argument('--repeat', type=int, default=20, help='Renders per variant (default: 20)')
+
+        cache_bench = subparsers.add_parser('cache', help='Cache hit latency per tier')
+        cache_bench.add_argument('--keys', type=int, default=1000, help='Keys read per pass (default: 1000)')
+        cache_bench.add_argument('--repeat', type=int, default=5, help='Passes per tier (default: 5)')
+        cache_bench.add_argument('--redis-url', help='Also measure Redis at this URL')
+
+        cart = subparsers.add_parser('cart', help='Session and cart table reads/writes per cart action')
+        cart.add_argument('--actions', type=int, default=50, help='Cart actions per mode (default: 50)')
+
+    def handle(self, *args, **options):
+        handler = getattr(self, f"bench_{options['benchmark'].replace('-', '_')}")
+
+        with transaction.atomic():
+            handler(options)
+            transaction.set_rollback(True)
+
+    # ------------------------------------------------------------------
+    # Helpers
+    # ------------------------------------------------------------------
+
+    def timed(self, func, repeat):
+        """Run func repeat times, return (median ms, last result)"""
+        timings = []
+        result = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            result = func()
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings), result
+
+    def create_catalogue(self, count):
+        rng = random.Random(42)
+        categories = Category.objects.bulk_create(
+            [Category(name=name) for name in ['Fashion', 'Food', 'Electronics', 'Accessories']]
+        )
+        # Pad the vocabulary with pseudo-words drawn on a Zipf curve so term
+        # frequencies look like a real catalogue rather than 60 repeated words
+        syllables = ['ba', 'ko', 'la', 'mi', 'nu', 'ra', 'se', 'ti', 'wo', 'yo', 'de', 'fu']
+        vocabulary = DESCRIPTION_WORDS + [
+            ''.join(rng.choices(syllables, k=rng.randint(2, 4))) for _ in range(5000)
+        ]
+        rng.shuffle(vocabulary)
+        weights = [1 / (rank + 1) for rank in range(len(vocabulary))]
+
+        batch = []
+        for i in range(count):
+            batch.append(Product(
+                name=' '.join(rng.sample(NAME_WORDS, 2) + rng.choices(vocabulary, weights, k=2)),
+                description=' '.join(rng.choices(vocabulary, weights, k=30)),
+                price=Decimal(rng.randint(500, 500000)),
+                stock=rng.randint(0, 50),
+                category=rng.choice(categories),
+            ))
+            if len(batch) == 5000:
+                Product.objects.bulk_create(batch)
+                batch = []
+        if batch:
+            Product.objects.bulk_create(batch)
+
+    # ------------------------------------------------------------------
+    # Benchmarks
+    # ------------------------------------------------------------------
+
+    def bench_search(self, options):
+        from main.search.backends import InvertedIndexBackend, SQLiteFTSBackend
+
+        count = options['products']
+        repeat = options['repeat']
+
+        self.stdout.write(self.style.WARNING(f'\nCreating {count} synthetic products...'))
+        self.create_catalogue(count)
+
+        backends = [InvertedIndexBackend()]
+        if SQLiteFTSBackend().is_available():
+            backends.append(SQLiteFTSBackend())
+
+        for backend in backends:
+            started = time.perf_counter()
+            backend.rebuild(Product.objects.order_by('pk'))
+            self.stdout.write(f'  Built {backend.name} index in {time.perf_counter() - started:.2f}s')
+
+        self.stdout.write('\n' + '='*60)
+        header = f'{"query":<22}{"LIKE ms":>10}' + ''.join(f'{b.name + " ms":>12}' for b in backends)
+        self.stdout.write(header)
+
+        for query in SEARCH_QUERIES:
+            like = lambda: list(
+                Product.objects.filter(
+                    Q(name__icontains=query) | Q(description__icontains=query)
+                ).values_list('pk', flat=True)
+            )
+            like_ms, _ = self.timed(like, repeat)
+            row = f'{query:<22}{like_ms:>10.1f}'
+            for backend in backends:
+                backend_ms, _ = self.timed(lambda: backend.search(query, limit=1000), repeat)
+                row += f'{backend_ms:>12.1f}'
+            self.stdout.write(row)
+
+        self.stdout.write('='*60 + '\n')
+
+    def bench_webhooks(self, options):
+        from django.test import RequestFactory
+        from django.test.utils import override_settings
+        from main.views import verify_payment_webhook
+        from main.webhooks import process_events
+
+        count = options['events']
+        rng = random.Random(42)
+
+        self.stdout.write(self.style.WARNING(f'\nCreating {count} unpaid orders...'))
+        buyer = User.objects.create(username='bench-buyer')
+        sellers = User.objects.bulk_create([User(username=f'bench-seller-{i}') for i in range(20)])
+        orders = Order.objects.bulk_create([
+            Order(buyer=buyer, seller=rng.choice(sellers), total_amount=Decimal(rng.randint(1000, 90000)),
+                  shipping_address='Bench Street')
+            for _ in range(count)
+        ])
+
+        # Build the delivery stream: each order once, plus redeliveries
+        bodies = []
+        for i, order in enumerate(orders):
+            bodies.append(json.dumps({
+                'event': 'charge.completed',
+                'data': {'id': 900000 + order.pk, 'tx_ref': f'ORDER-{order.pk}-1700000000',
+                         'status': 'successful', 'amount': str(order.total_amount), 'currency': 'NGN'},
+            }).encode())
+        redeliveries = int(count * options['duplicates'])
+        bodies = bodies[:count - redeliveries]
+        bodies += rng.choices(bodies, k=redeliveries)
+        rng.shuffle(bodies)
+
+        factory = RequestFactory()
+        secret = 'bench-secret'
+        latencies = []
+
+        with override_settings(FLUTTERWAVE_WEBHOOK_SECRET=secret):
+            started = time.perf_counter()
+            for body in bodies:
+                request = factory.post('/payment/webhook/', data=body, content_type='application/json',
+                                       HTTP_VERIF_HASH=secret)
+                request_started = time.perf_counter()
+                response = verify_payment_webhook(request)
+                latencies.append((time.perf_counter() - request_started) * 1000)
+                assert response.status_code == 200
+            ingest_seconds = time.perf_counter() - started
+
+        stored = WebhookEvent.objects.count()
+
+        started = time.perf_counter()
+        processed = 0
+        while True:
+            results = process_events(options['batch_size'])
+            if not any(results.values()):
+                break
+            processed += results['processed']
+        process_seconds = time.perf_counter() - started
+
+        paid = Order.objects.filter(payment_status='paid').count()
+        payouts = Payout.objects.count()
+
+        latencies.sort()
+        ingest_rate = len(bodies) / ingest_seconds
+        process_rate = processed / process_seconds if process_seconds else 0
+        target = options['target_rate']
+
+        self.stdout.write('\n' + '='*60)
+        self.stdout.write(f'Deliveries sent:        {len(bodies)} ({redeliveries} redeliveries)')
+        self.stdout.write(f'Events stored:          {stored}')
+        self.stdout.write(f'Ack latency p50 / p99:  {latencies[len(latencies) // 2]:.2f} / '
+                          f'{latencies[int(len(latencies) * 0.99)]:.2f} ms')
+        self.stdout.write(f'Ingestion (1 worker):   {ingest_rate:,.0f} events/s')
+        self.stdout.write(f'Processing:             {process_rate:,.0f} events/s '
+                          f'(batch size {options["batch_size"]})')
+        self.stdout.write(f'Orders paid / payouts:  {paid} / {payouts}')
+
+        for label, rate in (('Ingestion', ingest_rate), ('Processing', process_rate)):
+            if rate >= target:
+                self.stdout.write(self.style.SUCCESS(f'✓ {label} sustains {target} events/s'))
+            else:
+                self.stdout.write(self.style.ERROR(f'✗ {label} below {target} events/s'))
+        if paid == payouts == stored:
+            self.stdout.write(self.style.SUCCESS('✓ Every event applied exactly once'))
+        else:
+            self.stdout.write(self.style.ERROR('✗ Paid orders, payouts and stored events disagree'))
+        self.stdout.write('='*60 + '\n')
+
+    def bench_prices(self, options):
+        from django import template
+        from django.template import engines
+        from django.test import RequestFactory
+        from main.utils.currency import convert_price_to_user_currency
+
+        count = options['prices']
+        rng = random.Random(42)
+        amounts = [Decimal(rng.randint(100, 5000000)) / 100 for _ in range(count)]
+
+        # The tag as it was: every price resolves the currency and rate again
+        legacy = template.Library()
+
+        @legacy.simple_tag(takes_context=True)
+        def legacy_format_price(context, price, original_currency='NGN'):
+            return convert_price_to_user_currency(price, original_currency, context.get('request'))['formatted']
+
+        engine = engines['django'].engine
+        engine.template_libraries['legacy_currency_tags'] = legacy
+
+        variants = [
+            ('Per-price lookup (before)',
+             '{% load legacy_currency_tags %}{% for p in amounts %}{% legacy_format_price p %} {% endfor %}'),
+            ('format_price, per-render converter',
+             '{% load currency_tags %}{% for p in amounts %}{% format_price p %} {% endfor %}'),
+            ('{% prices %} block',
+             '{% load currency_tags %}{% prices amounts as priced %}'
+             '{% for p, price in priced %}{{ price }} {% endfor %}{% endprices %}'),
+        ]
+
+        factory = RequestFactory()
+        self.stdout.write(
+            self.style.WARNING(f"\nRendering {count} prices in {options['currency']} "
+                               f"(median of {options['repeat']} renders)")
+        )
+        self.stdout.write('='*60)
+
+        outputs = []
+        baseline = None
+        try:
+            for label, source in variants:
+                tpl = engine.from_string(source)
+
+                def render():
+                    request = factory.get('/')
+                    request.COOKIES['currency'] = options['currency']
+                    return tpl.render(template.Context({'amounts': amounts, 'request': request}))
+
+                ms, output = self.timed(render, options['repeat'])
+                outputs.append(output.split())
+                baseline = baseline or ms
+                self.stdout.write(f'{label:<38} {ms:8.2f} ms  ({baseline / ms:4.1f}x)')
+        finally:
+            del engine.template_libraries['legacy_currency_tags']
+
+        if all(output == outputs[0] for output in outputs):
+            self.stdout.write(self.style.SUCCESS('✓ All variants render the same prices'))
+        else:
+            self.stdout.write(self.style.ERROR('✗ Variants render different prices'))
+        self.stdout.write('='*60 + '\n')
+
+    def bench_cache(self, options):
+        import os
+        import tempfile
+        from django.core.cache import caches
+        from django.test import override_settings
+
+        count = options['keys']
+        keys = [f'bench:{i}' for i in range(count)]
+        value = {'rate': Decimal('1425.07'), 'currency': 'NGN', 'ids': list(range(20))}
+        location = os.path.join(tempfile.mkdtemp(), 'bench-cache.sqlite3')
+
+        size = {'MAX_ENTRIES': count * 2}
+        tiers = {
+            'locmem': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'bench',
+                       'OPTIONS': size},
+            'sqlite': {'BACKEND': 'main.cache_backends.SQLiteCache', 'LOCATION': location, 'OPTIONS': size},
+        }
+        if options['redis_url']:
+            tiers['redis'] = {'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+                              'LOCATION': options['redis_url']}
+        shared = 'redis' if 'redis' in tiers else 'sqlite'
+        tiers['tiered (L1 hit)'] = {'BACKEND': 'main.cache_backends.TieredCache',
+                                    'OPTIONS': {'L2': shared, 'L1_TIMEOUT': 300, 'L1_MAX_ENTRIES': count * 2}}
+        tiers['tiered (L1 miss)'] = {'BACKEND': 'main.cache_backends.TieredCache',
+                                     'OPTIONS': {'L2': shared, 'L1_TIMEOUT': 0}}
+
+        self.stdout.write(
+            self.style.WARNING(f"\nCache hit latency, {count} keys (median of {options['repeat']} passes)")
+        )
+        self.stdout.write('='*60)
+        self.stdout.write(f"{'Tier':<20} {'get':>12} {'get_many':>14}")
+
+        with override_settings(CACHES={'default': tiers['locmem'], **tiers}):
+            for name in tiers:
+                cache = caches[name]
+                try:
+                    cache.set_many({key: value for key in keys}, 300)
+                    cache.get_many(keys)  # warm L1
+
+                    def get_each():
+                        return sum(cache.get(key) is not None for key in keys)
+
+                    def get_batched():
+                        return len(cache.get_many(keys))
+
+                    get_ms, hits = self.timed(get_each, options['repeat'])
+                    many_ms, _ = self.timed(get_batched, options['repeat'])
+                except Exception as e:
+                    self.stdout.write(self.style.ERROR(f'{name:<20} unavailable: {str(e)}'))
+                    continue
+
+                marker = '' if hits == count else self.style.ERROR(f'  ({hits} hits)')
+                self.stdout.write(
+                    f'{name:<20} {get_ms * 1000 / count:9.2f} µs {many_ms * 1000 / count:11.2f} µs{marker}'
+                )
+                cache.delete_many(keys)
+            caches['sqlite'].clear()
+
+        os.remove(location)
+        self.stdout.write('  (per key; get_many is one call for all keys)')
+        self.stdout.write('='*60 + '\n')
+
+    def bench_cart(self, options):
+        from django.db import connection
+        from django.test import Client, override_settings
+        from django.test.utils import CaptureQueriesContext
+        from django.urls import reverse
+
+        seller = User.objects.create(username='bench-cart-seller')
+        products = Product.objects.bulk_create([
+            Product(name=f'Cart bench {i}', description='x', price=Decimal(1000), stock=1000, seller=seller)
+            for i in range(10)
+        ])
+        count = options['actions']
+
+        modes = [
+            ('session, db sessions', 'session', 'django.contrib.sessions.backends.db'),
+            ('session, cached_db sessions', 'session', 'django.contrib.sessions.backends.cached_db'),
+            ('signed cookie', 'cookie', 'django.contrib.sessions.backends.cached_db'),
+            ('database cart', 'db', 'django.contrib.sessions.backends.cached_db'),
+        ]
+
+        self.stdout.write(self.style.WARNING(f'\nSession and cart table queries for {count} cart actions (+ a page view each)'))
+        self.stdout.write('='*60)
+        self.stdout.write(f"{'Mode':<30} {'session w/r':>12} {'cart w/r':>10}")
+
+        for label, storage, engine in modes:
+            with override_settings(CART_STORAGE=storage, SESSION_ENGINE=engine, ALLOWED_HOSTS=['*']):
+                client = Client()
+                quantities = {}
+                with CaptureQueriesContext(connection) as queries:
+                    for i in range(count):
+                        product = products[i % len(products)]
+                        if i % 3 == 2 and product.pk in quantities:
+                            # Re-submitting the same quantity changes nothing
+                            client.post(reverse('update_cart', args=[product.pk]), {'quantity': quantities[product.pk]})
+                        else:
+                            client.post(reverse('add_to_cart', args=[product.pk]), {'quantity': 1})
+                            quantities[product.pk] = quantities.get(product.pk, 0) + 1
+                        client.get(reverse('home'))
+
+            counts = []
+            for table in ('django_session', 'main_cart'):
+                table_sql = [q['sql'] for q in queries if table in q['sql']]
+                reads = sum(sql.startswith('SELECT') for sql in table_sql)
+                counts.append(f'{len(table_sql) - reads}/{reads}')
+            self.stdout.write(f'{label:<30} {counts[0]:>12} {counts[1]:>10}')
+
+        self.stdout.write('='*60 + '\n')
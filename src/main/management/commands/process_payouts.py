@@ -0,0 +1,87 @@
+# main/management/commands/process_payouts.py
+"""
+Management command to execute queued seller payouts
+Run with: python manage.py process_payouts
+Or keep it running: python manage.py process_payouts --loop
+"""
+
+import time
+from django.core.management.base import BaseCommand
+from main.payouts import process_payouts
+
+
+class Command(BaseCommand):
+    help = 'Execute queued seller payouts (bank transfer or wallet credit)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=50,
+            help='Payouts claimed per batch (default: 50)',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=8,
+            help='Concurrent transfer API calls (default: 8)',
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep polling for new payouts instead of exiting when the queue is empty',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=5,
+            help='Seconds to sleep between polls when the queue is empty (default: 5)',
+        )
+
+    def handle(self, *args, **options):
+        totals = {'paid': 0, 'wallet': 0, 'retry': 0, 'failed': 0}
+
+        try:
+            while True:
+                results = process_payouts(options['batch_size'], options['workers'])
+                processed = sum(results.values())
+
+                for key, count in results.items():
+                    totals[key] += count
+
+                if processed:
+                    self.stdout.write(
+                        f"  • Batch: {results['paid']} transferred, {results['wallet']} to wallet, "
+                        f"{results['retry']} retrying, {results['failed']} failed"
+                    )
+                    continue
+
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+
+        if not any(totals.values()):
+            self.stdout.write(
+                self.style.SUCCESS('✓ No payouts due')
+            )
+            return
+
+        self.stdout.write('\n' + '='*60)
+        self.stdout.write(self.style.SUCCESS('\nPayout Summary:'))
+        self.stdout.write(
+            self.style.SUCCESS(f"  Bank transfers: {totals['paid']}")
+        )
+        self.stdout.write(
+            self.style.SUCCESS(f"  Wallet credits: {totals['wallet']}")
+        )
+        if totals['retry']:
+            self.stdout.write(
+                self.style.WARNING(f"  Scheduled for retry: {totals['retry']}")
+            )
+        if totals['failed']:
+            self.stdout.write(
+                self.style.ERROR(f"  Failed: {totals['failed']}")
+            )
+        self.stdout.write('='*60 + '\n')
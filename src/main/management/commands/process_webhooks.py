@@ -0,0 +1,70 @@
+# main/management/commands/process_webhooks.py
+"""
+Management command to apply stored Flutterwave webhook events
+Run with: python manage.py process_webhooks
+Or keep it running: python manage.py process_webhooks --loop
+"""
+
+import time
+from django.core.management.base import BaseCommand
+from main.webhooks import process_events
+
+
+class Command(BaseCommand):
+    help = 'Apply pending Flutterwave webhook events from the inbox'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=100,
+            help='Events applied per transaction (default: 100)',
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep polling for new events instead of exiting when the inbox is empty',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=1,
+            help='Seconds to sleep between polls when the inbox is empty (default: 1)',
+        )
+
+    def handle(self, *args, **options):
+        totals = {'processed': 0, 'ignored': 0, 'failed': 0}
+        started = time.perf_counter()
+
+        try:
+            while True:
+                results = process_events(options['batch_size'])
+                for key, count in results.items():
+                    totals[key] += count
+
+                if any(results.values()):
+                    continue
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+
+        if not any(totals.values()):
+            self.stdout.write(
+                self.style.SUCCESS('✓ No pending webhook events')
+            )
+            return
+
+        self.stdout.write('\n' + '='*60)
+        self.stdout.write(self.style.SUCCESS('\nWebhook Summary:'))
+        self.stdout.write(
+            self.style.SUCCESS(f"  Processed: {totals['processed']}")
+        )
+        self.stdout.write(f"  Ignored: {totals['ignored']}")
+        if totals['failed']:
+            self.stdout.write(
+                self.style.ERROR(f"  Failed: {totals['failed']} (see: python manage.py replay_webhooks --list)")
+            )
+        self.stdout.write(f'  Time: {time.perf_counter() - started:.2f}s')
+        self.stdout.write('='*60 + '\n')
@@ -0,0 +1,39 @@
+# main/management/commands/prune_carts.py
+"""
+Management command to delete abandoned anonymous carts
+Run with: python manage.py prune_carts
+Or set up as cron job to run daily
+"""
+
+import time
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from main.cart import delete_expired_carts
+
+
+class Command(BaseCommand):
+    help = 'Delete anonymous database carts whose cart cookie has expired'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='Carts deleted per transaction (default: 1000)',
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        deleted = delete_expired_carts(timezone.now(), chunk_size=options['chunk_size'])
+
+        if not deleted:
+            self.stdout.write(
+                self.style.SUCCESS('✓ No expired anonymous carts')
+            )
+            return
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'✓ Deleted {deleted} expired anonymous cart(s) in {time.perf_counter() - started:.2f}s'
+            )
+        )
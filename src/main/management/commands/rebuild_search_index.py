@@ -0,0 +1,48 @@
+# main/management/commands/rebuild_search_index.py
+"""
+Management command to rebuild the product search index
+Run with: python manage.py rebuild_search_index
+"""
+
+import time
+from django.core.management.base import BaseCommand
+from main.models import Product
+from main.search.backends import get_backend, BACKENDS
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the product search index in bulk'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--backend',
+            choices=['auto'] + list(BACKENDS),
+            default=None,
+            help='Backend to rebuild (default: settings.PRODUCT_SEARCH_BACKEND)',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=2000,
+            help='Products indexed per batch (default: 2000)',
+        )
+
+    def handle(self, *args, **options):
+        backend = get_backend(options['backend'])
+
+        self.stdout.write(
+            self.style.WARNING(f'\nRebuilding search index ({backend.name} backend)')
+        )
+        self.stdout.write('='*60 + '\n')
+
+        started = time.perf_counter()
+        count = backend.rebuild(
+            Product.objects.order_by('pk'),
+            chunk_size=options['chunk_size']
+        )
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(
+            self.style.SUCCESS(f'\n✓ Indexed {count} products in {elapsed:.2f}s')
+        )
+        self.stdout.write('='*60 + '\n')
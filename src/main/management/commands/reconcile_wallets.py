@@ -0,0 +1,165 @@
+# main/management/commands/reconcile_wallets.py
+"""
+Management command to check wallet balances against the ledger
+Run with: python manage.py reconcile_wallets
+Or set up as cron job to run daily
+
+Balances from before the ledger are carried by one OPENING-<wallet id>
+entry (posted by migration 0014, or by --opening-balances for wallets
+that predate it). Only wallets created before 0014 was applied can have
+a legacy balance: --fix resets them only once they have that entry, and
+resets every newer wallet to its ledger total.
+"""
+
+from decimal import Decimal
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.migrations.recorder import MigrationRecorder
+from django.db.models import Sum
+from main.models import Wallet, WalletTransaction
+from main.ledger import lock_wallets
+from main.utils.rate_history import rate_as_of
+import logging
+
+logger = logging.getLogger(__name__)
+
+LEDGER_MIGRATION = '0014_wallet_opening_balances'
+
+
+def ledger_cutover():
+    """When the ledger took over (migration 0014 applied), None if unknown"""
+    return (
+        MigrationRecorder(connection).migration_qs
+        .filter(app='main', name=LEDGER_MIGRATION)
+        .values_list('applied', flat=True)
+        .first()
+    )
+
+
+class Command(BaseCommand):
+    help = 'Recompute wallet balances from the WalletTransaction ledger and report mismatches'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fix',
+            action='store_true',
+            help='Set mismatched balances to the ledger total (pre-ledger wallets need an opening entry)',
+        )
+        parser.add_argument(
+            '--opening-balances',
+            action='store_true',
+            help='Post an opening entry for the legacy part of pre-ledger wallets that have none',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='Wallets checked per query (default: 1000)',
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        checked = 0
+        mismatched = 0
+        fixed = 0
+        refused = 0
+        opened = 0
+        last_pk = 0
+        usd_rate = rate_as_of('NGN', 'USD')
+        cutover = ledger_cutover()
+
+        self.stdout.write(self.style.WARNING('\nReconciling wallets against the ledger...'))
+
+        # Keyset over wallet pks so memory stays flat however many wallets exist
+        while True:
+            with transaction.atomic():
+                wallet_ids = list(
+                    Wallet.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:chunk_size]
+                )
+                if not wallet_ids:
+                    break
+                last_pk = wallet_ids[-1]
+
+                # Lock the chunk so postings can't land between the two reads
+                balances = lock_wallets(wallet_ids) if options['fix'] or options['opening_balances'] else dict(
+                    Wallet.objects.filter(pk__in=wallet_ids).values_list('pk', 'balance')
+                )
+                totals = dict(
+                    WalletTransaction.objects.filter(wallet_id__in=wallet_ids)
+                    .values('wallet_id')
+                    .annotate(total=Sum('amount'))
+                    .values_list('wallet_id', 'total')
+                )
+                has_opening = set(
+                    WalletTransaction.objects.filter(wallet_id__in=wallet_ids, reference__startswith='OPENING-')
+                    .values_list('wallet_id', flat=True)
+                )
+                # Newer wallets only ever moved through the ledger
+                pre_ledger = set(wallet_ids) if cutover is None else set(
+                    Wallet.objects.filter(pk__in=wallet_ids, created_at__lt=cutover).values_list('pk', flat=True)
+                )
+                needs_opening = pre_ledger - has_opening
+
+                openings = []
+                for wallet_id, balance in balances.items():
+                    checked += 1
+                    ledger_total = totals.get(wallet_id) or Decimal('0')
+                    legacy = balance - ledger_total
+                    if wallet_id in needs_opening and legacy and options['opening_balances']:
+                        openings.append(WalletTransaction(
+                            wallet_id=wallet_id,
+                            amount=legacy,
+                            transaction_type='adjustment',
+                            description='Opening balance',
+                            reference=f'OPENING-{wallet_id}',
+                            amount_usd=(legacy * usd_rate).quantize(Decimal('0.01')),
+                        ))
+                        opened += 1
+                        continue
+
+                    if ledger_total == balance:
+                        continue
+
+                    mismatched += 1
+                    self.stdout.write(
+                        self.style.ERROR(
+                            f'  ✗ Wallet {wallet_id}: balance ₦{balance:,.2f}, ledger ₦{ledger_total:,.2f} '
+                            f'(difference ₦{balance - ledger_total:,.2f})'
+                        )
+                    )
+                    logger.warning(f"Wallet {wallet_id} balance {balance} differs from ledger {ledger_total}")
+
+                    if options['fix']:
+                        if wallet_id in needs_opening:
+                            # Resetting would wipe the pre-ledger balance
+                            refused += 1
+                            self.stdout.write(
+                                self.style.WARNING(f'    Not fixed: wallet {wallet_id} has no opening entry')
+                            )
+                            continue
+                        Wallet.objects.filter(pk=wallet_id).update(balance=ledger_total)
+                        fixed += 1
+
+                if openings:
+                    WalletTransaction.objects.bulk_create(openings, ignore_conflicts=True)
+
+        # Summary
+        self.stdout.write('\n' + '='*60)
+        self.stdout.write(self.style.SUCCESS('\nReconciliation Summary:'))
+        self.stdout.write(f'  Wallets checked: {checked}')
+        if opened:
+            self.stdout.write(f'  Opening entries posted: {opened}')
+        if mismatched:
+            self.stdout.write(self.style.ERROR(f'  Mismatched: {mismatched}'))
+            if options['fix']:
+                self.stdout.write(self.style.SUCCESS(f'  Reset to ledger total: {fixed}'))
+                if refused:
+                    self.stdout.write(
+                        self.style.WARNING(
+                            f'  Skipped without an opening entry: {refused} '
+                            f'(check them, then run --opening-balances)'
+                        )
+                    )
+        else:
+            self.stdout.write(self.style.SUCCESS('  ✓ All balances match the ledger'))
+        self.stdout.write('='*60 + '\n')
@@ -0,0 +1,56 @@
+# main/management/commands/refresh_related_products.py
+"""
+Management command to refresh precomputed related products
+Run with: python manage.py refresh_related_products
+Or set up as cron job to run hourly
+"""
+
+import time
+from django.core.management.base import BaseCommand
+from main.models import Product
+from main.recommendations import refresh_neighbours, stale_product_ids
+
+
+class Command(BaseCommand):
+    help = 'Refresh related-product neighbour lists from categories and co-purchases'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Recompute every product instead of only changed ones',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=500,
+            help='Products computed per batch (default: 500)',
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+
+        if options['full']:
+            product_ids = list(Product.objects.order_by('pk').values_list('pk', flat=True))
+            mode = 'full'
+        else:
+            product_ids = sorted(stale_product_ids())
+            mode = 'incremental'
+
+        if not product_ids:
+            self.stdout.write(
+                self.style.SUCCESS('✓ Related products are up to date')
+            )
+            return
+
+        self.stdout.write(
+            self.style.WARNING(f'\nRefreshing related products ({mode}): {len(product_ids)} product(s)')
+        )
+
+        refreshed = refresh_neighbours(product_ids, chunk_size=options['chunk_size'])
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'✓ Refreshed {refreshed} neighbour list(s) in {time.perf_counter() - started:.2f}s'
+            )
+        )
@@ -0,0 +1,84 @@
+# main/management/commands/replay_webhooks.py
+"""
+Management command to replay failed Flutterwave webhook events
+Run with: python manage.py replay_webhooks --list
+          python manage.py replay_webhooks --all-failed --process
+"""
+
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from main.models import WebhookEvent
+from main.webhooks import process_events, replay_events
+
+
+class Command(BaseCommand):
+    help = 'List or replay failed Flutterwave webhook events'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'event_ids',
+            nargs='*',
+            type=int,
+            help='WebhookEvent ids to replay (any status except processing)',
+        )
+        parser.add_argument(
+            '--all-failed',
+            action='store_true',
+            help='Replay every failed event',
+        )
+        parser.add_argument(
+            '--hours',
+            type=int,
+            help='Only failed events received in the last N hours',
+        )
+        parser.add_argument(
+            '--list',
+            action='store_true',
+            help='Only list failed events',
+        )
+        parser.add_argument(
+            '--process',
+            action='store_true',
+            help='Apply the replayed events now instead of leaving them for process_webhooks',
+        )
+
+    def handle(self, *args, **options):
+        failed = WebhookEvent.objects.filter(status='failed')
+        if options['hours']:
+            failed = failed.filter(received_at__gte=timezone.now() - timedelta(hours=options['hours']))
+
+        if options['list']:
+            events = list(failed.order_by('received_at')[:100])
+            if not events:
+                self.stdout.write(self.style.SUCCESS('✓ No failed webhook events'))
+                return
+            self.stdout.write(self.style.WARNING(f'\nFailed webhook events ({failed.count()}):'))
+            for event in events:
+                self.stdout.write(
+                    f'  • #{event.pk} {event.event_type} {event.transaction_id} '
+                    f'({event.attempts} attempt(s)): {event.last_error}'
+                )
+            return
+
+        if options['event_ids']:
+            queryset = WebhookEvent.objects.filter(pk__in=options['event_ids'])
+        elif options['all_failed'] or options['hours']:
+            queryset = failed
+        else:
+            raise CommandError('Give event ids, --all-failed or --hours (or --list to inspect)')
+
+        replayed = replay_events(queryset)
+        self.stdout.write(self.style.SUCCESS(f'✓ Queued {replayed} event(s) for replay'))
+
+        if options['process'] and replayed:
+            totals = {'processed': 0, 'ignored': 0, 'failed': 0}
+            while True:
+                results = process_events()
+                if not any(results.values()):
+                    break
+                for key, count in results.items():
+                    totals[key] += count
+            self.stdout.write(
+                f"  Processed: {totals['processed']}, ignored: {totals['ignored']}, failed: {totals['failed']}"
+            )
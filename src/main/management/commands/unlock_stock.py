@@ -1,12 +1,21 @@
-# main/management/commands/unlock_unpaid_orders.py
-# Run with: python manage.py unlock_unpaid_orders
+# main/management/commands/unlock_stock.py
+# Run with: python manage.py unlock_stock
 # Or set up as cron job to run daily
+# Several copies may run at once; each claims different orders.
 
+import time
+from django.core.mail import get_connection
 from django.core.management.base import BaseCommand
+from django.db.models import Count, Sum
 from django.utils import timezone
-from django.db import transaction
-from datetime import timedelta
-from main.models import Order, OrderItem, Product
+from main.models import Order, OrderItem
+from main.orders import stale_orders, release_stale_orders
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Above this many orders, print one line per chunk instead of per order
+SUMMARY_THRESHOLD = 50
 
 
 class Command(BaseCommand):
@@ -24,208 +33,174 @@ class Command(BaseCommand):
             action='store_true',
             help='Show what would be unlocked without actually unlocking stock',
         )
+        parser.add_argument(
+            '--status',
+            choices=['pending', 'processing', 'all'],
+            default='pending',
+            help='Order status to process (default: pending)',
+        )
+        parser.add_argument(
+            '--payment-status',
+            choices=['pending', 'failed', 'all'],
+            default='pending',
+            help='Payment status to process; paid orders are never touched (default: pending)',
+        )
+        parser.add_argument(
+            '--action',
+            choices=['unlock', 'cancel', 'both'],
+            default='unlock',
+            help='Action to take: unlock stock, cancel order, or both (default: unlock)',
+        )
         parser.add_argument(
             '--cancel-orders',
             action='store_true',
-            help='Also cancel the orders (mark as cancelled)',
+            help='Also cancel the orders (same as --action both)',
+        )
+        parser.add_argument(
+            '--send-email',
+            action='store_true',
+            help='Send a cancellation email to buyers of cancelled orders',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=500,
+            help='Orders processed per transaction (default: 500)',
         )
 
     def handle(self, *args, **options):
         hours = options['hours']
         dry_run = options['dry_run']
-        cancel_orders = options['cancel_orders']
-        
+        action = 'both' if options['cancel_orders'] else options['action']
+
         now = timezone.now()
-        cutoff_time = now - timedelta(hours=hours)
-        
-        # Find unpaid orders older than cutoff time
-        unpaid_orders = Order.objects.filter(
-            payment_status='pending',
-            created_at__lt=cutoff_time,
-            status='pending'
-        ).prefetch_related('items__product')
-        
-        total_count = unpaid_orders.count()
-        
+        orders = stale_orders(hours, options['status'], options['payment_status'], action, now)
+
+        total_count = orders.count()
+
         if total_count == 0:
             self.stdout.write(
                 self.style.SUCCESS(f'✓ No unpaid orders older than {hours} hours found')
             )
             return
-        
+
         self.stdout.write(
             self.style.WARNING(f'\nFound {total_count} unpaid order(s) older than {hours} hours')
         )
-        
+
         if dry_run:
-            self.stdout.write(
-                self.style.WARNING('\n--- DRY RUN MODE (No changes will be made) ---\n')
-            )
-        
-        total_items_unlocked = 0
+            self.preview(orders, action, total_count)
+            return
+
+        summary = total_count > SUMMARY_THRESHOLD
+        started = time.perf_counter()
+        released_orders = 0
+        cancelled_orders = 0
+        products_restocked = set()
         total_stock_unlocked = 0
-        orders_processed = 0
+        emails_sent = 0
         errors = 0
-        
-        for order in unpaid_orders:
-            hours_old = (now - order.created_at).total_seconds() / 3600
-            
-            self.stdout.write(f'\n{"[DRY RUN] " if dry_run else ""}Processing Order #{order.id}:')
-            self.stdout.write(f'  • Buyer: {order.buyer.username}')
-            self.stdout.write(f'  • Created: {order.created_at.strftime("%Y-%m-%d %H:%M")}')
-            self.stdout.write(f'  • Hours old: {hours_old:.1f}')
-            self.stdout.write(f'  • Total: ₦{order.total_amount:,.2f}')
-            self.stdout.write(f'  • Items: {order.items.count()}')
-            
-            if dry_run:
-                # Just show what would be done
-                for item in order.items.all():
-                    self.stdout.write(
-                        f'    - Would unlock {item.quantity} × {item.product.name} '
-                        f'(Current stock: {item.product.stock})'
-                    )
-                    total_items_unlocked += 1
-                    total_stock_unlocked += item.quantity
-                
-                if cancel_orders:
+
+        try:
+            for result in release_stale_orders(
+                hours, options['status'], options['payment_status'], action,
+                chunk_size=options['chunk_size'], now=now
+            ):
+                released_orders += len(result['released_order_ids'])
+                cancelled_orders += len(result['cancelled_order_ids'])
+                products_restocked.update(result['units'])
+                total_stock_unlocked += sum(result['units'].values())
+
+                if summary:
                     self.stdout.write(
-                        self.style.WARNING('    - Would cancel order')
+                        f"  • Chunk: {len(result['order_ids'])} order(s), "
+                        f"{sum(result['units'].values())} unit(s) returned to {len(result['units'])} product(s)"
                     )
-                
-                orders_processed += 1
-                continue
-            
-            # Actually process the order
-            try:
-                with transaction.atomic():
-                    # Unlock stock for each item
-                    for item in order.items.all():
-                        product = item.product
-                        old_stock = product.stock
-                        product.stock += item.quantity
-                        product.save()
-                        
+                else:
+                    for order_id in result['order_ids']:
+                        done = []
+                        if order_id in result['released_order_ids']:
+                            done.append('stock unlocked')
+                        if order_id in result['cancelled_order_ids']:
+                            done.append('cancelled')
                         self.stdout.write(
-                            self.style.SUCCESS(
-                                f'    ✓ Unlocked {item.quantity} × {product.name} '
-                                f'(Stock: {old_stock} → {product.stock})'
-                            )
+                            self.style.SUCCESS(f"  ✓ Order #{order_id}: {', '.join(done)}")
                         )
-                        
-                        total_items_unlocked += 1
-                        total_stock_unlocked += item.quantity
-                    
-                    # Optionally cancel the order
-                    if cancel_orders:
-                        order.status = 'cancelled'
-                        order.payment_status = 'failed'
-                        order.save()
-                        self.stdout.write(
-                            self.style.WARNING('    ✓ Order marked as cancelled')
-                        )
-                    
-                    orders_processed += 1
-                    
-            except Exception as e:
-                errors += 1
-                self.stdout.write(
-                    self.style.ERROR(f'    ✗ Error processing order: {str(e)}')
-                )
-                
-                # Log the error
-                import logging
-                logger = logging.getLogger(__name__)
-                logger.error(f'Failed to unlock stock for order {order.id}: {str(e)}')
-        
+
+                if options['send_email'] and result['cancelled_order_ids']:
+                    emails_sent += self.send_emails(result['cancelled_order_ids'])
+        except Exception as e:
+            # Chunks already committed stay applied; the failed chunk rolled back
+            errors += 1
+            self.stdout.write(
+                self.style.ERROR(f'    ✗ Error processing orders: {str(e)}')
+            )
+            logger.error(f'Failed to unlock stock for unpaid orders: {str(e)}')
+
         # Summary
         self.stdout.write('\n' + '='*60)
         self.stdout.write(self.style.SUCCESS(f'\nStock Unlock Summary:'))
-        self.stdout.write(f'  Orders processed: {orders_processed}/{total_count}')
-        self.stdout.write(f'  Items unlocked: {total_items_unlocked}')
-        self.stdout.write(f'  Total stock returned: {total_stock_unlocked} units')
-        
-        if cancel_orders and not dry_run:
-            self.stdout.write(f'  Orders cancelled: {orders_processed}')
-        
+        self.stdout.write(f'  Orders found: {total_count}')
+        if action in ('unlock', 'both'):
+            self.stdout.write(f'  Orders unlocked: {released_orders}')
+            self.stdout.write(f'  Products restocked: {len(products_restocked)}')
+            self.stdout.write(f'  Total stock returned: {total_stock_unlocked} units')
+        if action in ('cancel', 'both'):
+            self.stdout.write(f'  Orders cancelled: {cancelled_orders}')
+        if options['send_email']:
+            self.stdout.write(f'  Emails sent: {emails_sent}')
+
         if errors > 0:
             self.stdout.write(
                 self.style.ERROR(f'  Errors: {errors}')
             )
-        
-        if dry_run:
-            self.stdout.write(
-                self.style.WARNING(f'\n  Note: This was a dry run. No actual changes were made.')
-            )
-            self.stdout.write(
-                self.style.WARNING(f'  Run without --dry-run to actually unlock stock.')
-            )
-        
+
+        self.stdout.write(f'  Time: {time.perf_counter() - started:.2f}s')
         self.stdout.write('='*60 + '\n')
 
+    def preview(self, orders, action, total_count):
+        """Dry run: report what would happen using aggregates only"""
+        self.stdout.write(
+            self.style.WARNING('\n--- DRY RUN MODE (No changes will be made) ---\n')
+        )
 
-class Command_Alternative(BaseCommand):
-    """
-    Alternative version with more options
-    This gives you flexibility to choose different strategies
-    """
-    help = 'Unlock stock from unpaid orders with advanced options'
+        if action in ('unlock', 'both'):
+            to_release = orders.filter(stock_released_at__isnull=True)
+            per_product = (
+                OrderItem.objects.filter(order__in=to_release)
+                .values('product_id', 'product__name', 'product__stock')
+                .annotate(units=Sum('quantity'), orders=Count('order', distinct=True))
+                .order_by('-units')
+            )
+            total_units = 0
+            for row in per_product:
+                total_units += row['units']
+                if total_count <= SUMMARY_THRESHOLD:
+                    self.stdout.write(
+                        f"    - Would unlock {row['units']} × {row['product__name']} "
+                        f"from {row['orders']} order(s) (Current stock: {row['product__stock']})"
+                    )
+            self.stdout.write(f'  Would return {total_units} unit(s) to stock')
 
-    def add_arguments(self, parser):
-        parser.add_argument(
-            '--hours',
-            type=int,
-            default=4,
-            help='Hours to wait before unlocking (default: 4)',
-        )
-        parser.add_argument(
-            '--dry-run',
-            action='store_true',
-            help='Preview without making changes',
-        )
-        parser.add_argument(
-            '--status',
-            choices=['pending', 'processing', 'all'],
-            default='pending',
-            help='Order status to process (default: pending)',
-        )
-        parser.add_argument(
-            '--payment-status',
-            choices=['pending', 'failed', 'all'],
-            default='pending',
-            help='Payment status to process (default: pending)',
-        )
-        parser.add_argument(
-            '--action',
-            choices=['unlock', 'cancel', 'both'],
-            default='unlock',
-            help='Action to take: unlock stock, cancel order, or both (default: unlock)',
+        if action in ('cancel', 'both'):
+            self.stdout.write(
+                self.style.WARNING(f"  Would cancel {orders.exclude(status='cancelled').count()} order(s)")
+            )
+
+        self.stdout.write(
+            self.style.WARNING(f'\n  Note: This was a dry run. No actual changes were made.')
         )
-        parser.add_argument(
-            '--send-email',
-            action='store_true',
-            help='Send email notification to buyers',
+        self.stdout.write(
+            self.style.WARNING(f'  Run without --dry-run to actually unlock stock.')
         )
 
-    def handle(self, *args, **options):
-        hours = options['hours']
-        dry_run = options['dry_run']
-        action = options['action']
-        send_email = options['send_email']
-        
-        # Build query based on options
-        now = timezone.now()
-        cutoff_time = now - timedelta(hours=hours)
-        
-        query = Order.objects.filter(created_at__lt=cutoff_time)
-        
-        if options['status'] != 'all':
-            query = query.filter(status=options['status'])
-        
-        if options['payment_status'] != 'all':
-            query = query.filter(payment_status=options['payment_status'])
-        
-        orders = query.prefetch_related('items__product')
-        
-        # Process orders...
-        # (Similar to above but with more flexibility based on options)
-        pass
\ No newline at end of file
+    def send_emails(self, order_ids):
+        """Send cancellation emails for one chunk over a single mail connection"""
+        from main.email_utils import send_order_cancelled_email
+
+        sent = 0
+        with get_connection() as connection:
+            for order in Order.objects.filter(pk__in=order_ids).select_related('buyer'):
+                if order.buyer.email and send_order_cancelled_email(order, connection=connection):
+                    sent += 1
+        return sent
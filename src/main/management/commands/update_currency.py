@@ -19,37 +19,45 @@ class Command(BaseCommand):
             default='NGN',
             help='Base currency (default: NGN)',
         )
+        parser.add_argument(
+            '--all-bases',
+            action='store_true',
+            help='Fetch every supported currency as a base, filling the whole rate matrix',
+        )
 
     def handle(self, *args, **options):
         base_currency = options['base']
+        bases = list(SUPPORTED_CURRENCIES) if options['all_bases'] else [base_currency]
         
         self.stdout.write(
-            self.style.WARNING(f'\nUpdating exchange rates with base: {base_currency}')
+            self.style.WARNING(f'\nUpdating exchange rates with base: {", ".join(bases)}')
         )
         self.stdout.write('='*60 + '\n')
         
-        # Use batch update (single API call)
-        result = batch_update_rates(base_currency)
+        # Use batch update (one API call per base, run concurrently)
+        result = batch_update_rates(base_currency, bases=bases)
         
         if result['success']:
             self.stdout.write(
                 self.style.SUCCESS(f'\n✓ Successfully updated {result["updated"]} exchange rates')
             )
             
-            # Show sample rates
-            from main.models import CurrencyRate
+            # Show sample rates (from the rates just stored)
             self.stdout.write('\nSample rates:')
             
+            sample_base = base_currency if base_currency in result['bases'] else result['bases'][0]
             sample_currencies = ['USD', 'GHS', 'KES', 'ZAR', 'EUR', 'GBP']
             for currency in sample_currencies:
-                if currency != base_currency:
-                    try:
-                        rate = CurrencyRate.objects.get(base=base_currency, quote=currency)
-                        self.stdout.write(
-                            f'  1 {base_currency} = {rate.rate} {currency}'
-                        )
-                    except CurrencyRate.DoesNotExist:
-                        pass
+                rate = result['rates'].get((sample_base, currency))
+                if rate is not None:
+                    self.stdout.write(
+                        f'  1 {sample_base} = {rate} {currency}'
+                    )
+            
+            for base, error in result['failed'].items():
+                self.stdout.write(
+                    self.style.ERROR(f'  ✗ {base}: {error}')
+                )
         else:
             self.stdout.write(
                 self.style.ERROR(f'\n✗ Update failed: {result.get("error")}')
@@ -60,7 +68,7 @@ class Command(BaseCommand):
         self.stdout.write(
             self.style.SUCCESS('\nUpdate Summary:')
         )
-        self.stdout.write(f'  Base currency: {base_currency}')
+        self.stdout.write(f'  Base currency: {", ".join(bases)}')
         self.stdout.write(f'  Supported currencies: {len(SUPPORTED_CURRENCIES)}')
         
         if result['success']:
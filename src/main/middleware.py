@@ -0,0 +1,21 @@
+# main/middleware.py
+
+from .cart import get_cart_storage
+
+
+class CartMiddleware:
+    """
+    Write the cart once per response
+
+    Views may call save_cart() any number of times; cookie carts are only
+    encoded and set here. Must come after SessionMiddleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if getattr(request, '_cart_storage', None) is not None:
+            get_cart_storage(request).finalize(response)
+        return response
@@ -0,0 +1,51 @@
+# Generated by Django 5.0 on 2026-10-16 22:10
+
+from decimal import Decimal
+from django.db import migrations
+from django.db.models import Sum
+
+
+def post_opening_balances(apps, schema_editor):
+    """
+    Post the pre-ledger part of every wallet balance as an OPENING- entry
+
+    Balances moved before the ledger existed have no entries, so the
+    legacy part is the balance minus whatever the ledger already holds.
+    USD amounts are left for backfill_fx.
+    """
+    Wallet = apps.get_model('main', 'Wallet')
+    WalletTransaction = apps.get_model('main', 'WalletTransaction')
+
+    totals = dict(
+        WalletTransaction.objects.values('wallet_id')
+        .annotate(total=Sum('amount'))
+        .values_list('wallet_id', 'total')
+    )
+    opened = set(
+        WalletTransaction.objects.filter(reference__startswith='OPENING-').values_list('wallet_id', flat=True)
+    )
+
+    openings = []
+    for wallet_id, balance in Wallet.objects.values_list('pk', 'balance').iterator():
+        legacy = balance - (totals.get(wallet_id) or Decimal('0'))
+        if wallet_id in opened or not legacy:
+            continue
+        openings.append(WalletTransaction(
+            wallet_id=wallet_id,
+            amount=legacy,
+            transaction_type='adjustment',
+            description='Opening balance',
+            reference=f'OPENING-{wallet_id}',
+        ))
+    WalletTransaction.objects.bulk_create(openings, batch_size=1000, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0013_cart_version'),
+    ]
+
+    operations = [
+        migrations.RunPython(post_opening_balances, migrations.RunPython.noop),
+    ]
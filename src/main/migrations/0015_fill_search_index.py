@@ -0,0 +1,62 @@
+# Generated by Django 5.0 on 2026-10-17 09:30
+
+from django.db import migrations
+
+CHUNK_SIZE = 2000
+
+
+def fill_search_indexes(apps, schema_editor):
+    """
+    Index products that existed before the search tables did
+
+    post_save only indexes products saved after deploy, so without this
+    step every older product is missing from search. Each index is only
+    filled while still empty, so a rebuild already run is left alone.
+    """
+    from main.search.backends import (
+        InvertedIndexBackend, SQLiteFTSBackend, FTS_TABLE, product_documents
+    )
+
+    Product = apps.get_model('main', 'Product')
+    ProductSearchTerm = apps.get_model('main', 'ProductSearchTerm')
+
+    inverted = InvertedIndexBackend()
+    fill_inverted = not ProductSearchTerm.objects.exists()
+
+    fts = SQLiteFTSBackend()
+    fill_fts = False
+    if fts.is_available():
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute(f'SELECT EXISTS (SELECT 1 FROM {FTS_TABLE})')
+            fill_fts = not cursor.fetchone()[0]
+
+    if not (fill_inverted or fill_fts):
+        return
+
+    def index(batch):
+        if fill_inverted:
+            ProductSearchTerm.objects.bulk_create(
+                inverted.search_terms(batch, model=ProductSearchTerm), batch_size=5000
+            )
+        if fill_fts:
+            fts.index_documents(batch)
+
+    batch = []
+    for document in product_documents(Product.objects.order_by('pk')):
+        batch.append(document)
+        if len(batch) >= CHUNK_SIZE:
+            index(batch)
+            batch = []
+    if batch:
+        index(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0014_wallet_opening_balances'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_search_indexes, migrations.RunPython.noop),
+    ]
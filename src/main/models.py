@@ -26,6 +26,14 @@ class Product(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    class Meta:
+        indexes = [
+            # Keyset pagination orderings used by product_list
+            models.Index(fields=['-created_at', '-id']),
+            models.Index(fields=['price', 'id']),
+            models.Index(fields=['name', 'id']),
+        ]
+    
     def __str__(self):
         return self.name
        
@@ -47,6 +55,34 @@ class Product(models.Model):
         """Check if product has discount"""
         return self.discount_percentage > 0
     
+class ProductSearchTerm(models.Model):
+    """Inverted index posting: one row per (term, product) with a field-weighted score"""
+    term = models.CharField(max_length=64)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='search_terms')
+    weight = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        # (term, product) doubles as the term lookup / prefix range index
+        unique_together = ('term', 'product')
+
+    def __str__(self):
+        return f"{self.term} -> {self.product_id} ({self.weight})"
+
+
+class ProductNeighbours(models.Model):
+    """Precomputed related products, refreshed by the refresh_related_products command"""
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='neighbours')
+    neighbour_ids = models.CharField(max_length=255, blank=True)  # comma-separated, best match first
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Neighbours of {self.product_id}: {self.neighbour_ids}"
+
+    def get_neighbour_ids(self):
+        """Return the neighbour product ids as a list of ints"""
+        return [int(pk) for pk in self.neighbour_ids.split(',') if pk]
+
+
 class Wishlist(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='wishlists')
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='wishlisted_by')
@@ -58,6 +94,43 @@ class Wishlist(models.Model):
     def __str__(self):
         return f"{self.user.username} - {self.product.name}"
 
+
+class Cart(models.Model):
+    """
+    Server-side cart (CART_STORAGE = 'db', see main/cart.py)
+    A user has one cart; an anonymous visitor's cart is found by the token
+    in their signed cart cookie and is merged into the user's cart on login.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='cart', null=True, blank=True)
+    token = models.CharField(max_length=32, unique=True, null=True, blank=True)
+    # Sum of line quantities, kept in step with every line write, so the
+    # cart badge reads one integer
+    item_count = models.PositiveIntegerField(default=0)
+    # Bumped on every change; the cart API's ETag
+    version = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        owner = self.user.username if self.user_id else 'anonymous'
+        return f"Cart #{self.id} ({owner}) - {self.item_count} item(s)"
+
+
+class CartLine(models.Model):
+    cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name='lines')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='cart_lines')
+    quantity = models.PositiveIntegerField(default=1)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['cart', 'product'], name='unique_cart_line'),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity}x {self.product.name}"
+
+
 class Order(models.Model):
     STATUS_CHOICES = [
         ('pending', 'Pending'),
@@ -108,6 +181,8 @@ class Order(models.Model):
     payment_method = models.CharField(max_length=50, blank=True)
     payment_reference = models.CharField(max_length=200, blank=True)
     paid_at = models.DateTimeField(null=True, blank=True)
+    # Set when unlock_stock returns this unpaid order's stock
+    stock_released_at = models.DateTimeField(null=True, blank=True)
     
     # Shipping
     tracking_number = models.CharField(max_length=100, blank=True)
@@ -118,6 +193,10 @@ class Order(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # unlock_stock: unpaid orders older than a cutoff
+            models.Index(fields=['payment_status', 'status', 'created_at']),
+        ]
     
     def __str__(self):
         return f"Order #{self.id} - {self.buyer.username}"
@@ -156,26 +235,55 @@ class Wallet(models.Model):
     def can_debit(self, amount):
         return self.balance >= Decimal(str(amount))
     
-    def credit(self, amount):
-        """Add money to wallet"""
-        self.balance += Decimal(str(amount))
-        self.save()
-    
-    def debit(self, amount):
-        """Remove money from wallet"""
-        if self.can_debit(amount):
-            self.balance -= Decimal(str(amount))
-            self.save()
-            return True
-        return False
+    def credit(self, amount, reference=None, description='Wallet credit'):
+        """Add money to wallet (posted to the ledger, see main/ledger.py)"""
+        from .ledger import credit
+        credit(self.user_id, amount, reference=reference, description=description)
+        self.refresh_from_db(fields=['balance', 'updated_at'])
+    
+    def debit(self, amount, reference=None, description='Wallet debit'):
+        """Remove money from wallet, returns False if the balance is too low"""
+        from .ledger import debit, InsufficientFunds
+        try:
+            debit(self.user_id, amount, reference=reference, description=description)
+        except InsufficientFunds:
+            return False
+        finally:
+            self.refresh_from_db(fields=['balance', 'updated_at'])
+        return True
     
 class WalletTransaction(models.Model):
+    """
+    Append-only wallet ledger entry
+    amount is signed (credits positive, debits negative), so a wallet's
+    balance always equals the sum of its entries.
+    """
     wallet = models.ForeignKey(Wallet, on_delete=models.CASCADE, related_name='transactions')
     amount = models.DecimalField(max_digits=12, decimal_places=2)
     amount_usd = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)  # ✓ Now here
     transaction_type = models.CharField(max_length=20)  # ✓ Now here
     description = models.TextField()
     reference = models.CharField(max_length=200)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['wallet', 'reference'], name='unique_wallet_reference'),
+        ]
+        indexes = [
+            models.Index(fields=['wallet', '-created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.transaction_type} {self.amount} ({self.reference})"
+
+    def save(self, *args, **kwargs):
+        if self.pk is not None:
+            raise ValueError('Wallet transactions are append-only')
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        raise ValueError('Wallet transactions are append-only')
 
 
 class CurrencyRate(models.Model):
@@ -191,6 +299,35 @@ class CurrencyRate(models.Model):
         return f"1 {self.base} = {self.rate} {self.quote}"
 
 
+class CurrencyRateHistory(models.Model):
+    """
+    Append-only record of every fetched rate
+    CurrencyRate keeps only the latest rate per pair; this keeps them
+    all, so amounts can be converted at the rate of their own date
+    (see main/utils/rate_history.py).
+    """
+    base = models.CharField(max_length=3)
+    quote = models.CharField(max_length=3)
+    rate = models.DecimalField(max_digits=12, decimal_places=6)
+    observed_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['base', 'quote', 'observed_at']),
+        ]
+
+    def __str__(self):
+        return f"1 {self.base} = {self.rate} {self.quote} at {self.observed_at:%Y-%m-%d %H:%M}"
+
+    def save(self, *args, **kwargs):
+        if self.pk is not None:
+            raise ValueError('Rate history is append-only')
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        raise ValueError('Rate history is append-only')
+
+
 class Payment(models.Model):
     """Track all normal payments"""
     PAYMENT_STATUS_CHOICES = [
@@ -311,6 +448,95 @@ class Refund(models.Model):
         return f"Refund {self.refund_reference} - {self.status}"
 
 
+class Payout(models.Model):
+    """
+    Queued transfer of funds to a seller
+    Created inside the payment/escrow transaction and executed later by
+    the process_payouts worker, so no network call holds database locks.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('paid', 'Paid'),
+        ('failed', 'Failed'),
+    ]
+
+    METHOD_CHOICES = [
+        ('bank_transfer', 'Bank Transfer'),
+        ('wallet', 'Wallet'),
+    ]
+
+    seller = models.ForeignKey(User, on_delete=models.CASCADE, related_name='payouts')
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    currency = models.CharField(max_length=3, default='NGN')
+    # Idempotency key, also sent to Flutterwave as the transfer reference
+    reference = models.CharField(max_length=100, unique=True)
+    description = models.CharField(max_length=255, blank=True)
+
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    method = models.CharField(max_length=20, choices=METHOD_CHOICES, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    transfer_id = models.CharField(max_length=100, blank=True)
+    last_error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+            models.Index(fields=['seller', '-created_at']),
+        ]
+
+    def __str__(self):
+        return f"Payout {self.reference} - {self.status}"
+
+
+class WebhookEvent(models.Model):
+    """
+    Inbox of raw Flutterwave webhook deliveries
+    The webhook view only stores the event and returns 200; the
+    process_webhooks worker applies it. Redeliveries of the same
+    transaction hit the unique constraint and are dropped.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('processed', 'Processed'),
+        ('ignored', 'Ignored'),
+        ('failed', 'Failed'),
+    ]
+
+    event_type = models.CharField(max_length=50)
+    # Flutterwave transaction id (data.id), or a body hash when it is missing
+    transaction_id = models.CharField(max_length=100)
+    payload = models.JSONField()
+
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-received_at']
+        constraints = [
+            models.UniqueConstraint(fields=['event_type', 'transaction_id'], name='unique_webhook_event'),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'received_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.event_type} {self.transaction_id} - {self.status}"
+
+
 class UserProfile(models.Model):
     """Extended user profile with phone and address"""
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
@@ -0,0 +1,246 @@
+# main/orders.py
+"""
+Bulk order creation for multi-seller checkout
+All seller orders and their items are written with two bulk INSERTs,
+however many lines and sellers the cart has. Orders are stamped with
+the NGN/USD rate in effect when they are placed.
+
+Stale unpaid orders are released the same way: per chunk, one aggregate
+over their items, one stock UPDATE and one order UPDATE. Payments go
+through mark_order_paid(), which locks the order row, so an order is
+never released and paid at the same time.
+"""
+
+from datetime import timedelta
+from decimal import Decimal
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q, Sum
+from django.utils import timezone
+from .models import Order, OrderItem
+from .stock import reserve_stock, release_stock
+from .utils.rate_history import usd_fx
+
+
+def unit_price(product):
+    """Price a product sells for right now (after discount), rounded to kobo"""
+    return Decimal(product.get_discounted_price()).quantize(Decimal('0.01'))
+
+
+def create_orders(buyer, cart_items, shipping_address):
+    """
+    Create one pending order per seller for the given cart items
+
+    Args:
+        buyer: User placing the order
+        cart_items: List of {'product', 'quantity'} dicts (see get_cart_items)
+        shipping_address: Formatted shipping address
+
+    Returns:
+        list: Created Order objects, in the order sellers first appear in the cart
+
+    Raises:
+        ValueError: A product has no seller and PLATFORM_SELLER_ID is not set
+    """
+    # Group items by seller (products without a seller are sold by the platform account)
+    platform_seller_id = getattr(settings, 'PLATFORM_SELLER_ID', None)
+    items_by_seller = {}
+    for item in cart_items:
+        seller_id = item['product'].seller_id or platform_seller_id
+        if seller_id is None:
+            raise ValueError(f"{item['product'].name} is not available for sale")
+        items_by_seller.setdefault(seller_id, []).append(item)
+
+    now = timezone.now()
+    orders = []
+    for seller_id, items in items_by_seller.items():
+        total_amount = sum(unit_price(item['product']) * item['quantity'] for item in items)
+        fx_rate, total_amount_usd = usd_fx(total_amount, 'NGN', now)
+        orders.append(Order(
+            buyer=buyer,
+            seller_id=seller_id,
+            total_amount=total_amount,
+            fx_rate=fx_rate,
+            total_amount_usd=total_amount_usd,
+            shipping_address=shipping_address,
+            status='pending',
+            payment_status='pending'
+        ))
+
+    with transaction.atomic():
+        created = Order.objects.bulk_create(orders)
+
+        # Backends that can't return ids from a bulk insert
+        if any(order.pk is None for order in created):
+            for order in orders:
+                order.save()
+
+        OrderItem.objects.bulk_create([
+            OrderItem(
+                order=order,
+                product=item['product'],
+                quantity=item['quantity'],
+                price=unit_price(item['product'])
+            )
+            for order, items in zip(orders, items_by_seller.values())
+            for item in items
+        ])
+
+    return orders
+
+
+def order_units(order_ids):
+    """
+    Units ordered per product across the given orders, in one aggregate
+
+    Returns:
+        dict: {product_id: quantity}
+    """
+    return dict(
+        OrderItem.objects.filter(order_id__in=order_ids)
+        .values('product_id')
+        .annotate(units=Sum('quantity'))
+        .values_list('product_id', 'units')
+    )
+
+
+def mark_order_paid(order_id, payment_reference, payment_method='flutterwave', now=None):
+    """
+    Record a successful payment for an order
+
+    The order row is locked first, so release_orders_chunk (which skips
+    locked orders) cannot return its stock meanwhile. If unlock_stock
+    already released the stock, it is reserved again before the order is
+    marked paid.
+
+    Returns:
+        bool: True if this call marked the order paid, False if it already was
+
+    Raises:
+        InsufficientStock: the released stock has sold since; nothing is changed
+        Order.DoesNotExist: no such order
+    """
+    now = now or timezone.now()
+
+    with transaction.atomic():
+        payment_status, stock_released_at = (
+            Order.objects.select_for_update()
+            .filter(pk=order_id)
+            .values_list('payment_status', 'stock_released_at')
+            .get()
+        )
+        if payment_status == 'paid':
+            return False
+
+        if stock_released_at is not None:
+            reserve_stock(order_units([order_id]))
+
+        Order.objects.filter(pk=order_id).update(
+            payment_status='paid',
+            payment_method=payment_method,
+            payment_reference=payment_reference,
+            paid_at=now,
+            status='processing',
+            stock_released_at=None,
+            updated_at=now,
+        )
+    return True
+
+
+def stale_orders(hours=4, status='pending', payment_status='pending', action='unlock', now=None):
+    """
+    Orders left unpaid for longer than `hours` that still need `action`
+
+    Args:
+        status: Order status to match, or 'all'
+        payment_status: Payment status to match, or 'all'
+        action: 'unlock' (return stock), 'cancel' (cancel order) or 'both'
+    """
+    now = now or timezone.now()
+    orders = Order.objects.filter(created_at__lt=now - timedelta(hours=hours)).exclude(payment_status='paid')
+
+    if status != 'all':
+        orders = orders.filter(status=status)
+    if payment_status != 'all':
+        orders = orders.filter(payment_status=payment_status)
+
+    # Skip orders whose work is already done, so reruns are no-ops
+    if action == 'unlock':
+        orders = orders.filter(stock_released_at__isnull=True)
+    elif action == 'cancel':
+        orders = orders.exclude(status='cancelled')
+    else:
+        orders = orders.filter(Q(stock_released_at__isnull=True) | ~Q(status='cancelled'))
+
+    return orders
+
+
+def release_orders_chunk(orders, action='unlock', chunk_size=500, now=None):
+    """
+    Claim a chunk of stale orders and unlock and/or cancel them
+
+    Rows locked by another worker, or by mark_order_paid() paying the
+    order, are skipped, so several runs can work in parallel. The order
+    UPDATEs also re-check that the order is still unpaid.
+
+    Args:
+        orders: Queryset from stale_orders() for the same action
+
+    Returns:
+        dict: {'order_ids', 'released_order_ids', 'cancelled_order_ids', 'units': {product_id: quantity}}
+    """
+    now = now or timezone.now()
+
+    with transaction.atomic():
+        rows = list(
+            orders.select_for_update(skip_locked=True)
+            .order_by('created_at', 'pk')
+            .values_list('pk', 'stock_released_at', 'status')[:chunk_size]
+        )
+        result = {'order_ids': [pk for pk, _, _ in rows], 'released_order_ids': [],
+                  'cancelled_order_ids': [], 'units': {}}
+        if not rows:
+            return result
+
+        if action in ('unlock', 'both'):
+            to_release = [pk for pk, released_at, _ in rows if released_at is None]
+            if to_release:
+                # Marked first and only while unpaid, so where row locks are
+                # not available an order paid since it was claimed keeps its stock
+                Order.objects.filter(pk__in=to_release).exclude(payment_status='paid').update(
+                    stock_released_at=now, updated_at=now
+                )
+                to_release = list(
+                    Order.objects.filter(pk__in=to_release, stock_released_at=now).values_list('pk', flat=True)
+                )
+                units = order_units(to_release)
+                release_stock(units)
+                result['released_order_ids'] = to_release
+                result['units'] = units
+
+        if action in ('cancel', 'both'):
+            to_cancel = [pk for pk, _, status in rows if status != 'cancelled']
+            if to_cancel:
+                Order.objects.filter(pk__in=to_cancel).exclude(payment_status='paid').update(
+                    status='cancelled', payment_status='failed', updated_at=now
+                )
+                result['cancelled_order_ids'] = to_cancel
+
+    return result
+
+
+def release_stale_orders(hours=4, status='pending', payment_status='pending', action='unlock',
+                         chunk_size=500, now=None):
+    """
+    Unlock and/or cancel every stale order, one transaction per chunk
+
+    Yields:
+        dict: release_orders_chunk() result for each chunk
+    """
+    now = now or timezone.now()
+    while True:
+        orders = stale_orders(hours, status, payment_status, action, now)
+        result = release_orders_chunk(orders, action, chunk_size, now)
+        if not result['order_ids']:
+            return
+        yield result
@@ -0,0 +1,232 @@
+# main/payouts.py
+"""
+Seller payout queue
+Callers enqueue a Payout inside their own transaction; the
+process_payouts worker claims batches, calls the Flutterwave transfer
+API concurrently and records each result exactly once.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from .flutterwave import get_client, FlutterwaveError, CircuitOpenError
+from .ledger import credit
+from .models import Payout
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Transient failures are retried this many times before the payout is failed
+MAX_ATTEMPTS = 5
+
+# Retry delay grows as RETRY_DELAY * 2 ** (attempts - 1)
+RETRY_DELAY = timedelta(minutes=1)
+
+# A worker that died mid-batch leaves payouts in 'processing'; they are
+# reclaimed after this long (safe, the transfer reference is idempotent)
+CLAIM_TIMEOUT = timedelta(minutes=10)
+
+
+def enqueue_payout(seller, amount, reference, description='', currency='NGN'):
+    """
+    Queue a payout to a seller
+
+    Enqueueing the same reference twice returns the existing payout, so a
+    payment confirmed by both the callback and the webhook pays out once.
+
+    Args:
+        seller: User receiving the funds
+        amount: Amount to pay
+        reference: Unique key for what is being paid (e.g. 'PAYOUT-ORDER-12')
+        description: Transfer narration
+
+    Returns:
+        Payout
+    """
+    payout, created = Payout.objects.get_or_create(
+        reference=reference,
+        defaults={
+            'seller': seller,
+            'amount': Decimal(str(amount)),
+            'currency': currency,
+            'description': description,
+        }
+    )
+    if created:
+        logger.info(f"Queued payout {reference}: {currency} {payout.amount} to {seller.username}")
+    return payout
+
+
+def enqueue_payouts(payouts):
+    """
+    Queue several unsaved Payout objects in one INSERT
+
+    References that are already queued are skipped, as in enqueue_payout.
+    """
+    Payout.objects.bulk_create(payouts, ignore_conflicts=True)
+
+
+def claim_payouts(limit=50):
+    """
+    Claim a batch of due payouts for this worker
+
+    Rows locked by another worker are skipped rather than waited on.
+
+    Returns:
+        list: Claimed Payout objects (status 'processing')
+    """
+    now = timezone.now()
+    due = (
+        Q(status='pending', next_attempt_at__lte=now) |
+        Q(status='processing', claimed_at__lt=now - CLAIM_TIMEOUT)
+    )
+
+    with transaction.atomic():
+        ids = list(
+            Payout.objects.select_for_update(skip_locked=True)
+            .filter(due)
+            .order_by('next_attempt_at', 'pk')
+            .values_list('pk', flat=True)[:limit]
+        )
+        if not ids:
+            return []
+        Payout.objects.filter(pk__in=ids).update(
+            status='processing', claimed_at=now, attempts=F('attempts') + 1
+        )
+
+    return list(Payout.objects.filter(pk__in=ids).select_related('seller').order_by('pk'))
+
+
+def transfer_payload(payout):
+    """Build the Flutterwave transfer request for a payout"""
+    bank_account = payout.seller.bank_account
+    return {
+        "account_bank": bank_account.bank_code,
+        "account_number": bank_account.account_number,
+        "amount": float(payout.amount),
+        "currency": payout.currency,
+        "narration": payout.description or "Payment for order",
+        "reference": payout.reference,
+        "callback_url": f"{settings.SITE_URL}/payment/transfer-callback/",
+        "debit_currency": payout.currency
+    }
+
+
+def send_transfer(payout):
+    """
+    Call the transfer API for one payout (no database access, thread-safe)
+
+    Returns:
+        tuple: (payout, response data or None, FlutterwaveError or None)
+    """
+    try:
+        return payout, get_client().create_transfer(transfer_payload(payout)), None
+    except FlutterwaveError as e:
+        return payout, None, e
+
+
+def _finish(payout, **fields):
+    """Record a result only if this worker still owns the claim"""
+    fields.setdefault('completed_at', timezone.now())
+    return Payout.objects.filter(
+        pk=payout.pk, status='processing', claimed_at=payout.claimed_at
+    ).update(**fields)
+
+
+def credit_wallet(payout, reason):
+    """Pay a payout into the seller's wallet"""
+    with transaction.atomic():
+        if _finish(payout, status='paid', method='wallet', last_error=reason):
+            credit(
+                payout.seller_id, payout.amount, reference=payout.reference,
+                description=payout.description or 'Seller payout', transaction_type='payout'
+            )
+            return True
+    return False
+
+
+def record_transfer(payout, data, error):
+    """
+    Record the outcome of a transfer call
+
+    Returns:
+        str: 'paid', 'wallet', 'retry' or 'failed'
+    """
+    if error is None and data.get('status') == 'success':
+        _finish(
+            payout, status='paid', method='bank_transfer',
+            transfer_id=str(data.get('data', {}).get('id', '')), last_error=''
+        )
+        return 'paid'
+
+    if error is None or (error.status_code and error.status_code < 500 and error.status_code != 429):
+        message = data.get('message') if error is None else str(error)
+        if payout.attempts > 1:
+            # An earlier attempt under this reference may have gone through
+            # (read timeout, 5xx, reclaimed claim), so this rejection can be
+            # a duplicate-reference error for a transfer already sent.
+            # Crediting the wallet could pay the seller twice.
+            _finish(payout, status='failed', last_error=f'Rejected on retry, needs manual review: {message}')
+            logger.error(f"Payout {payout.reference} rejected on attempt {payout.attempts}, needs manual review: {message}")
+            return 'failed'
+        # Flutterwave rejected the first attempt outright: fall back to the wallet
+        credit_wallet(payout, f'Bank transfer failed, credited to wallet: {message}')
+        return 'wallet'
+
+    if isinstance(error, CircuitOpenError):
+        # Short-circuited, nothing was sent: give the attempt back and wait
+        # for the breaker, however long Flutterwave stays down
+        _finish(
+            payout, status='pending', completed_at=None, attempts=F('attempts') - 1,
+            next_attempt_at=timezone.now() + RETRY_DELAY, last_error=str(error)
+        )
+        return 'retry'
+
+    # Network error or 5xx: outcome unknown, retry with the same reference
+    if payout.attempts >= MAX_ATTEMPTS:
+        _finish(payout, status='failed', last_error=str(error))
+        logger.error(f"Payout {payout.reference} failed after {payout.attempts} attempts: {error}")
+        return 'failed'
+
+    delay = RETRY_DELAY * 2 ** (payout.attempts - 1)
+    _finish(
+        payout, status='pending', completed_at=None,
+        next_attempt_at=timezone.now() + delay, last_error=str(error)
+    )
+    logger.warning(f"Payout {payout.reference} will be retried in {delay}: {error}")
+    return 'retry'
+
+
+def process_payouts(batch_size=50, workers=8):
+    """
+    Claim and execute one batch of payouts
+
+    Sellers without a linked bank account are credited to their wallet;
+    bank transfers run concurrently on a thread pool.
+
+    Returns:
+        dict: {'paid', 'wallet', 'retry', 'failed'} counts
+    """
+    results = {'paid': 0, 'wallet': 0, 'retry': 0, 'failed': 0}
+
+    payouts = claim_payouts(batch_size)
+    if not payouts:
+        return results
+
+    transfers = []
+    for payout in payouts:
+        if hasattr(payout.seller, 'bank_account'):
+            transfers.append(payout)
+        elif credit_wallet(payout, 'Credited to wallet (no bank account linked)'):
+            results['wallet'] += 1
+
+    if transfers:
+        with ThreadPoolExecutor(max_workers=min(workers, len(transfers))) as pool:
+            for payout, data, error in pool.map(send_transfer, transfers):
+                results[record_transfer(payout, data, error)] += 1
+
+    return results
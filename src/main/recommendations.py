@@ -0,0 +1,177 @@
+# main/recommendations.py
+"""
+Related-products engine
+Neighbour lists are precomputed from co-purchases (OrderItem) and shared
+category, and stored compactly in ProductNeighbours so product_detail
+does a single indexed lookup instead of ORDER BY RANDOM().
+"""
+
+from collections import defaultdict
+from django.db.models import Count, F, Q, Window
+from django.db.models.functions import RowNumber
+from .models import Product, OrderItem, ProductNeighbours
+
+# Neighbours stored per product; more than shown so out-of-stock ones can be skipped
+MAX_NEIGHBOURS = 8
+
+# A product bought together with this one outranks any same-category product
+CO_PURCHASE_WEIGHT = 10
+SAME_CATEGORY_WEIGHT = 1
+
+
+def co_purchase_counts(product_ids):
+    """
+    Count how many orders each pair of products was bought together in
+
+    Returns:
+        dict: {product_id: {other_product_id: order_count}}
+    """
+    pairs = (
+        OrderItem.objects
+        .filter(order__items__product_id__in=product_ids)
+        .exclude(order__status='cancelled')
+        .values('order__items__product_id', 'product_id')
+        .annotate(orders=Count('order', distinct=True))
+    )
+
+    counts = defaultdict(dict)
+    for row in pairs:
+        if row['product_id'] != row['order__items__product_id']:
+            counts[row['order__items__product_id']][row['product_id']] = row['orders']
+    return counts
+
+
+def category_candidates(category_ids, per_category):
+    """
+    Newest in-stock products of each category, in one windowed query
+
+    Returns:
+        dict: {category_id: [product_id, ...]}
+    """
+    rows = (
+        Product.objects
+        .filter(category_id__in=category_ids, stock__gt=0)
+        .annotate(position=Window(
+            RowNumber(), partition_by=F('category'), order_by=[F('created_at').desc(), F('pk').desc()]
+        ))
+        .filter(position__lte=per_category)
+        .values_list('category_id', 'pk')
+    )
+
+    candidates = defaultdict(list)
+    for category_id, pk in rows:
+        candidates[category_id].append(pk)
+    return candidates
+
+
+def compute_neighbours(product_ids):
+    """
+    Compute ranked neighbour ids for a batch of products
+
+    Returns:
+        dict: {product_id: [neighbour_id, ...]} (best first, at most MAX_NEIGHBOURS)
+    """
+    categories = dict(Product.objects.filter(pk__in=product_ids).values_list('pk', 'category_id'))
+    co_purchases = co_purchase_counts(list(categories))
+    by_category = category_candidates(
+        {c for c in categories.values() if c is not None},
+        MAX_NEIGHBOURS + 1
+    )
+
+    neighbours = {}
+    for pk, category_id in categories.items():
+        scores = defaultdict(int)
+        for other, orders in co_purchases.get(pk, {}).items():
+            scores[other] += orders * CO_PURCHASE_WEIGHT
+        for other in by_category.get(category_id, []):
+            if other != pk:
+                scores[other] += SAME_CATEGORY_WEIGHT
+        ranked = sorted(scores, key=lambda other: (-scores[other], -other))
+        neighbours[pk] = ranked[:MAX_NEIGHBOURS]
+    return neighbours
+
+
+def refresh_neighbours(product_ids, chunk_size=500):
+    """
+    Recompute and upsert neighbour lists for the given products
+
+    Returns:
+        int: Number of products refreshed
+    """
+    product_ids = list(product_ids)
+    refreshed = 0
+
+    for start in range(0, len(product_ids), chunk_size):
+        chunk = product_ids[start:start + chunk_size]
+        neighbours = compute_neighbours(chunk)
+        ProductNeighbours.objects.bulk_create(
+            [
+                ProductNeighbours(product_id=pk, neighbour_ids=','.join(map(str, ids)))
+                for pk, ids in neighbours.items()
+            ],
+            update_conflicts=True,
+            unique_fields=['product'],
+            update_fields=['neighbour_ids', 'updated_at'],
+        )
+        refreshed += len(neighbours)
+
+    return refreshed
+
+
+def stale_product_ids(since=None):
+    """
+    Products whose neighbour lists may be out of date
+
+    Args:
+        since: Datetime of the last refresh (default: newest ProductNeighbours.updated_at)
+
+    Returns:
+        set: Product ids that changed, were bought, or have no list yet,
+        plus the other products in the categories of changed ones (their
+        lists may need to take in a new product or drop a changed one)
+    """
+    if since is None:
+        latest = ProductNeighbours.objects.order_by('-updated_at').values_list('updated_at', flat=True).first()
+        if latest is None:
+            return set(Product.objects.values_list('pk', flat=True))
+        since = latest
+
+    changed = Product.objects.filter(Q(updated_at__gt=since) | Q(neighbours__isnull=True))
+    stale = set(Product.objects.filter(
+        Q(pk__in=changed.values('pk')) |
+        Q(category_id__in=changed.filter(category__isnull=False).values('category_id'))
+    ).values_list('pk', flat=True))
+
+    stale.update(OrderItem.objects.filter(
+        order__created_at__gt=since
+    ).values_list('product_id', flat=True).distinct())
+
+    return stale
+
+
+def get_related_products(product, limit=4):
+    """
+    Get in-stock related products for product_detail
+
+    Uses the precomputed neighbour list (join it with
+    select_related('neighbours') when loading the product), topped up
+    with the newest in-stock products of the same category when fewer
+    than `limit` neighbours are in stock.
+    """
+    try:
+        neighbour_ids = product.neighbours.get_neighbour_ids()
+    except ProductNeighbours.DoesNotExist:
+        neighbour_ids = []
+
+    related = []
+    if neighbour_ids:
+        found = Product.objects.filter(pk__in=neighbour_ids, stock__gt=0).in_bulk()
+        related = [found[pk] for pk in neighbour_ids if pk in found][:limit]
+
+    if len(related) < limit:
+        related.extend(
+            Product.objects.filter(category_id=product.category_id, stock__gt=0)
+            .exclude(pk__in=[product.pk, *(p.pk for p in related)])
+            .order_by('-created_at')[:limit - len(related)]
+        )
+    return related
@@ -0,0 +1,45 @@
+# main/search/__init__.py
+"""
+Product search
+Usage:
+    from main.search import search_products
+    product_ids = search_products('ankara fabric')
+    products = Product.objects.filter(search_filter('ankara fabric'))
+"""
+
+from .backends import get_backend, InvertedIndexBackend, SQLiteFTSBackend
+from django.db.models import Q
+
+from .tokenizer import tokenize
+
+# Upper bound on ranked ids returned to list views, keeps pk__in filters small
+SEARCH_RESULT_LIMIT = 1000
+
+
+def search_products(query, limit=SEARCH_RESULT_LIMIT, prefix=False):
+    """
+    Search products with the configured backend
+
+    Args:
+        query: Raw search string
+        limit: Maximum number of ids to return
+        prefix: Treat the last word as a prefix (type-ahead)
+
+    Returns:
+        list: Product ids, best match first
+    """
+    if not query or not query.strip():
+        return []
+    return get_backend().search(query, limit=limit, prefix=prefix)
+
+
+def search_filter(query):
+    """
+    Q matching every product for the query, with no ranking or limit
+
+    For listings sorted by price, name or date, where the sort must see
+    the whole match set rather than the top SEARCH_RESULT_LIMIT hits.
+    """
+    if not query or not query.strip():
+        return Q(pk__in=[])
+    return get_backend().match_filter(query)
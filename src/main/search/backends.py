@@ -0,0 +1,344 @@
+# main/search/backends.py
+"""
+Product search backends
+
+InvertedIndexBackend keeps (term, product, weight) postings in the
+ProductSearchTerm table and works on every database.
+SQLiteFTSBackend uses an FTS5 virtual table when SQLite was built with it.
+"""
+
+import math
+from collections import defaultdict
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q, F, Case, When, Value, Count, Sum, FloatField
+from django.db.models.expressions import RawSQL
+from .tokenizer import tokenize, query_tokens
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Per-occurrence weight of a token by the field it appears in
+FIELD_WEIGHTS = {
+    'name': 5,
+    'category': 2,
+    'description': 1,
+}
+
+# Cap so long descriptions don't drown out name matches
+MAX_TERM_WEIGHT = 20
+
+FTS_TABLE = 'main_product_fts'
+
+
+def product_documents(queryset):
+    """
+    Yield search documents for a Product queryset without instantiating models
+
+    Returns:
+        iterator of dict: {'id', 'name', 'description', 'category'}
+    """
+    rows = queryset.values_list('id', 'name', 'description', 'category__name')
+    for pk, name, description, category in rows.iterator(chunk_size=2000):
+        yield {
+            'id': pk,
+            'name': name or '',
+            'description': description or '',
+            'category': category or '',
+        }
+
+
+def document_for(product):
+    """Build a search document from a Product instance"""
+    return {
+        'id': product.pk,
+        'name': product.name or '',
+        'description': product.description or '',
+        'category': product.category.name if product.category_id else '',
+    }
+
+
+class BaseSearchBackend:
+    """Interface every product search backend implements"""
+    name = None
+
+    def is_available(self):
+        return True
+
+    def index_documents(self, documents):
+        """Add or replace the index entries for the given documents"""
+        raise NotImplementedError
+
+    def remove_products(self, product_ids):
+        """Drop index entries for the given product ids"""
+        raise NotImplementedError
+
+    def clear(self):
+        """Drop every index entry"""
+        raise NotImplementedError
+
+    def search(self, query, limit=50, prefix=False):
+        """
+        Search products
+
+        Args:
+            query: Raw search string
+            limit: Maximum number of ids to return
+            prefix: Treat the last word as a prefix (type-ahead)
+
+        Returns:
+            list: Product ids, best match first
+        """
+        raise NotImplementedError
+
+    def match_filter(self, query):
+        """
+        Q for Product matching every word of the query, unranked and unlimited
+
+        Used when results are sorted by something other than relevance,
+        so the sort sees the whole match set.
+        """
+        raise NotImplementedError
+
+    def rebuild(self, queryset, chunk_size=2000):
+        """Rebuild the whole index from a Product queryset, returns documents indexed"""
+        self.clear()
+        count = 0
+        batch = []
+        for document in product_documents(queryset):
+            batch.append(document)
+            if len(batch) >= chunk_size:
+                self.index_documents(batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            self.index_documents(batch)
+            count += len(batch)
+        return count
+
+
+class InvertedIndexBackend(BaseSearchBackend):
+    """Inverted index stored in ProductSearchTerm, ranked by weighted TF-IDF"""
+    name = 'index'
+
+    def _postings(self, document):
+        weights = defaultdict(int)
+        for field, field_weight in FIELD_WEIGHTS.items():
+            for token in tokenize(document[field]):
+                weights[token] += field_weight
+        return {term: min(weight, MAX_TERM_WEIGHT) for term, weight in weights.items()}
+
+    def search_terms(self, documents, model=None):
+        """
+        Unsaved ProductSearchTerm rows for the given documents
+
+        Args:
+            model: ProductSearchTerm class to build (migrations pass the historical one)
+        """
+        if model is None:
+            from main.models import ProductSearchTerm as model
+        return [
+            model(term=term, product_id=document['id'], weight=weight)
+            for document in documents
+            for term, weight in self._postings(document).items()
+        ]
+
+    def index_documents(self, documents):
+        from main.models import ProductSearchTerm
+
+        documents = list(documents)
+        if not documents:
+            return
+
+        rows = self.search_terms(documents)
+
+        with transaction.atomic():
+            ProductSearchTerm.objects.filter(product_id__in=[d['id'] for d in documents]).delete()
+            ProductSearchTerm.objects.bulk_create(rows, batch_size=5000)
+
+    def remove_products(self, product_ids):
+        from main.models import ProductSearchTerm
+        ProductSearchTerm.objects.filter(product_id__in=list(product_ids)).delete()
+
+    def clear(self):
+        from main.models import ProductSearchTerm
+        ProductSearchTerm.objects.all().delete()
+
+    def _condition(self, token, prefix=None):
+        condition = Q(term=token)
+        if prefix:
+            # Range scan so the (term, product) index is used on every backend
+            condition |= Q(term__gte=prefix, term__lt=prefix + '\uffff')
+        return condition
+
+    def _query_postings(self, query, prefix):
+        """Postings for any query token, and one condition per token"""
+        from main.models import ProductSearchTerm
+
+        tokens, prefix_token = query_tokens(query)
+        conditions = []
+        for i, token in enumerate(tokens):
+            is_last = i == len(tokens) - 1
+            conditions.append(self._condition(token, prefix_token if prefix and is_last else None))
+
+        any_condition = Q()
+        for condition in conditions:
+            any_condition |= condition
+        return ProductSearchTerm.objects.filter(any_condition), conditions
+
+    def match_filter(self, query):
+        postings, conditions = self._query_postings(query, prefix=False)
+        if not conditions:
+            return Q(pk__in=[])
+        matched = Case(*[When(condition, then=Value(i)) for i, condition in enumerate(conditions)])
+        return Q(pk__in=(
+            postings.values('product_id')
+            .annotate(matched=Count(matched, distinct=True))
+            .filter(matched=len(conditions))
+            .values('product_id')
+        ))
+
+    def search(self, query, limit=50, prefix=False):
+        from main.models import Product
+
+        postings, conditions = self._query_postings(query, prefix)
+        if not conditions:
+            return []
+
+        # Document frequency per query token, for IDF weighting
+        frequencies = postings.aggregate(**{
+            f'df{i}': Count('product', filter=condition, distinct=True)
+            for i, condition in enumerate(conditions)
+        })
+        if not all(frequencies.values()):
+            return []
+
+        total = Product.objects.count() or 1
+        idf = [math.log(1 + total / frequencies[f'df{i}']) for i in range(len(conditions))]
+
+        # Intersect and rank in the database: a product must match every token
+        matched = Case(*[When(condition, then=Value(i)) for i, condition in enumerate(conditions)])
+        score = Case(*[
+            When(condition, then=F('weight') * Value(idf[i]))
+            for i, condition in enumerate(conditions)
+        ], output_field=FloatField())
+
+        ranked = (
+            postings.values('product_id')
+            .annotate(matched=Count(matched, distinct=True), score=Sum(score))
+            .filter(matched=len(conditions))
+            .order_by('-score', 'product_id')
+            .values_list('product_id', flat=True)
+        )
+        return list(ranked[:limit])
+
+
+class SQLiteFTSBackend(BaseSearchBackend):
+    """SQLite FTS5 backend, ranked with bm25 using the same field weights"""
+    name = 'fts5'
+
+    _available = {}
+    _populated = {}
+
+    def is_available(self):
+        if connection.vendor != 'sqlite':
+            return False
+        if connection.alias not in self._available:
+            self._available[connection.alias] = FTS_TABLE in connection.introspection.table_names()
+        return self._available[connection.alias]
+
+    def is_populated(self):
+        """
+        False while the table is empty but products exist (index never built)
+
+        Only a positive answer is remembered, so a rebuild is picked up.
+        """
+        if not self._populated.get(connection.alias):
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'SELECT EXISTS (SELECT 1 FROM {FTS_TABLE}) OR NOT EXISTS (SELECT 1 FROM main_product)'
+                )
+                self._populated[connection.alias] = bool(cursor.fetchone()[0])
+        return self._populated[connection.alias]
+
+    def _text(self, value):
+        # Store our own tokens so diacritics, plurals, stopwords and compound
+        # names ('aso-oke' -> 'aso oke asooke') behave as in the index backend
+        return ' '.join(tokenize(value))
+
+    def index_documents(self, documents):
+        documents = list(documents)
+        if not documents:
+            return
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid = %s',
+                [(d['id'],) for d in documents]
+            )
+            cursor.executemany(
+                f'INSERT INTO {FTS_TABLE} (rowid, name, description, category) VALUES (%s, %s, %s, %s)',
+                [(d['id'], *(self._text(d[field]) for field in ('name', 'description', 'category')))
+                 for d in documents]
+            )
+
+    def remove_products(self, product_ids):
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid = %s',
+                [(pk,) for pk in product_ids]
+            )
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+
+    def _match(self, query):
+        # Every word also acts as a prefix of the stored token (type-ahead)
+        tokens, _ = query_tokens(query)
+        return ' '.join(f'"{token}"*' for token in tokens)
+
+    def match_filter(self, query):
+        match = self._match(query)
+        if not match:
+            return Q(pk__in=[])
+        return Q(pk__in=RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [match]))
+
+    def search(self, query, limit=50, prefix=False):
+        match = self._match(query)
+        if not match:
+            return []
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s '
+                f'ORDER BY bm25({FTS_TABLE}, %s, %s, %s), rowid LIMIT %s',
+                [match, FIELD_WEIGHTS['name'], FIELD_WEIGHTS['description'],
+                 FIELD_WEIGHTS['category'], limit]
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+BACKENDS = {
+    InvertedIndexBackend.name: InvertedIndexBackend,
+    SQLiteFTSBackend.name: SQLiteFTSBackend,
+}
+
+
+def get_backend(name=None):
+    """
+    Get the configured search backend
+
+    settings.PRODUCT_SEARCH_BACKEND may be 'index', 'fts5' or 'auto'
+    (FTS5 when available and built, otherwise the inverted index).
+    """
+    name = name or getattr(settings, 'PRODUCT_SEARCH_BACKEND', 'auto')
+
+    if name == 'auto':
+        fts = SQLiteFTSBackend()
+        return fts if fts.is_available() and fts.is_populated() else InvertedIndexBackend()
+
+    backend = BACKENDS[name]()
+    if not backend.is_available():
+        logger.warning(f"Search backend '{name}' unavailable, using inverted index")
+        return InvertedIndexBackend()
+    return backend
@@ -0,0 +1,44 @@
+# main/search/signals.py
+"""Keep the product search index in step with Product and Category changes"""
+
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from main.models import Product, Category
+from .backends import get_backend, document_for, product_documents
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, raw=False, **kwargs):
+    """Re-index a product after it is saved"""
+    if raw:
+        return
+    try:
+        get_backend().index_documents([document_for(instance)])
+    except Exception as e:
+        logger.error(f"Search indexing failed for product {instance.pk}: {str(e)}")
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    """Drop a deleted product from the index"""
+    try:
+        get_backend().remove_products([instance.pk])
+    except Exception as e:
+        logger.error(f"Search unindexing failed for product {instance.pk}: {str(e)}")
+
+
+@receiver(post_save, sender=Category)
+def reindex_category(sender, instance, created=False, raw=False, **kwargs):
+    """Category names are indexed with their products, so re-index them on rename"""
+    if raw or created:
+        return
+
+    def reindex():
+        backend = get_backend()
+        backend.index_documents(product_documents(Product.objects.filter(category=instance)))
+
+    transaction.on_commit(reindex)
@@ -0,0 +1,89 @@
+# main/search/tokenizer.py
+"""
+Tokenisation for product search
+Handles English product names as well as Nigerian names written with
+tone marks and under-dots (Àdìrẹ, Ọ̀fadà, aṣọ-òkè)
+"""
+
+import re
+import unicodedata
+
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:['\-][a-z0-9]+)*")
+
+MAX_TOKEN_LENGTH = 64
+
+STOPWORDS = frozenset({
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'in',
+    'is', 'it', 'of', 'on', 'or', 'the', 'to', 'with', 'your', 'our',
+})
+
+
+def normalize(text):
+    """
+    Lowercase text and strip diacritics
+    'Àdìrẹ' -> 'adire', 'Ọ̀fadà' -> 'ofada'
+    """
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    stripped = ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return stripped.lower()
+
+
+def stem(token):
+    """Light English plural stemming (shoes -> shoe, bags -> bag, batteries -> battery)"""
+    if len(token) <= 3 or token.isdigit():
+        return token
+    if token.endswith('ies') and len(token) > 4:
+        return token[:-3] + 'y'
+    if token.endswith(('sses', 'shes', 'ches', 'xes', 'zes')):
+        return token[:-2]
+    if token.endswith('s') and not token.endswith(('ss', 'us', 'is')):
+        return token[:-1]
+    return token
+
+
+def tokenize(text, stemming=True, split_compounds=True):
+    """
+    Split text into search tokens
+
+    Hyphenated and apostrophised words are indexed both as parts and
+    joined ('aso-oke' -> 'aso', 'oke', 'asooke'), so a query for the
+    joined spelling matches either way of writing the name.
+
+    Args:
+        text: Raw text
+        stemming: Apply plural stemming (default: True)
+        split_compounds: Also emit the parts of compound words (default: True)
+
+    Returns:
+        list: Tokens in order of appearance (duplicates kept)
+    """
+    tokens = []
+    for word in TOKEN_RE.findall(normalize(text)):
+        parts = re.split(r"['\-]", word)
+        if len(parts) > 1:
+            joined = ''.join(parts)
+            parts = parts + [joined] if split_compounds else [joined]
+        for part in parts:
+            if not part or part in STOPWORDS:
+                continue
+            part = part[:MAX_TOKEN_LENGTH]
+            tokens.append(stem(part) if stemming else part)
+    return tokens
+
+
+def query_tokens(query, stemming=True):
+    """
+    Tokenise a search query
+
+    Returns:
+        tuple: (unique tokens in order, prefix token or None)
+        The prefix token is the unstemmed last word when the user is
+        still typing it (no trailing whitespace), for type-ahead.
+    """
+    tokens = list(dict.fromkeys(tokenize(query, stemming=stemming, split_compounds=False)))
+    prefix = None
+    if query and not query[-1].isspace():
+        raw = tokenize(query, stemming=False, split_compounds=False)
+        if raw:
+            prefix = raw[-1]
+    return tokens, prefix
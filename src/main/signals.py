@@ -0,0 +1,25 @@
+# main/signals.py
+"""Cache invalidation for catalogue changes, and cart merging on login"""
+
+from django.db.models.signals import post_save, post_delete
+from django.contrib.auth.signals import user_logged_in
+from django.dispatch import receiver
+from .models import Product, Category
+from .catalogue import bump_catalogue_version
+from .cart import get_cart_storage
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_catalogue(sender, **kwargs):
+    """Product or Category changed: cached catalogue data is stale"""
+    bump_catalogue_version()
+
+
+@receiver(user_logged_in)
+def merge_cart_on_login(sender, request, user, **kwargs):
+    """Carry the visitor's anonymous cart over to the account"""
+    if request is not None:
+        get_cart_storage(request).login(user)
@@ -0,0 +1,137 @@
+# main/stock.py
+"""
+Stock reservation service
+Stock is moved with conditional UPDATE ... SET stock = stock - n
+statements, never by saving a product loaded earlier in the request.
+Those UPDATEs skip post_save; they bump the stock version here, not the
+catalogue version, so the cached home page survives every checkout.
+"""
+
+from django.db import transaction
+from django.db.models import Case, When, F, Q
+from .models import Product
+from .catalogue import bump_stock_version
+
+
+class InsufficientStock(Exception):
+    """Raised when one or more lines cannot be reserved"""
+
+    def __init__(self, shortfalls):
+        self.shortfalls = shortfalls
+        super().__init__(
+            ', '.join(
+                f"product {s['product_id']}: requested {s['requested']}, available {s['available']}"
+                for s in shortfalls
+            )
+        )
+
+
+def _quantities(lines):
+    """Merge (product_id, quantity) pairs or a {product_id: quantity} dict"""
+    if isinstance(lines, dict):
+        lines = lines.items()
+    quantities = {}
+    for product_id, quantity in lines:
+        if quantity > 0:
+            quantities[int(product_id)] = quantities.get(int(product_id), 0) + int(quantity)
+    return quantities
+
+
+def _lock(product_ids):
+    """
+    Lock product rows in primary key order so concurrent reservations
+    touching the same products cannot deadlock
+
+    Returns:
+        dict: {product_id: current stock}
+    """
+    return dict(
+        Product.objects.select_for_update()
+        .filter(pk__in=product_ids)
+        .order_by('pk')
+        .values_list('pk', 'stock')
+    )
+
+
+def _shortfalls(quantities, available):
+    return [
+        {
+            'product_id': product_id,
+            'requested': quantity,
+            'available': available.get(product_id, 0),
+        }
+        for product_id, quantity in quantities.items()
+        if available.get(product_id, 0) < quantity
+    ]
+
+
+def reserve_stock(lines):
+    """
+    Decrement stock for every line, all or nothing
+
+    Args:
+        lines: {product_id: quantity} or iterable of (product_id, quantity)
+
+    Returns:
+        dict: {product_id: quantity reserved}
+
+    Raises:
+        InsufficientStock: with per-line shortfalls; nothing is reserved
+    """
+    quantities = _quantities(lines)
+    if not quantities:
+        return {}
+
+    with transaction.atomic():
+        available = _lock(sorted(quantities))
+        shortfalls = _shortfalls(quantities, available)
+        if shortfalls:
+            raise InsufficientStock(shortfalls)
+
+        # One UPDATE for all lines; the per-row stock guard still holds
+        # on databases where SELECT ... FOR UPDATE is a no-op
+        guard = Q()
+        for product_id, quantity in quantities.items():
+            guard |= Q(pk=product_id, stock__gte=quantity)
+
+        updated = Product.objects.filter(guard).update(
+            stock=Case(*[
+                When(pk=product_id, then=F('stock') - quantity)
+                for product_id, quantity in quantities.items()
+            ], default=F('stock'))
+        )
+
+        if updated != len(quantities):
+            # Stock moved underneath us: report the fresh numbers and roll back
+            current = dict(Product.objects.filter(pk__in=quantities).values_list('pk', 'stock'))
+            raise InsufficientStock(_shortfalls(quantities, current))
+
+        transaction.on_commit(bump_stock_version)
+
+    return quantities
+
+
+def release_stock(lines):
+    """
+    Return reserved stock (e.g. for unpaid or cancelled orders)
+
+    Args:
+        lines: {product_id: quantity} or iterable of (product_id, quantity)
+
+    Returns:
+        int: Number of products updated
+    """
+    quantities = _quantities(lines)
+    if not quantities:
+        return 0
+
+    with transaction.atomic():
+        _lock(sorted(quantities))
+        updated = Product.objects.filter(pk__in=quantities).update(
+            stock=Case(*[
+                When(pk=product_id, then=F('stock') + quantity)
+                for product_id, quantity in quantities.items()
+            ], default=F('stock'))
+        )
+        transaction.on_commit(bump_stock_version)
+    return updated
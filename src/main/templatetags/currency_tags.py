@@ -7,11 +7,35 @@ register = template.Library()
 from main.utils.currency import (
     currency_convert,
     currency_format,
-    convert_price_to_user_currency,
+    get_price_converter,
     get_user_currency,
 )
 
 
+def _converter(context, original_currency='NGN'):
+    """
+    PriceConverter for this render, created on the first price
+
+    Cached on the render context, so every price in the template shares
+    one currency lookup and one rate lookup (even without a request).
+    """
+    key = ('price_converter', original_currency)
+    converter = context.render_context.get(key)
+    if converter is None:
+        converter = context.render_context[key] = get_price_converter(context.get('request'), original_currency)
+    return converter
+
+
+def _value(item, key):
+    """Look up key on a dict or object, as template variables do"""
+    if key is None:
+        return item
+    try:
+        return item[key]
+    except (TypeError, KeyError, IndexError):
+        return getattr(item, key)
+
+
 @register.filter(name='currency_format')
 def currency_format_filter(amount, currency='NGN'):
     """Format an amount with the given currency symbol."""
@@ -33,10 +57,8 @@ def currency_convert_filter(amount, to_currency, from_currency='NGN'):
 @register.simple_tag(takes_context=True)
 def format_price(context, price, original_currency='NGN'):
     """Return a formatted price string in the user's preferred currency."""
-    request = context.get('request')
     try:
-        conv = convert_price_to_user_currency(price, original_currency, request)
-        return conv.get('formatted', str(price))
+        return _converter(context, original_currency).format(price)
     except Exception:
         return str(price)
 
@@ -48,4 +70,61 @@ def current_currency(context):
     try:
         return get_user_currency(request)
     except Exception:
-        return 'NGN'
\ No newline at end of file
+        return 'NGN'
+
+
+class PricesNode(template.Node):
+    def __init__(self, items, key, original_currency, target, nodelist):
+        self.items = items
+        self.key = key
+        self.original_currency = original_currency
+        self.target = target
+        self.nodelist = nodelist
+
+    def render(self, context):
+        items = list(self.items.resolve(context) or [])
+        key = self.key.resolve(context) if self.key else None
+        original_currency = self.original_currency.resolve(context) if self.original_currency else 'NGN'
+
+        try:
+            formatted = _converter(context, original_currency).format_many(
+                _value(item, key) for item in items
+            )
+        except Exception:
+            formatted = [str(_value(item, key)) for item in items]
+
+        with context.push(**{self.target: list(zip(items, formatted))}):
+            return self.nodelist.render(context)
+
+
+@register.tag
+def prices(parser, token):
+    """
+    Convert and format a whole list of prices in one go
+
+    Usage:
+        {% prices cart_items key="subtotal" as priced %}
+          {% for item, price in priced %}{{ item.product.name }}: {{ price }}{% endfor %}
+        {% endprices %}
+
+    key picks the amount from each item (dict key or attribute); without
+    it the items are the amounts. from="USD" sets the stored currency.
+    """
+    bits = token.split_contents()
+    if len(bits) < 4 or bits[-2] != 'as':
+        raise template.TemplateSyntaxError(
+            f"'{bits[0]}' usage: {{% prices items [key=...] [from=...] as name %}}"
+        )
+
+    options = {}
+    for bit in bits[2:-2]:
+        name, sep, value = bit.partition('=')
+        if not sep or name not in ('key', 'from') or name in options:
+            raise template.TemplateSyntaxError(f"'{bits[0]}' got an unexpected argument: {bit}")
+        options[name] = parser.compile_filter(value)
+
+    nodelist = parser.parse(('endprices',))
+    parser.delete_first_token()
+    return PricesNode(
+        parser.compile_filter(bits[1]), options.get('key'), options.get('from'), bits[-1], nodelist
+    )
@@ -3,6 +3,7 @@
 from django.urls import path
 from . import views
 from . import auth
+from . import api
 
 urlpatterns = [
 
@@ -23,6 +24,11 @@ urlpatterns = [
 
     path('cart/ajax/add/<int:product_id>/', views.ajax_add_to_cart, name='ajax_add_to_cart'),
     path('cart/ajax/count/', views.get_cart_count, name='get_cart_count'),
+
+    # JSON API (main/api.py)
+    path('api/cart/', api.cart_api, name='api_cart'),
+    path('api/products/', api.product_list_api, name='api_product_list'),
+    path('api/products/<int:product_id>/', api.product_detail_api, name='api_product_detail'),
     
     path('set-currency/', views.set_currency, name='set_currency'),
     path('currency-rates/', views.get_currency_rates, name='get_currency_rates'),
@@ -43,5 +49,6 @@ urlpatterns = [
 
      path('', views.home, name='home'),
     path('products/', views.product_list, name='product_list'),
+    path('products/suggest/', views.product_suggest, name='product_suggest'),
     path('product/<int:product_id>/', views.product_detail, name='product_detail'),
 ]
\ No newline at end of file
@@ -0,0 +1,69 @@
+# main/utils/cache.py
+"""
+Cache helpers
+Stampede-protected get-or-build with stale-while-revalidate
+"""
+
+import time
+from django.core.cache import cache
+import logging
+
+logger = logging.getLogger(__name__)
+
+# How long a rebuild may hold the lock before another worker may try
+LOCK_TIMEOUT = 30
+
+# How long callers without a stale copy wait for the lock holder
+WAIT_TIMEOUT = 5
+WAIT_INTERVAL = 0.05
+
+
+def get_or_build(key, builder, timeout=300, version=None, grace=3600):
+    """
+    Get a cached value, rebuilding it in at most one worker at a time
+
+    Entries are stored with the time they go stale and the version they
+    were built for. A stale or out-of-version entry is still served to
+    everyone except the single caller that wins the rebuild lock.
+
+    Args:
+        key: Cache key
+        builder: Callable returning the fresh value
+        timeout: Seconds before an entry is considered stale
+        version: Current data version; entries built for another version are stale
+        grace: Extra seconds a stale entry is kept to serve during a rebuild
+
+    Returns:
+        The cached or freshly built value
+    """
+    entry = cache.get(key)
+    if entry is not None and entry['version'] == version and entry['stale_at'] > time.time():
+        return entry['value']
+
+    lock_key = f'{key}:lock'
+    if cache.add(lock_key, 1, LOCK_TIMEOUT):
+        try:
+            value = builder()
+            cache.set(key, {
+                'value': value,
+                'version': version,
+                'stale_at': time.time() + timeout,
+            }, timeout + grace)
+            return value
+        finally:
+            cache.delete(lock_key)
+
+    # Someone else is rebuilding: serve what we have
+    if entry is not None:
+        return entry['value']
+
+    # Nothing to serve yet, wait briefly for the lock holder
+    deadline = time.time() + WAIT_TIMEOUT
+    while time.time() < deadline:
+        time.sleep(WAIT_INTERVAL)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry['value']
+
+    logger.warning(f"Timed out waiting for cache rebuild of {key}, building locally")
+    return builder()
@@ -6,16 +6,19 @@ Supports multiple African currencies with real-time exchange rates
 
 import requests
 from decimal import Decimal
-from django.core.cache import cache
 from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from concurrent.futures import ThreadPoolExecutor, as_completed
 try:
-    from ..models import CurrencyRate
+    from ..models import CurrencyRate, CurrencyRateHistory
 except ImportError:
     # Fallback if relative import fails
     try:
-        from main.models import CurrencyRate
+        from main.models import CurrencyRate, CurrencyRateHistory
     except ImportError:
-        CurrencyRate = None
+        CurrencyRate = CurrencyRateHistory = None
+from .rates import RateMatrix, get_rate_matrix, load_rate_matrix, install_rate_matrix
 import logging
 
 logger = logging.getLogger(__name__)
@@ -33,15 +36,23 @@ SUPPORTED_CURRENCIES = {
 }
 
 
+# Formatters built once per currency: (with thousand separators, without)
+CURRENCY_FORMATS = {
+    code: (f"{info['symbol']}{{:,.2f}}".format, f"{info['symbol']}{{:.2f}}".format)
+    for code, info in SUPPORTED_CURRENCIES.items()
+}
+
+
 def get_exchange_rate(from_currency='USD', to_currency='NGN', use_cache=True):
     """
     Get exchange rate from one currency to another
-    Uses cache for 1 hour to reduce API calls
+    Read from the in-process rate matrix; never calls the API, so it is
+    safe on every page render. Rates are refreshed by batch_update_rates.
     
     Args:
         from_currency: Source currency code (default: USD)
         to_currency: Target currency code (default: NGN)
-        use_cache: Whether to use cached rates (default: True)
+        use_cache: Use the shared matrix; False rebuilds it from the database
     
     Returns:
         Decimal: Exchange rate
@@ -50,46 +61,14 @@ def get_exchange_rate(from_currency='USD', to_currency='NGN', use_cache=True):
     if from_currency == to_currency:
         return Decimal('1.0')
     
-    cache_key = f'exchange_rate_{from_currency}_{to_currency}'
-    
-    # Try cache first
-    if use_cache:
-        cached_rate = cache.get(cache_key)
-        if cached_rate:
-            logger.info(f"Using cached rate: 1 {from_currency} = {cached_rate} {to_currency}")
-            return Decimal(str(cached_rate))
-    
-    # Try database
-    try:
-        rate_obj = CurrencyRate.objects.get(base=from_currency, quote=to_currency)
-        cache.set(cache_key, float(rate_obj.rate), 3600)  # Cache for 1 hour
-        logger.info(f"Using DB rate: 1 {from_currency} = {rate_obj.rate} {to_currency}")
-        return rate_obj.rate
-    except CurrencyRate.DoesNotExist:
-        pass
-    
-    # Fetch from API
-    rate = fetch_exchange_rate_from_api(from_currency, to_currency)
-    
-    if rate:
-        # Save to database
-        CurrencyRate.objects.update_or_create(
-            base=from_currency,
-            quote=to_currency,
-            defaults={'rate': rate}
-        )
-        # Cache it
-        cache.set(cache_key, float(rate), 3600)
-        logger.info(f"Fetched new rate: 1 {from_currency} = {rate} {to_currency}")
+    matrix = get_rate_matrix() if use_cache else load_rate_matrix()
+    rate = matrix.rate(from_currency, to_currency)
+    if rate is not None:
         return rate
     
-    # Fallback rates (if API fails)
-    fallback_rates = get_fallback_rates()
-    key = f"{from_currency}_{to_currency}"
-    
-    if key in fallback_rates:
-        rate = Decimal(str(fallback_rates[key]))
-        cache.set(cache_key, float(rate), 3600)
+    # Fallback rates (no stored or derivable rate)
+    rate = _fallback_matrix().rate(from_currency, to_currency)
+    if rate is not None:
         logger.warning(f"Using fallback rate: 1 {from_currency} = {rate} {to_currency}")
         return rate
     
@@ -97,38 +76,17 @@ def get_exchange_rate(from_currency='USD', to_currency='NGN', use_cache=True):
     return Decimal('1.0')
 
 
-def fetch_exchange_rate_from_api(from_currency='USD', to_currency='NGN'):
-    """
-    Fetch live exchange rate from ExchangeRate-API
-    API returns rates with base currency
-    Example: GET /v4/latest/NGN returns all rates from NGN
-    """
-    try:
-        # Fetch rates with from_currency as base
-        url = f"https://api.exchangerate-api.com/v4/latest/{from_currency}"
-        response = requests.get(url, timeout=10)
-        
-        if response.status_code == 200:
-            data = response.json()
-            
-            # Check if the API returned rates
-            if 'rates' in data and to_currency in data['rates']:
-                rate = Decimal(str(data['rates'][to_currency]))
-                logger.info(f"API Success: 1 {from_currency} = {rate} {to_currency}")
-                return rate
-            else:
-                logger.warning(f"Currency {to_currency} not found in API response")
-        else:
-            logger.error(f"API returned status {response.status_code}")
-        
-    except requests.Timeout:
-        logger.error("API request timed out")
-    except requests.RequestException as e:
-        logger.error(f"API request failed: {str(e)}")
-    except Exception as e:
-        logger.error(f"Error fetching exchange rate: {str(e)}")
-    
-    return None
+_fallback = None
+
+
+def _fallback_matrix():
+    """Matrix built from get_fallback_rates(), with cross rates filled in"""
+    global _fallback
+    if _fallback is None:
+        _fallback = RateMatrix.from_pairs({
+            tuple(key.split('_')): rate for key, rate in get_fallback_rates().items()
+        })
+    return _fallback
 
 
 def get_fallback_rates():
@@ -207,24 +165,19 @@ def format_currency(amount, currency='NGN'):
     Returns:
         str: Formatted currency string
     """
-    if currency not in SUPPORTED_CURRENCIES:
-        currency = 'NGN'
-    
-    symbol = SUPPORTED_CURRENCIES[currency]['symbol']
-    amount_decimal = Decimal(str(amount))
+    grouped, plain = CURRENCY_FORMATS.get(currency) or CURRENCY_FORMATS['NGN']
+    if not isinstance(amount, Decimal):
+        amount = Decimal(str(amount))
     
     # Format with thousand separators
-    if amount_decimal >= 1000:
-        formatted = f"{amount_decimal:,.2f}"
-    else:
-        formatted = f"{amount_decimal:.2f}"
-    
-    return f"{symbol}{formatted}"
+    return grouped(amount) if amount >= 1000 else plain(amount)
 
 
 def get_user_currency(request):
     """
-    Get user's preferred currency from session or default
+    Get user's preferred currency from the cookie, session or default
+    The currency cookie (set by set_currency) is checked first, so most
+    requests never load the session for this
     
     Args:
         request: Django request object
@@ -232,12 +185,17 @@ def get_user_currency(request):
     Returns:
         str: Currency code (e.g., 'NGN', 'USD')
     """
-    # Check session
-    currency = request.session.get('currency')
-    
-    if currency and currency in SUPPORTED_CURRENCIES:
+    # Check cookie
+    currency = request.COOKIES.get('currency')
+    if currency in SUPPORTED_CURRENCIES:
         return currency
     
+    # Check session (only if the visitor has one)
+    if settings.SESSION_COOKIE_NAME in request.COOKIES:
+        currency = request.session.get('currency')
+        if currency and currency in SUPPORTED_CURRENCIES:
+            return currency
+    
     # Default to NGN
     return 'NGN'
 
@@ -278,18 +236,103 @@ def convert_price_to_user_currency(price, original_currency='NGN', request=None)
             'formatted': format_currency(price, user_currency)
         }
     
-    converted_amount = convert_currency(price, original_currency, user_currency)
+    rate = get_exchange_rate(original_currency, user_currency)
+    original_amount = Decimal(str(price))
+    converted_amount = (original_amount * rate).quantize(Decimal('0.01'))
     
     return {
         'amount': converted_amount,
         'currency': user_currency,
         'formatted': format_currency(converted_amount, user_currency),
-        'original_amount': Decimal(str(price)),
+        'original_amount': original_amount,
         'original_currency': original_currency,
-        'rate': get_exchange_rate(original_currency, user_currency)
+        'rate': rate
     }
 
 
+class PriceConverter:
+    """
+    Request-scoped price converter
+    Resolves the target currency and exchange rate once, so converting
+    a whole product grid costs a single rate lookup
+    """
+
+    def __init__(self, currency='NGN', original_currency='NGN'):
+        if currency not in SUPPORTED_CURRENCIES:
+            currency = 'NGN'
+        self.currency = currency
+        self.original_currency = original_currency
+        self.symbol = SUPPORTED_CURRENCIES[currency]['symbol']
+        self._format = CURRENCY_FORMATS[currency][0]
+        self.is_identity = original_currency == currency
+        self.rate = Decimal('1.0') if self.is_identity else get_exchange_rate(original_currency, currency)
+
+    def convert(self, amount):
+        """Convert an amount in the original currency to the target currency"""
+        if not isinstance(amount, Decimal):
+            amount = Decimal(str(amount))
+        if self.is_identity:
+            return amount
+        return (amount * self.rate).quantize(Decimal('0.01'))
+
+    def format(self, amount):
+        """Convert and format an amount with the target currency symbol"""
+        return self._format(self.convert(amount))
+
+    def format_many(self, amounts):
+        """Convert and format a list of amounts"""
+        cent = Decimal('0.01')
+        fmt = self._format
+        formatted = []
+        for amount in amounts:
+            if not isinstance(amount, Decimal):
+                amount = Decimal(str(amount))
+            formatted.append(fmt(amount if self.is_identity else (amount * self.rate).quantize(cent)))
+        return formatted
+
+    def convert_products(self, products):
+        """
+        Attach converted_price (and, for discounted products,
+        converted_original_price and converted_savings) to each product
+        
+        Args:
+            products: Iterable of Product instances
+        
+        Returns:
+            list: The products, with formatted prices attached
+        """
+        products = list(products)
+        for product in products:
+            product.converted_price = self.format(product.get_discounted_price())
+            if product.has_discount:
+                product.converted_original_price = self.format(product.price)
+                product.converted_savings = self.format(product.get_savings())
+        return products
+
+
+def get_price_converter(request=None, original_currency='NGN'):
+    """
+    Get the PriceConverter for this request, creating it on first use
+    
+    Args:
+        request: Django request object (to get user's currency)
+        original_currency: Currency the prices are stored in
+    
+    Returns:
+        PriceConverter
+    """
+    if request is None:
+        return PriceConverter('NGN', original_currency)
+
+    converters = getattr(request, '_price_converters', None)
+    if converters is None:
+        converters = request._price_converters = {}
+
+    if original_currency not in converters:
+        converters[original_currency] = PriceConverter(get_user_currency(request), original_currency)
+    return converters[original_currency]
+
+
 def get_currency_info(currency_code):
     """
     Get currency information
@@ -303,56 +346,100 @@ def get_currency_info(currency_code):
     return SUPPORTED_CURRENCIES.get(currency_code, SUPPORTED_CURRENCIES['NGN'])
 
 
-def batch_update_rates(base_currency='NGN'):
+# CurrencyRate.rate precision
+RATE_PLACES = Decimal('0.000001')
+
+
+def fetch_rates(base_currency):
+    """
+    Fetch every supported rate for one base in a single API call
+    
+    Returns:
+        dict: {quote: Decimal}
+    
+    Raises:
+        requests.RequestException: Network error or non-200 response
+    """
+    url = f"https://api.exchangerate-api.com/v4/latest/{base_currency}"
+    response = requests.get(url, timeout=10)
+    if response.status_code != 200:
+        raise requests.RequestException(f'HTTP {response.status_code}')
+    
+    rates_dict = response.json().get('rates', {})
+    return {
+        code: Decimal(str(rates_dict[code])).quantize(RATE_PLACES)
+        for code in SUPPORTED_CURRENCIES
+        if code != base_currency and code in rates_dict
+    }
+
+
+def batch_update_rates(base_currency='NGN', bases=None, max_workers=None):
     """
     Update all currency rates at once
-    More efficient than individual API calls
+    Bases are fetched concurrently and written with one upsert (plus one
+    rate history INSERT), then the new rate matrix is installed for every
+    process
     
     Args:
         base_currency: Base currency to fetch rates for
+        bases: Several bases to fetch instead (e.g. all SUPPORTED_CURRENCIES)
+        max_workers: Concurrent API calls (default: one per base)
     
     Returns:
-        dict: Status of update
+        dict: Status of update, with the stored 'rates' as {(base, quote): rate}
+        and 'failed' as {base: error}
     """
+    bases = list(bases or [base_currency])
+    fetched = {}
+    failed = {}
+    
+    with ThreadPoolExecutor(max_workers=max_workers or len(bases)) as pool:
+        futures = {pool.submit(fetch_rates, base): base for base in bases}
+        for future in as_completed(futures):
+            base = futures[future]
+            try:
+                fetched[base] = future.result()
+            except Exception as e:
+                failed[base] = str(e)
+                logger.error(f"Batch update failed for {base}: {str(e)}")
+    
+    if not fetched:
+        return {'success': False, 'error': '; '.join(f'{b}: {e}' for b, e in failed.items()), 'failed': failed}
+    
     try:
-        url = f"https://api.exchangerate-api.com/v4/latest/{base_currency}"
-        response = requests.get(url, timeout=10)
+        now = timezone.now()
+        rows = [
+            CurrencyRate(base=base, quote=quote, rate=rate, updated_at=now)
+            for base, quotes in fetched.items()
+            for quote, rate in quotes.items()
+        ]
+        with transaction.atomic():
+            CurrencyRate.objects.bulk_create(
+                rows,
+                update_conflicts=True,
+                unique_fields=['base', 'quote'],
+                update_fields=['rate', 'updated_at'],
+            )
+            CurrencyRateHistory.objects.bulk_create([
+                CurrencyRateHistory(base=row.base, quote=row.quote, rate=row.rate, observed_at=now)
+                for row in rows
+            ])
         
-        if response.status_code == 200:
-            data = response.json()
-            rates_dict = data.get('rates', {})
-            
-            updated_count = 0
-            for currency_code in SUPPORTED_CURRENCIES.keys():
-                if currency_code != base_currency and currency_code in rates_dict:
-                    rate = Decimal(str(rates_dict[currency_code]))
-                    
-                    # Save to database
-                    CurrencyRate.objects.update_or_create(
-                        base=base_currency,
-                        quote=currency_code,
-                        defaults={'rate': rate}
-                    )
-                    
-                    # Cache it
-                    cache_key = f'exchange_rate_{base_currency}_{currency_code}'
-                    cache.set(cache_key, float(rate), 3600)
-                    
-                    updated_count += 1
-                    logger.info(f"Updated: 1 {base_currency} = {rate} {currency_code}")
-            
-            return {
-                'success': True,
-                'updated': updated_count,
-                'base': base_currency
-            }
-        else:
-            logger.error(f"Batch update failed: HTTP {response.status_code}")
-            return {'success': False, 'error': f'HTTP {response.status_code}'}
-            
+        # Swap in the new matrix for every process
+        install_rate_matrix()
     except Exception as e:
         logger.error(f"Batch update error: {str(e)}")
-        return {'success': False, 'error': str(e)}
+        return {'success': False, 'error': str(e), 'failed': failed}
+    
+    logger.info(f"Updated {len(rows)} rates for {', '.join(sorted(fetched))}")
+    return {
+        'success': True,
+        'updated': len(rows),
+        'base': base_currency if len(bases) == 1 else None,
+        'bases': sorted(fetched),
+        'failed': failed,
+        'rates': {(row.base, row.quote): row.rate for row in rows},
+    }
 
 
 # Template filter helpers
@@ -0,0 +1,95 @@
+# main/utils/pagination.py
+"""
+Keyset (cursor) pagination helpers
+Deep pages cost the same as the first page because each page seeks
+past the last row seen instead of counting an OFFSET
+"""
+
+import base64
+import json
+from django.db.models import Q
+
+
+def encode_cursor(value, pk):
+    """
+    Encode the sort value and primary key of the last row on a page
+
+    Args:
+        value: Sort field value of the last row
+        pk: Primary key of the last row (tie-breaker)
+
+    Returns:
+        str: URL-safe cursor token
+    """
+    if hasattr(value, 'isoformat'):
+        value = value.isoformat()
+    payload = json.dumps([str(value), pk], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, model, field):
+    """
+    Decode a cursor token back to (value, pk)
+
+    Args:
+        token: Cursor produced by encode_cursor
+        model: Model class being paginated
+        field: Name of the sort field
+
+    Returns:
+        tuple: (value, pk), or None if the token is invalid
+    """
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        raw_value, pk = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        value = model._meta.get_field(field).to_python(raw_value)
+        return value, int(pk)
+    except Exception:
+        return None
+
+
+def keyset_page(queryset, field, descending=False, cursor=None, page_size=24):
+    """
+    Return one page of a queryset ordered by (field, pk)
+
+    Args:
+        queryset: Filtered queryset (any ordering is replaced)
+        field: Sort field name, without a leading '-'
+        descending: Sort newest/highest first
+        cursor: Cursor token from the previous page (None for the first page)
+        page_size: Number of rows per page
+
+    Returns:
+        dict: {'items': list, 'next_cursor': str or None}
+
+    Works on .values() querysets too, as long as the rows include the
+    sort field and 'id'.
+    """
+    prefix = '-' if descending else ''
+    queryset = queryset.order_by(f'{prefix}{field}', f'{prefix}pk')
+
+    if cursor:
+        position = decode_cursor(cursor, queryset.model, field)
+        if position is not None:
+            value, pk = position
+            op = 'lt' if descending else 'gt'
+            queryset = queryset.filter(
+                Q(**{f'{field}__{op}': value}) |
+                Q(**{field: value, f'pk__{op}': pk})
+            )
+
+    # Fetch one extra row to know whether another page exists
+    items = list(queryset[:page_size + 1])
+    next_cursor = None
+    if len(items) > page_size:
+        items = items[:page_size]
+        last = items[-1]
+        if isinstance(last, dict):
+            next_cursor = encode_cursor(last[field], last['id'])
+        else:
+            next_cursor = encode_cursor(getattr(last, field), last.pk)
+
+    return {
+        'items': items,
+        'next_cursor': next_cursor
+    }
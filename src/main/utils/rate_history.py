@@ -0,0 +1,166 @@
+# main/utils/rate_history.py
+"""
+Point-in-time exchange rates
+Every CurrencyRateHistory row is kept in memory as two sorted arrays
+per pair (timestamps and rates), so "the rate as of t" is one bisect.
+New rows are appended incrementally whenever the shared rates version
+changes (batch_update_rates bumps it).
+
+fx_rate on Order and Payment is the price of 1 unit of the record's
+currency in USD; the *_usd amounts are amount * fx_rate.
+"""
+
+import threading
+from bisect import bisect_right
+from decimal import Decimal
+from django.utils import timezone
+from .rates import PIVOTS, get_rates_version
+import logging
+
+logger = logging.getLogger(__name__)
+
+CENT = Decimal('0.01')
+RATE_PLACES = Decimal('0.000001')
+
+
+class RateHistory:
+    """
+    Sorted rate arrays per (base, quote) pair
+
+    Before a pair's first observation its earliest rate is used, so old
+    records still get the closest rate known.
+    """
+
+    def __init__(self):
+        self.times = {}
+        self.rates = {}
+        self.last_id = 0
+
+    def add(self, base, quote, observed_at, rate):
+        times = self.times.setdefault((base, quote), [])
+        rates = self.rates.setdefault((base, quote), [])
+        ts = observed_at.timestamp()
+        if not times or ts >= times[-1]:
+            times.append(ts)
+            rates.append(Decimal(str(rate)))
+        else:
+            i = bisect_right(times, ts)
+            times.insert(i, ts)
+            rates.insert(i, Decimal(str(rate)))
+
+    def load(self):
+        """
+        Append rows added since the last load
+
+        Returns:
+            int: Rows loaded
+        """
+        from main.models import CurrencyRateHistory
+
+        rows = (
+            CurrencyRateHistory.objects.filter(pk__gt=self.last_id)
+            .order_by('pk')
+            .values_list('pk', 'base', 'quote', 'observed_at', 'rate')
+        )
+        count = 0
+        for pk, base, quote, observed_at, rate in rows.iterator(chunk_size=2000):
+            self.add(base, quote, observed_at, rate)
+            self.last_id = pk
+            count += 1
+        return count
+
+    def _direct(self, base, quote, ts):
+        times = self.times.get((base, quote))
+        if not times:
+            return None
+        i = bisect_right(times, ts)
+        return self.rates[(base, quote)][i - 1 if i else 0]
+
+    def _leg(self, base, quote, ts):
+        if base == quote:
+            return Decimal('1')
+        rate = self._direct(base, quote, ts)
+        if rate is not None:
+            return rate
+        inverse = self._direct(quote, base, ts)
+        if inverse:
+            return Decimal('1') / inverse
+        return None
+
+    def rate(self, from_currency, to_currency, when):
+        """
+        Rate in effect at `when`: direct, inverse, or through a pivot
+
+        Returns:
+            Decimal, or None if the history has no route for the pair
+        """
+        ts = when.timestamp()
+        rate = self._leg(from_currency, to_currency, ts)
+        if rate is not None:
+            return rate
+        for pivot in PIVOTS:
+            via = self._leg(from_currency, pivot, ts)
+            onward = self._leg(pivot, to_currency, ts) if via is not None else None
+            if onward is not None:
+                return via * onward
+        return None
+
+    def __len__(self):
+        return sum(len(times) for times in self.times.values())
+
+
+_history = None
+_version = None
+_lock = threading.Lock()
+
+
+def get_rate_history():
+    """Get the process-wide history, topped up if the rates version moved"""
+    global _history, _version
+
+    version = get_rates_version()
+    with _lock:
+        if _history is None:
+            _history = RateHistory()
+        if _version != version:
+            _history.load()
+            _version = version
+        return _history
+
+
+def reset_rate_history():
+    """Drop this process's history so the next lookup reloads it"""
+    global _history, _version
+    with _lock:
+        _history = None
+        _version = None
+
+
+def rate_as_of(from_currency, to_currency, when=None):
+    """
+    Exchange rate in effect at a point in time
+
+    Falls back to the current rate when the history has no route.
+
+    Returns:
+        Decimal: Exchange rate
+    """
+    if from_currency == to_currency:
+        return Decimal('1')
+    rate = get_rate_history().rate(from_currency, to_currency, when or timezone.now())
+    if rate is None:
+        from .currency import get_exchange_rate
+        rate = get_exchange_rate(from_currency, to_currency)
+    return rate
+
+
+def usd_fx(amount, currency='NGN', when=None):
+    """
+    USD rate and amount for a record
+
+    Returns:
+        tuple: (fx_rate, amount_usd), ready for the model fields
+    """
+    # The stored rate is what amount_usd is computed from
+    rate = rate_as_of(currency, 'USD', when).quantize(RATE_PLACES)
+    return rate, (Decimal(str(amount)) * rate).quantize(CENT)
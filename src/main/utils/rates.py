@@ -0,0 +1,331 @@
+# main/utils/rates.py
+"""
+Exchange-rate matrix
+All CurrencyRate rows are loaded with one query into a 7x7 matrix that
+is shared by every request in the process. Missing pairs are filled
+with inverses and cross rates through a pivot currency, so a page
+render never needs a network call to price something.
+
+batch_update_rates() installs a new matrix and bumps RATES_VERSION_KEY;
+other processes notice the new version within MATRIX_CHECK_INTERVAL.
+
+Rates are served stale-while-revalidate: when a base's rates are older
+than CURRENCY_RATE_MAX_AGE the current ones keep being served while one
+background thread, across all workers, fetches new ones.
+"""
+
+import threading
+import time
+from decimal import Decimal
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, connection
+from django.utils import timezone
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Matrix axis order; must match SUPPORTED_CURRENCIES in currency.py
+CURRENCIES = ('NGN', 'USD', 'GHS', 'KES', 'ZAR', 'EUR', 'GBP')
+INDEX = {code: i for i, code in enumerate(CURRENCIES)}
+SIZE = len(CURRENCIES)
+
+# Preferred pivots for cross rates, most liquid first
+PIVOTS = ('USD', 'EUR', 'NGN')
+
+RATES_VERSION_KEY = 'currency:rates_version'
+RATES_MATRIX_KEY = 'currency:rates_matrix'
+
+# How often a process checks the shared version and rate age (seconds)
+MATRIX_CHECK_INTERVAL = 5
+
+# One refresh per base at a time across workers; a failed refresh is
+# not retried until the lock expires
+REFRESH_LOCK_KEY = 'currency:refresh_lock:{base}'
+REFRESH_LOCK_TIMEOUT = 120
+
+# Base fetched when no rates are stored at all
+DEFAULT_BASE = 'NGN'
+
+
+class RateMatrix:
+    """
+    Immutable SIZE x SIZE matrix of exchange rates
+
+    rates is a flat tuple of Decimal (or None where no rate is known);
+    rates[INDEX[a] * SIZE + INDEX[b]] is the price of 1 a in b.
+    as_of holds when each rate was fetched (None if unknown); a derived
+    rate is as old as the oldest rate it was built from. Use with_version()
+    for a copy stamped with another version.
+    """
+
+    __slots__ = ('rates', 'as_of', 'direct', 'version')
+
+    def __init__(self, rates, as_of=None, direct=frozenset(), version=None):
+        self.rates = tuple(rates)
+        self.as_of = tuple(as_of) if as_of is not None else (None,) * len(self.rates)
+        self.direct = frozenset(direct)
+        self.version = version
+
+    @classmethod
+    def from_pairs(cls, pairs, version=None):
+        """
+        Build a matrix from known rates, deriving the missing pairs
+
+        Args:
+            pairs: {(base, quote): rate} or iterable of
+                (base, quote, rate) / (base, quote, rate, fetched_at)
+
+        Returns:
+            RateMatrix
+        """
+        if isinstance(pairs, dict):
+            pairs = ((base, quote, rate) for (base, quote), rate in pairs.items())
+
+        rates = [None] * (SIZE * SIZE)
+        as_of = [None] * (SIZE * SIZE)
+        for i in range(SIZE):
+            rates[i * SIZE + i] = Decimal('1')
+
+        direct = set()
+        for base, quote, rate, *fetched_at in pairs:
+            if base in INDEX and quote in INDEX and base != quote and rate:
+                cell = INDEX[base] * SIZE + INDEX[quote]
+                rates[cell] = Decimal(str(rate))
+                as_of[cell] = fetched_at[0] if fetched_at else None
+                direct.add((base, quote))
+
+        # Inverses of direct quotes
+        for base, quote in direct:
+            cell = INDEX[base] * SIZE + INDEX[quote]
+            inverse = INDEX[quote] * SIZE + INDEX[base]
+            if rates[inverse] is None:
+                rates[inverse] = Decimal('1') / rates[cell]
+                as_of[inverse] = as_of[cell]
+
+        # Cross rates: a -> pivot -> b, repeated until nothing new is found
+        pivots = [INDEX[p] for p in PIVOTS] + [i for i in range(SIZE) if CURRENCIES[i] not in PIVOTS]
+        changed = True
+        while changed:
+            changed = False
+            for a in range(SIZE):
+                for b in range(SIZE):
+                    if rates[a * SIZE + b] is not None:
+                        continue
+                    for p in pivots:
+                        via, onward = rates[a * SIZE + p], rates[p * SIZE + b]
+                        if via is not None and onward is not None:
+                            rates[a * SIZE + b] = via * onward
+                            as_of[a * SIZE + b] = _oldest(as_of[a * SIZE + p], as_of[p * SIZE + b])
+                            changed = True
+                            break
+
+        return cls(rates, as_of, direct, version)
+
+    def with_version(self, version):
+        """The same rates under another shared version (the tuples are shared, not copied)"""
+        return RateMatrix(self.rates, self.as_of, self.direct, version)
+
+    def rate(self, from_currency, to_currency):
+        """Price of 1 from_currency in to_currency, or None if unknown"""
+        try:
+            return self.rates[INDEX[from_currency] * SIZE + INDEX[to_currency]]
+        except KeyError:
+            return None
+
+    def row(self, base):
+        """
+        All rates from one base currency
+
+        Returns:
+            dict: {quote: Decimal or None}
+        """
+        start = INDEX[base] * SIZE
+        return dict(zip(CURRENCIES, self.rates[start:start + SIZE]))
+
+    def age(self, from_currency, to_currency, now=None):
+        """
+        Seconds since a rate was fetched
+
+        Returns:
+            float, or None when the rate or its fetch time is unknown
+        """
+        try:
+            fetched_at = self.as_of[INDEX[from_currency] * SIZE + INDEX[to_currency]]
+        except KeyError:
+            return None
+        if fetched_at is None:
+            return None
+        return ((now or timezone.now()) - fetched_at).total_seconds()
+
+    def fetched_at(self):
+        """
+        Oldest fetch time of each base's stored rates
+
+        Returns:
+            dict: {base: datetime or None}
+        """
+        bases = {}
+        for base, quote in self.direct:
+            when = self.as_of[INDEX[base] * SIZE + INDEX[quote]]
+            bases[base] = _oldest(bases[base], when) if base in bases else when
+        return bases
+
+    def stale_bases(self, max_age, now=None):
+        """Bases whose stored rates are older than max_age seconds"""
+        if not self.direct:
+            return [DEFAULT_BASE]
+        cutoff = (now or timezone.now()).timestamp() - max_age
+        return sorted(
+            base for base, when in self.fetched_at().items()
+            if when is None or when.timestamp() < cutoff
+        )
+
+    def is_complete(self):
+        return None not in self.rates
+
+    def __repr__(self):
+        return f'<RateMatrix version={self.version} direct={len(self.direct)}>'
+
+
+def _oldest(a, b):
+    if a is None or b is None:
+        return None
+    return min(a, b)
+
+
+def get_rates_version():
+    """Get the current shared rates version (starts at 1)"""
+    version = cache.get(RATES_VERSION_KEY)
+    if version is None:
+        cache.add(RATES_VERSION_KEY, 1, None)
+        version = cache.get(RATES_VERSION_KEY, 1)
+    return version
+
+
+def bump_rates_version():
+    """Tell every process to pick up the newest matrix"""
+    try:
+        return cache.incr(RATES_VERSION_KEY)
+    except ValueError:
+        # Key missing (evicted or never set)
+        cache.add(RATES_VERSION_KEY, 1, None)
+        return cache.incr(RATES_VERSION_KEY)
+
+
+def load_rate_matrix(version=None):
+    """Build a matrix from every CurrencyRate row (one query)"""
+    from main.models import CurrencyRate
+    return RateMatrix.from_pairs(
+        CurrencyRate.objects.values_list('base', 'quote', 'rate', 'updated_at'), version
+    )
+
+
+_matrix = None
+_checked_at = 0.0
+_lock = threading.Lock()
+
+
+def get_rate_matrix():
+    """
+    Get the process-wide rate matrix
+
+    The shared version is checked at most every MATRIX_CHECK_INTERVAL
+    seconds; a newer version is taken from the cache, or rebuilt from
+    the database by one thread while the others keep the current matrix.
+    If the database cannot be read the last matrix keeps being served.
+    """
+    global _matrix, _checked_at
+
+    matrix = _matrix
+    now = time.monotonic()
+    if matrix is not None and now - _checked_at < MATRIX_CHECK_INTERVAL:
+        return matrix
+
+    if not _lock.acquire(blocking=matrix is None):
+        return matrix
+    try:
+        if _matrix is not None and now - _checked_at < MATRIX_CHECK_INTERVAL:
+            return _matrix
+        _checked_at = now
+
+        version = get_rates_version()
+        if _matrix is None or _matrix.version != version:
+            shared = cache.get(RATES_MATRIX_KEY)
+            if shared is not None and shared.version == version:
+                _matrix = shared
+            else:
+                try:
+                    _matrix = load_rate_matrix(version)
+                    cache.set(RATES_MATRIX_KEY, _matrix, None)
+                except DatabaseError as e:
+                    logger.error(f"Could not load exchange rates: {str(e)}")
+                    if _matrix is None:
+                        # Serve the last published matrix; retry the load next check
+                        _matrix = (shared if shared is not None else RateMatrix.from_pairs([])).with_version(None)
+
+        if getattr(settings, 'CURRENCY_BACKGROUND_REFRESH', True):
+            for base in _matrix.stale_bases(getattr(settings, 'CURRENCY_RATE_MAX_AGE', 3600)):
+                schedule_refresh(base)
+
+        return _matrix
+    finally:
+        _lock.release()
+
+
+def schedule_refresh(base):
+    """
+    Refresh one base's rates in a background thread
+
+    Returns:
+        bool: False if a refresh of this base is already running (or
+        recently failed) in any worker
+    """
+    if not cache.add(REFRESH_LOCK_KEY.format(base=base), 1, REFRESH_LOCK_TIMEOUT):
+        return False
+    threading.Thread(target=_refresh, args=(base,), name=f'rates-refresh-{base}', daemon=True).start()
+    return True
+
+
+def _refresh(base):
+    from .currency import batch_update_rates
+
+    try:
+        result = batch_update_rates(base)
+        if result['success']:
+            cache.delete(REFRESH_LOCK_KEY.format(base=base))
+        else:
+            logger.warning(f"Background refresh of {base} rates failed: {result.get('error')}")
+    finally:
+        connection.close()
+
+
+def install_rate_matrix(matrix=None):
+    """
+    Publish a new matrix (default: rebuilt from the database)
+
+    The new matrix replaces the old one in a single assignment, so
+    readers see either the old or the new matrix, never a mix.
+
+    Returns:
+        RateMatrix
+    """
+    global _matrix, _checked_at
+
+    version = bump_rates_version()
+    if matrix is None:
+        matrix = load_rate_matrix(version)
+    else:
+        matrix = matrix.with_version(version)
+    cache.set(RATES_MATRIX_KEY, matrix, None)
+    _matrix = matrix
+    _checked_at = time.monotonic()
+    logger.info(f"Installed rate matrix version {version} ({len(matrix.direct)} direct rates)")
+    return matrix
+
+
+def reset_rate_matrix():
+    """Drop this process's matrix so the next lookup reloads it"""
+    global _matrix, _checked_at
+    _matrix = None
+    _checked_at = 0.0
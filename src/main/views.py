@@ -9,116 +9,139 @@ from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
 from .utils.currency import set_user_currency, SUPPORTED_CURRENCIES, get_exchange_rate, batch_update_rates
-from .models import Order, OrderItem, Product, Wallet, Payment
+from .utils.rates import get_rate_matrix
+from .utils.rate_history import usd_fx
+from .models import Order, Product, Wallet, Payment
 from decimal import Decimal
-from .cart import get_cart, save_cart, get_cart_items,cart_view,update_cart,remove_from_cart,clear_cart
-import uuid
-import requests
-import json
-from django.db.models import Q
-from main.utils.currency import convert_currency, get_user_currency,set_user_currency,convert_price_to_user_currency
+from .cart import get_cart, save_cart, get_cart_items, get_cart_totals,cart_view,update_cart,remove_from_cart,clear_cart, CartFull
+import hmac
+from django.core.paginator import Paginator
+from .utils.pagination import keyset_page, encode_cursor
+from .search import search_products, search_filter
+from .catalogue import get_home_data
+from .recommendations import get_related_products
+from .stock import reserve_stock, InsufficientStock
+from .orders import create_orders, mark_order_paid
+from .payouts import enqueue_payout
+from .webhooks import record_event
+from .flutterwave import get_client, FlutterwaveError
+from main.utils.currency import convert_currency, get_user_currency,set_user_currency,convert_price_to_user_currency,get_price_converter
 
 
 def home(request):
     """Home page with featured products and discount handling"""
-    # Get featured products or latest 12 products
-    products = Product.objects.filter(is_featured=True).order_by('-created_at')[:12]
+    currency = get_user_currency(request)
     
-    # If no featured products, get latest products
-    if not products.exists():
-        products = Product.objects.filter(stock__gt=0).order_by('-created_at')[:12]
-    
-    # Convert prices to user's currency and handle discounts
-    for product in products:
-        # Use discounted price if available
-        price_to_convert = product.get_discounted_price()
-        
-        price_info = convert_price_to_user_currency(
-            price_to_convert,
-            'NGN',
-            request
-        )
-        product.converted_price = price_info['formatted']
-        
-        # If product has discount, also convert original price and savings
-        if product.has_discount:
-            # Convert original price
-            original_price_info = convert_price_to_user_currency(
-                product.price,
-                'NGN',
-                request
-            )
-            product.converted_original_price = original_price_info['formatted']
-            
-            # Convert savings amount
-            savings_info = convert_price_to_user_currency(
-                product.get_savings(),
-                'NGN',
-                request
-            )
-            product.converted_savings = savings_info['formatted']
-    
-    # Get all categories
-    from .models import Category
-    categories = Category.objects.all()
+    # Products, categories and counts are served from cache per currency
+    home_data = get_home_data(currency)
     
     context = {
-        'products': products,
-        'categories': categories,
-        'total_products': Product.objects.count(),
+        'products': home_data['products'],
+        'categories': home_data['categories'],
+        'total_products': home_data['total_products'],
         'supported_currencies': SUPPORTED_CURRENCIES,
-        'user_currency': get_user_currency(request)
+        'user_currency': currency
     }
     return render(request, 'main/home.html', context)
 
 
+# Sort options for product_list: query param -> (field, descending)
+PRODUCT_SORTS = {
+    'price_low': ('price', False),
+    'price_high': ('price', True),
+    'name': ('name', False),
+    '-created_at': ('created_at', True),
+}
+
+PRODUCTS_PER_PAGE = 24
+
+
 def product_list(request):
     """List all products with search and filter"""
     products = Product.objects.filter(stock__gt=0)
-
-    for product in products:
-        price_info = convert_price_to_user_currency(
-            product.price, 
-            'NGN',  # Original currency
-            request
-        )
-        product.converted_price = price_info['formatted']
-    
     
+    # Filter first so only matching rows are ever fetched
     search_query = request.GET.get('search', '')
-    if search_query:
-        products = products.filter(
-            Q(name__icontains=search_query) | 
-            Q(description__icontains=search_query)
-        )
-    
-    # Sort
-    sort_by = request.GET.get('sort', '-created_at')
-    if sort_by == 'price_low':
-        products = products.order_by('price')
-    elif sort_by == 'price_high':
-        products = products.order_by('-price')
-    elif sort_by == 'name':
-        products = products.order_by('name')
+    
+    # Sort (search results default to relevance)
+    default_sort = 'relevance' if search_query else '-created_at'
+    sort_by = request.GET.get('sort', default_sort)
+    if sort_by not in PRODUCT_SORTS and not (sort_by == 'relevance' and search_query):
+        sort_by = default_sort
+    
+    # Relevance pages through the top ranked hits, other sorts filter by
+    # every match so the cheapest/newest product is never cut off
+    ranked_ids = None
+    if sort_by == 'relevance':
+        ranked_ids = search_products(search_query)
+        products = products.filter(pk__in=ranked_ids)
+    elif search_query:
+        products = products.filter(search_filter(search_query))
+    
+    # Paginate: cursor pages stay O(page) however deep the user scrolls,
+    # numbered pages are kept for the first few pages of results
+    cursor = request.GET.get('cursor')
+    page_obj = None
+    if sort_by == 'relevance':
+        # Page through the ranked in-stock ids, then load only that page's rows
+        in_stock = set(products.values_list('pk', flat=True))
+        ranked_ids = [pk for pk in ranked_ids if pk in in_stock]
+        page_obj = Paginator(ranked_ids, PRODUCTS_PER_PAGE).get_page(request.GET.get('page'))
+        page_map = Product.objects.in_bulk(list(page_obj.object_list))
+        page_products = [page_map[pk] for pk in page_obj.object_list if pk in page_map]
+        next_cursor = None
+    elif cursor or 'page' not in request.GET:
+        sort_field, descending = PRODUCT_SORTS[sort_by]
+        page = keyset_page(products, sort_field, descending, cursor, PRODUCTS_PER_PAGE)
+        page_products = page['items']
+        next_cursor = page['next_cursor']
     else:
-        products = products.order_by('-created_at')
+        sort_field, descending = PRODUCT_SORTS[sort_by]
+        prefix = '-' if descending else ''
+        products = products.order_by(f'{prefix}{sort_field}', f'{prefix}pk')
+        page_obj = Paginator(products, PRODUCTS_PER_PAGE).get_page(request.GET.get('page'))
+        page_products = list(page_obj.object_list)
+        next_cursor = None
+        if page_obj.has_next() and page_products:
+            last = page_products[-1]
+            next_cursor = encode_cursor(getattr(last, sort_field), last.pk)
+    
+    # Convert prices only for the page being rendered
+    converter = get_price_converter(request)
+    for product in page_products:
+        product.converted_price = converter.format(product.price)
     
     context = {
-        'products': products,
+        'products': page_products,
+        'page_obj': page_obj,
+        'next_cursor': next_cursor,
         'search_query': search_query,
         'sort_by': sort_by
     }
     return render(request, 'main/product_list.html', context)
 
 
+def product_suggest(request):
+    """Type-ahead product suggestions via AJAX"""
+    query = request.GET.get('q', '')
+    product_ids = search_products(query, limit=8, prefix=True)
+    products = Product.objects.in_bulk(product_ids)
+    
+    return JsonResponse({
+        'results': [
+            {'id': pk, 'name': products[pk].name}
+            for pk in product_ids if pk in products
+        ]
+    })
+
+
 def product_detail(request, product_id):
     """Product detail page"""
-    product = get_object_or_404(Product, id=product_id)
+    # Load the precomputed neighbour list in the same query as the product
+    product = get_object_or_404(Product.objects.select_related('neighbours'), id=product_id)
     
-    # Get related products (same category or random)
-    related_products = Product.objects.filter(
-        stock__gt=0
-    ).exclude(id=product_id).order_by('?')[:4]
+    # Get related products (co-purchased or same category)
+    related_products = get_related_products(product)
     
     context = {
         'product': product,
@@ -146,7 +169,12 @@ def add_to_cart(request, product_id):
         return redirect('product_detail', product_id=product.id)
     
     cart[product_id_str] = new_quantity
-    save_cart(request, cart)
+    try:
+        save_cart(request, cart)
+    except CartFull as e:
+        del cart[product_id_str]
+        messages.error(request, str(e))
+        return redirect('product_detail', product_id=product.id)
     
     messages.success(request, f'Added {quantity} x {product.name} to cart')
     return redirect('cart')
@@ -228,53 +256,20 @@ def checkout(request):
         
         try:
             with transaction.atomic():
-                # Group items by seller
-                items_by_seller = {}
-                for item in cart_data['items']:
-                    # Get seller from product or default to request.user (for marketplace)
-                    seller = getattr(item['product'], 'seller', request.user)
-                    
-                    if seller not in items_by_seller:
-                        items_by_seller[seller] = []
-                    
-                    items_by_seller[seller].append(item)
+                # Reserve stock for every line in one conditional UPDATE
+                reserve_stock(
+                    (item['product'].id, item['quantity']) for item in cart_data['items']
+                )
                 
-                # Create separate order for each seller
-                created_orders = []
-                
-                for seller, items in items_by_seller.items():
-                    # Calculate total for this seller's items
-                    order_total = sum(item['subtotal'] for item in items)
-                    
-                    # Create order
-                    order = Order.objects.create(
-                        buyer=request.user,
-                        seller=seller,
-                        total_amount=order_total,
-                        shipping_address=full_shipping_address,
-                        status='pending',
-                        payment_status='pending'
-                    )
-                    
-                    # Create order items and reduce stock
-                    for item in items:
-                        OrderItem.objects.create(
-                            order=order,
-                            product=item['product'],
-                            quantity=item['quantity'],
-                            price=item['product'].price
-                        )
-                        
-                        # Reduce product stock
-                        product = item['product']
-                        product.stock -= item['quantity']
-                        product.save()
-                    
-                    created_orders.append(order)
+                # Create one order per seller with bulk inserts
+                created_orders = create_orders(
+                    request.user,
+                    cart_data['items'],
+                    full_shipping_address
+                )
                 
                 # Clear cart
-                request.session['cart'] = {}
-                request.session.modified = True
+                save_cart(request, {})
                 
                 # If only one order, redirect to payment
                 if len(created_orders) == 1:
@@ -285,6 +280,16 @@ def checkout(request):
                     messages.success(request, f"{len(created_orders)} orders placed successfully! Please complete payments.")
                     return redirect('my_orders')
         
+        except InsufficientStock as e:
+            names = {item['product'].id: item['product'].name for item in cart_data['items']}
+            for shortfall in e.shortfalls:
+                messages.error(
+                    request,
+                    f"{names.get(shortfall['product_id'], 'An item')} only has {shortfall['available']} units in stock"
+                )
+            if not e.shortfalls:
+                messages.error(request, "Some items in your cart are no longer in stock")
+            return redirect('cart')
         except Exception as e:
             messages.error(request, f"Error creating order: {str(e)}")
             return redirect('cart')
@@ -340,9 +345,16 @@ def ajax_add_to_cart(request, product_id):
             })
         
         cart[product_id_str] = new_quantity
-        save_cart(request, cart)
+        try:
+            save_cart(request, cart)
+        except CartFull as e:
+            del cart[product_id_str]
+            return JsonResponse({
+                'success': False,
+                'message': str(e)
+            })
         
-        cart_data = get_cart_items(request)
+        cart_data = get_cart_totals(request)
         
         return JsonResponse({
             'success': True,
@@ -356,7 +368,7 @@ def ajax_add_to_cart(request, product_id):
 
 def get_cart_count(request):
     """Get cart count via AJAX"""
-    cart_data = get_cart_items(request)
+    cart_data = get_cart_totals(request)
     return JsonResponse({
         'count': cart_data['count'],
         'total': str(cart_data['total'])
@@ -387,14 +399,15 @@ def get_currency_rates(request):
     Return JSON of currency exchange rates relative to a base currency.
     GET params:
       - base: base currency code (default: 'NGN')
-      - refresh: if '1' forces fetching updated rates
+      - refresh: if '1' forces fetching updated rates (staff only)
     """
     base = request.GET.get('base', 'NGN').upper()
     if base not in SUPPORTED_CURRENCIES:
         return JsonResponse({'success': False, 'error': 'Invalid base currency'}, status=400)
 
-    # Optionally refresh rates (will call external API once)
-    if request.GET.get('refresh') == '1':
+    # Optionally refresh rates (will call external API once); other
+    # requests are served from the in-process rate matrix
+    if request.GET.get('refresh') == '1' and request.user.is_staff:
         try:
             batch_update_rates(base_currency=base)
         except Exception:
@@ -411,7 +424,13 @@ def get_currency_rates(request):
             except Exception:
                 rates[code] = None
 
-    return JsonResponse({'success': True, 'base': base, 'rates': rates})
+    # Age of the oldest stored rate served (None while only fallback rates exist)
+    matrix = get_rate_matrix()
+    ages = [matrix.age(base, code) for code in SUPPORTED_CURRENCIES if code != base]
+    ages = [a for a in ages if a is not None]
+    age = int(max(ages)) if ages else None
+
+    return JsonResponse({'success': True, 'base': base, 'rates': rates, 'age_seconds': age})
 
 
 @login_required
@@ -501,33 +520,44 @@ def normal_payment_callback(request):
                 
                 # Allow for small rounding differences
                 if abs(amount_paid - expected_amount) < 0.01:
-                    with transaction.atomic():
-                        # Update order payment status
-                        order.payment_status = 'paid'
-                        order.payment_method = 'flutterwave'
-                        order.payment_reference = transaction_id
-                        order.paid_at = timezone.now()
-                        order.status = 'processing'
-                        order.save()
-                        
-                        # Credit seller's wallet
-                        transfer_result = transfer_to_seller(order.seller, order.total_amount)
+                    try:
+                        with transaction.atomic():
+                            # Locks the order, so unlock_stock can't release it meanwhile
+                            mark_order_paid(order.id, payment_reference=transaction_id)
+                            
+                            # Queue the seller payout; process_payouts makes the transfer
+                            payout = enqueue_payout(
+                                order.seller, order.total_amount,
+                                reference=f'PAYOUT-ORDER-{order.id}',
+                                description=f'Payment for Order #{order.id}'
+                            )
                         
-                        # Create payment record
-                        Payment.objects.create(
-                            order=order,
-                            user=request.user,
-                            amount=amount_paid,
-                            currency=verification_result.get('currency', 'NGN'),
-                            payment_method='flutterwave',
-                            reference=transaction_id,
-                            status='successful',
-                            completed_at=timezone.now(),
-                            metadata={
-                                'transfer_method': transfer_result.get('method'),
-                                'transfer_message': transfer_result.get('message')
-                            }
+                            # Create payment record, stamped with the USD rate at payment time
+                            currency = verification_result.get('currency', 'NGN')
+                            fx_rate, amount_usd = usd_fx(amount_paid, currency)
+                            Payment.objects.create(
+                                order=order,
+                                user=request.user,
+                                amount=amount_paid,
+                                amount_usd=amount_usd,
+                                fx_rate=fx_rate,
+                                currency=currency,
+                                payment_method='flutterwave',
+                                reference=transaction_id,
+                                status='successful',
+                                completed_at=timezone.now(),
+                                metadata={
+                                    'payout_reference': payout.reference
+                                }
+                            )
+                    except InsufficientStock:
+                        # Unpaid too long: the stock was released and has sold out since
+                        messages.error(
+                            request,
+                            "Your payment was received, but some items in this order are no longer in stock. "
+                            "Our support team will contact you about a refund."
                         )
+                        return redirect('order_detail', order_id=order.id)
                     
                     messages.success(request, "Payment successful! Your order is being processed.")
                     return redirect('order_detail', order_id=order.id)
@@ -588,95 +618,34 @@ def payment_detail(request, payment_id):
 def verify_payment_webhook(request):
     """
     Handle Flutterwave webhook notifications for payment events
-    This is called by Flutterwave, not by users directly
+    This is called by Flutterwave, not by users directly.
+    The event is only stored here; process_webhooks applies it.
     """
     if request.method != 'POST':
         return JsonResponse({'status': 'error', 'message': 'Method not allowed'}, status=405)
     
     # Verify webhook signature
-    signature = request.headers.get('verif-hash')
+    signature = request.headers.get('verif-hash') or ''
     
-    if hasattr(settings, 'FLUTTERWAVE_WEBHOOK_SECRET'):
-        if signature != settings.FLUTTERWAVE_WEBHOOK_SECRET:
+    if settings.FLUTTERWAVE_WEBHOOK_SECRET:
+        if not hmac.compare_digest(signature, settings.FLUTTERWAVE_WEBHOOK_SECRET):
             return JsonResponse({'status': 'error', 'message': 'Invalid signature'}, status=400)
     
     try:
-        data = json.loads(request.body)
-        event = data.get('event')
-        
-        if event == 'charge.completed':
-            transaction_data = data.get('data', {})
-            tx_ref = transaction_data.get('tx_ref')
-            status = transaction_data.get('status')
-            
-            if status == 'successful':
-                # Check transaction type
-                if 'ESC-' in tx_ref:
-                    # Escrow payment - import here to avoid circular imports
-                    from escrow.models import EscrowTransaction
-                    
-                    try:
-                        escrow_id = tx_ref.split('-')[-1]
-                        escrow = EscrowTransaction.objects.get(id=escrow_id)
-                        
-                        if escrow.status == 'pending_payment':
-                            with transaction.atomic():
-                                escrow.status = 'in_escrow'
-                                escrow.payment_received_at = timezone.now()
-                                escrow.payment_reference = transaction_data.get('id')
-                                escrow.save()
-                        
-                        # TODO: Send notifications
-                        # send_notification(escrow.buyer, 'payment_confirmed', escrow)
-                        # send_notification(escrow.seller, 'payment_received', escrow)
-                    except EscrowTransaction.DoesNotExist:
-                        pass
-                
-                elif 'ORDER-' in tx_ref:
-                    # Normal payment
-                    try:
-                        order_id = tx_ref.split('-')[1]
-                        order = Order.objects.get(id=order_id)
-                        
-                        if order.payment_status != 'paid':
-                            with transaction.atomic():
-                                order.payment_status = 'paid'
-                                order.payment_reference = transaction_data.get('id')
-                                order.paid_at = timezone.now()
-                                order.status = 'processing'
-                                order.save()
-                                
-                                # Credit seller
-                                transfer_to_seller(order.seller, order.total_amount)
-                        
-                        # TODO: Send notifications
-                        # send_notification(order.buyer, 'payment_confirmed', order)
-                        # send_notification(order.seller, 'new_order', order)
-                    except Order.DoesNotExist:
-                        pass
-        
-        return JsonResponse({'status': 'success'}, status=200)
-    
-    except json.JSONDecodeError:
+        record_event(request.body)
+    except ValueError:
         return JsonResponse({'status': 'error', 'message': 'Invalid JSON'}, status=400)
-    except Exception as e:
-        return JsonResponse({'status': 'error', 'message': str(e)}, status=500)
+    
+    return JsonResponse({'status': 'success'}, status=200)
 
 
 
 
 def initialize_normal_flutterwave_payment(order):
     """Initialize normal (non-escrow) payment with Flutterwave"""
-    url = "https://api.flutterwave.com/v3/payments"
-    
     # Generate unique transaction reference
     tx_ref = f"ORDER-{order.id}-{int(timezone.now().timestamp())}"
     
-    headers = {
-        'Authorization': f'Bearer {settings.FLUTTERWAVE_SECRET_KEY}',
-        'Content-Type': 'application/json'
-    }
-    
     payload = {
         "tx_ref": tx_ref,
         "amount": str(order.total_amount),
@@ -701,9 +670,7 @@ def initialize_normal_flutterwave_payment(order):
     }
     
     try:
-        response = requests.post(url, json=payload, headers=headers, timeout=10)
-        response.raise_for_status()
-        data = response.json()
+        data = get_client().initialize_payment(payload)
         
         if data.get('status') == 'success':
             return {
@@ -716,7 +683,7 @@ def initialize_normal_flutterwave_payment(order):
                 'success': False,
                 'message': data.get('message', 'Payment initialization failed')
             }
-    except requests.exceptions.RequestException as e:
+    except FlutterwaveError as e:
         return {
             'success': False,
             'message': f'Network error: {str(e)}'
@@ -728,17 +695,8 @@ def dashboard(request):
 
 def verify_flutterwave_payment(transaction_id):
     """Verify payment with Flutterwave"""
-    url = f"https://api.flutterwave.com/v3/transactions/{transaction_id}/verify"
-    
-    headers = {
-        'Authorization': f'Bearer {settings.FLUTTERWAVE_SECRET_KEY}',
-        'Content-Type': 'application/json'
-    }
-    
     try:
-        response = requests.get(url, headers=headers, timeout=10)
-        response.raise_for_status()
-        data = response.json()
+        data = get_client().verify_transaction(transaction_id)
         
         if data.get('status') == 'success':
             transaction_data = data.get('data', {})
@@ -762,83 +720,13 @@ def verify_flutterwave_payment(transaction_id):
                 'success': False,
                 'message': data.get('message', 'Verification failed')
             }
-    except requests.exceptions.RequestException as e:
+    except FlutterwaveError as e:
         return {
             'success': False,
             'message': f'Network error: {str(e)}'
         }
 
 
-def transfer_to_seller(seller, amount):
-    """
-    Transfer funds to seller's account/wallet
-    
-    First tries to transfer to bank account via Flutterwave,
-    falls back to crediting wallet if that fails
-    """
-    
-    # Check if seller has bank account details
-    if not hasattr(seller, 'bank_account'):
-        # No bank account model - credit wallet directly
-        wallet, created = Wallet.objects.get_or_create(user=seller)
-        wallet.credit(amount)
-        return {
-            'success': True,
-            'method': 'wallet',
-            'message': 'Credited to wallet (no bank account linked)'
-        }
-    
-    # Try bank transfer via Flutterwave
-    url = "https://api.flutterwave.com/v3/transfers"
-    
-    headers = {
-        'Authorization': f'Bearer {settings.FLUTTERWAVE_SECRET_KEY}',
-        'Content-Type': 'application/json'
-    }
-    
-    payload = {
-        "account_bank": seller.bank_account.bank_code,
-        "account_number": seller.bank_account.account_number,
-        "amount": float(amount),
-        "currency": "NGN",
-        "narration": "Payment for order",
-        "reference": f"TRANSFER-{uuid.uuid4().hex[:12].upper()}",
-        "callback_url": f"{settings.SITE_URL}/payment/transfer-callback/",
-        "debit_currency": "NGN"
-    }
-    
-    try:
-        response = requests.post(url, json=payload, headers=headers, timeout=10)
-        response.raise_for_status()
-        data = response.json()
-        
-        if data.get('status') == 'success':
-            return {
-                'success': True,
-                'method': 'bank_transfer',
-                'reference': data['data'].get('reference'),
-                'message': 'Bank transfer initiated'
-            }
-        else:
-            # Fallback to wallet
-            wallet, created = Wallet.objects.get_or_create(user=seller)
-            wallet.credit(amount)
-            return {
-                'success': True,
-                'method': 'wallet',
-                'message': f"Bank transfer failed, credited to wallet: {data.get('message')}"
-            }
-    except Exception as e:
-        # Fallback to wallet on any error
-        wallet, created = Wallet.objects.get_or_create(user=seller)
-        wallet.credit(amount)
-        return {
-            'success': True,
-            'method': 'wallet',
-            'message': f'Transfer error, credited to wallet: {str(e)}'
-        }
-
-
 # ========================================
 # ESCROW HELPER FUNCTION
 # (Used by escrow app)
@@ -849,16 +737,9 @@ def initialize_flutterwave_payment(escrow):
     Initialize escrow payment with Flutterwave
     This function is called from escrow app
     """
-    url = "https://api.flutterwave.com/v3/payments"
-    
     # Generate unique transaction reference
     tx_ref = f"{escrow.transaction_id}-{escrow.id}"
     
-    headers = {
-        'Authorization': f'Bearer {settings.FLUTTERWAVE_SECRET_KEY}',
-        'Content-Type': 'application/json'
-    }
-    
     payload = {
         "tx_ref": tx_ref,
         "amount": str(escrow.total_amount),
@@ -882,9 +763,7 @@ def initialize_flutterwave_payment(escrow):
     }
     
     try:
-        response = requests.post(url, json=payload, headers=headers, timeout=10)
-        response.raise_for_status()
-        data = response.json()
+        data = get_client().initialize_payment(payload)
         
         if data.get('status') == 'success':
             return {
@@ -897,7 +776,7 @@ def initialize_flutterwave_payment(escrow):
                 'success': False,
                 'message': data.get('message', 'Payment initialization failed')
             }
-    except requests.exceptions.RequestException as e:
+    except FlutterwaveError as e:
         return {
             'success': False,
             'message': f'Network error: {str(e)}'
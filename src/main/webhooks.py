@@ -0,0 +1,217 @@
+# main/webhooks.py
+"""
+Flutterwave webhook inbox
+verify_payment_webhook stores each delivery with record_event() and
+returns immediately; process_webhooks applies stored events in batches.
+An event's effects and its 'processed' mark commit in the same
+transaction, so every event is applied exactly once. Emails go out
+after that commit, so a failed or rolled-back event sends none.
+"""
+
+import hashlib
+import json
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from .models import Order, Payout, WebhookEvent
+from .orders import mark_order_paid
+from .payouts import enqueue_payouts
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Events left in 'processing' by a worker that died are reclaimed after this long
+CLAIM_TIMEOUT = timedelta(minutes=5)
+
+
+def parse_event(body):
+    """
+    Build an unsaved WebhookEvent from a raw request body
+
+    Raises:
+        ValueError: body is not a JSON object
+    """
+    data = json.loads(body)
+    if not isinstance(data, dict):
+        raise ValueError('Webhook body must be a JSON object')
+
+    transaction_id = (data.get('data') or {}).get('id')
+    if transaction_id in (None, ''):
+        transaction_id = 'sha256:' + hashlib.sha256(body).hexdigest()
+
+    return WebhookEvent(
+        event_type=str(data.get('event') or data.get('event.type') or 'unknown')[:50],
+        transaction_id=str(transaction_id)[:100],
+        payload=data,
+    )
+
+
+def record_event(body):
+    """
+    Store a webhook delivery, ignoring redeliveries (one INSERT, no lookups)
+
+    Raises:
+        ValueError: body is not a JSON object
+    """
+    WebhookEvent.objects.bulk_create([parse_event(body)], ignore_conflicts=True)
+
+
+def claim_events(limit=100):
+    """
+    Claim a batch of pending events, skipping rows locked by another worker
+
+    Returns:
+        list: Claimed WebhookEvent objects, oldest first
+    """
+    now = timezone.now()
+    due = Q(status='pending') | Q(status='processing', claimed_at__lt=now - CLAIM_TIMEOUT)
+
+    with transaction.atomic():
+        ids = list(
+            WebhookEvent.objects.select_for_update(skip_locked=True)
+            .filter(due)
+            .order_by('received_at', 'pk')
+            .values_list('pk', flat=True)[:limit]
+        )
+        if not ids:
+            return []
+        WebhookEvent.objects.filter(pk__in=ids).update(
+            status='processing', claimed_at=now, attempts=F('attempts') + 1
+        )
+
+    return list(WebhookEvent.objects.filter(pk__in=ids).order_by('received_at', 'pk'))
+
+
+def notify_escrow_paid(escrow_id):
+    """Email buyer and seller that an escrow payment arrived"""
+    from escrow.models import EscrowTransaction
+    from .email_utils import send_escrow_payment_received_email
+
+    escrow = EscrowTransaction.objects.select_related('buyer', 'seller').filter(pk=escrow_id).first()
+    if escrow is not None:
+        send_escrow_payment_received_email(escrow)
+
+
+def notify_order_paid(order_id):
+    """Email the buyer that their order payment arrived"""
+    from .email_utils import send_payment_confirmation_email
+
+    order = Order.objects.select_related('buyer').filter(pk=order_id).first()
+    if order is not None and order.buyer.email:
+        send_payment_confirmation_email(order)
+
+
+# ----------------------------------------------------------------------
+# Event handlers: return 'processed' or 'ignored', raise to fail the event.
+# Payouts are appended to the batch's list and inserted together;
+# emails are sent with transaction.on_commit.
+# ----------------------------------------------------------------------
+
+def handle_charge_completed(event, payouts):
+    data = event.payload.get('data') or {}
+    tx_ref = data.get('tx_ref') or ''
+
+    if data.get('status') != 'successful':
+        return 'ignored'
+
+    if 'ESC-' in tx_ref:
+        # Escrow payment - import here to avoid circular imports
+        from escrow.models import EscrowTransaction
+
+        escrow_id = tx_ref.split('-')[-1]
+        updated = EscrowTransaction.objects.filter(id=escrow_id, status='pending_payment').update(
+            status='in_escrow',
+            payment_received_at=timezone.now(),
+            payment_reference=data.get('id'),
+        )
+        if updated:
+            transaction.on_commit(lambda: notify_escrow_paid(escrow_id))
+        return 'processed'
+
+    if 'ORDER-' in tx_ref:
+        order_id = tx_ref.split('-')[1]
+        # Raises InsufficientStock if unlock_stock released the order and it
+        # has sold out since: the event fails and is left for manual review
+        if mark_order_paid(order_id, payment_reference=data.get('id')):
+            seller_id, total_amount = Order.objects.filter(id=order_id).values_list(
+                'seller_id', 'total_amount'
+            ).get()
+            payouts.append(Payout(
+                seller_id=seller_id,
+                amount=total_amount,
+                reference=f'PAYOUT-ORDER-{order_id}',
+                description=f'Payment for Order #{order_id}'
+            ))
+            transaction.on_commit(lambda: notify_order_paid(order_id))
+        return 'processed'
+
+    return 'ignored'
+
+
+HANDLERS = {
+    'charge.completed': handle_charge_completed,
+}
+
+
+def apply_event(event, payouts):
+    handler = HANDLERS.get(event.event_type)
+    if handler is None:
+        return 'ignored'
+    return handler(event, payouts)
+
+
+def process_events(batch_size=100):
+    """
+    Claim and apply one batch of webhook events
+
+    The batch commits once; each event runs in its own savepoint so a
+    failing event is marked 'failed' without undoing the others.
+
+    Returns:
+        dict: {'processed', 'ignored', 'failed'} counts
+    """
+    results = {'processed': 0, 'ignored': 0, 'failed': 0}
+
+    events = claim_events(batch_size)
+    if not events:
+        return results
+
+    outcomes = {'processed': [], 'ignored': []}
+    failures = []
+    payouts = []
+
+    with transaction.atomic():
+        for event in events:
+            queued = len(payouts)
+            try:
+                with transaction.atomic():
+                    outcomes[apply_event(event, payouts)].append(event.pk)
+            except Exception as e:
+                del payouts[queued:]
+                logger.error(f"Webhook event {event.pk} ({event.event_type} {event.transaction_id}) failed: {e}")
+                failures.append((event, str(e)))
+
+        enqueue_payouts(payouts)
+
+        now = timezone.now()
+        for status, ids in outcomes.items():
+            if ids:
+                WebhookEvent.objects.filter(pk__in=ids).update(status=status, processed_at=now, last_error='')
+            results[status] = len(ids)
+
+        for event, error in failures:
+            WebhookEvent.objects.filter(pk=event.pk).update(status='failed', last_error=error)
+        results['failed'] = len(failures)
+
+    return results
+
+
+def replay_events(queryset):
+    """
+    Queue failed (or any selected) events to be applied again
+
+    Returns:
+        int: Number of events reset to pending
+    """
+    return queryset.exclude(status='processing').update(status='pending', claimed_at=None, last_error='')